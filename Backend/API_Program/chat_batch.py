@@ -0,0 +1,74 @@
+# chat_batch.py
+#
+# Command-line twin of POST /chat-batch: runs a JSONL file of
+# {"conversation_id", "message"} lines in-process, through the same chat and
+# persistence path as the API, and appends the results to --output as JSON
+# lines. --output is also the checkpoint: rerunning with the same file skips
+# the lines that already succeeded, so an interrupted run picks up where it
+# stopped.
+#
+# Usage:
+#   python Backend/API_Program/chat_batch.py prompts.jsonl --output results.jsonl --concurrency 16
+#   python Backend/API_Program/chat_batch.py prompts.jsonl --output results.jsonl --mode openai_batch
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, os.path.join(ROOT, "Chatbot", "Main"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import main as api  # noqa: E402
+from batch import parse_batch, assign_message_ids, Checkpoint, BATCH_CONCURRENCY  # noqa: E402
+
+
+async def run(args):
+    with open(args.input) as f:
+        try:
+            items = parse_batch(f)
+        except ValueError as e:
+            print(f"{args.input}: {e}", file=sys.stderr)
+            return 2
+    # The output file names the batch, so a rerun into it reuses the same message_ids
+    assign_message_ids(items, os.path.abspath(args.output))
+    checkpoint = Checkpoint(args.output)
+    pending = sum(1 for item in items if item.custom_id not in checkpoint.done)
+    print(f"{len(items)} lines, {len(items) - pending} already done, {pending} to run ({args.mode})", file=sys.stderr)
+
+    counts = {"ok": 0, "error": 0, "skipped": 0}
+    start = time.monotonic()
+    try:
+        # The app lifespan starts (and finally drains) the write-behind queue when it is enabled
+        async with api.lifespan(api.app):
+            async for result in api.chat_batch_results(items, args.mode, args.concurrency, checkpoint):
+                counts[result["status"]] += 1
+                if args.verbose:
+                    print(json.dumps(result), file=sys.stderr)
+                elif sum(counts.values()) % args.progress == 0:
+                    print(f"  {sum(counts.values())}/{pending} {counts}", file=sys.stderr)
+    finally:
+        checkpoint.close()
+
+    elapsed = time.monotonic() - start
+    print(f"done in {elapsed:.1f}s: {counts}; results in {args.output}", file=sys.stderr)
+    return 1 if counts["error"] or counts["skipped"] else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a JSONL file of chat messages through the chatbot")
+    parser.add_argument("input", help="JSONL with conversation_id, message and optional custom_id, user_id, message_id")
+    parser.add_argument("--output", required=True, help="Results JSONL; also the checkpoint for resuming")
+    parser.add_argument("--mode", choices=api.BATCH_MODES, default="live")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY, help="Conversations processed at once (live mode)")
+    parser.add_argument("--progress", type=int, default=100, help="Print progress every N results")
+    parser.add_argument("--verbose", action="store_true", help="Print every result to stderr")
+    args = parser.parse_args()
+    sys.exit(asyncio.run(run(args)))
+
+
+if __name__ == "__main__":
+    main()
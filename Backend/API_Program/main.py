@@ -1,47 +1,223 @@
-import mysql.connector
 import os
 import sys
-import random
-import string
 from datetime import datetime
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse, PlainTextResponse
 from dotenv import load_dotenv
 import json
+import time
+from contextlib import contextmanager, asynccontextmanager
 
 load_dotenv()
 
 sys.path.insert(1, "/Users/vaibhavarya187/Personal/Personal/VibeCoding/Chatbot/Main")
-from Chatbot import main as chatbot_main
+from Chatbot import main as chatbot_main, amain as chatbot_amain
+from Chatbot import get_chatbot, fetch_history, afetch_history, prepare_messages, COMPLETION_PARAMS
+from db_pool import get_pool
+from llm_client import client_stats
+from history_cache import history_cache
+from response_cache import get_response_cache
+from single_flight import completion_flight
+from rate_limiter import llm_governor, LLMOverloadedError
+from providers import get_router
+from metrics import registry, stage, record_stage, start_turn, current_turn, REQUESTS
+from tracing import span, start_span, in_span, ain_span, annotate
+from storage import get_store, ConversationConflictError, DuplicateMessageError
+from idempotency import idempotency_cache, StoredTurn
+from keyed_lock import conversation_locks, LockTimeoutError
+from ids import new_id
+from write_behind import write_behind, WRITE_BEHIND_ENABLED
+from batch import parse_batch, assign_message_ids, run_batch, run_openai_batch, Checkpoint, checkpoint_path, BATCH_CONCURRENCY, BATCH_MAX_ITEMS
 
 
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
-DB_NAME = os.getenv("DB_NAME")
-DB_SSL_CA = os.getenv("DB_SSL_CA")
+# Serve /chat-message and /get-conversation-history on the event loop (AsyncOpenAI + async MySQL)
+CHAT_ASYNC_MODE = os.getenv("CHAT_ASYNC_MODE", "false").lower() in ("1", "true", "yes")
 
-# Database Connection
-def db_connection():
-    db = mysql.connector.connect(
-        user=DB_USER,
-        password=DB_PASSWORD,
-        host=DB_HOST,
-        port=DB_PORT,
-        database=DB_NAME,
-        ssl_ca=DB_SSL_CA
-    )
-    return db
 
+# Start the write-behind worker with the app; on shutdown it drains the queue before exiting
+@asynccontextmanager
+async def lifespan(app):
+    if WRITE_BEHIND_ENABLED:
+        write_behind.start(save_chat_turns, on_drop=forget_unsaved_turn)
+    yield
+    if write_behind.running:
+        await run_in_threadpool(write_behind.stop)
 
-app = FastAPI()
 
+app = FastAPI(lifespan=lifespan)
+
+# Scrape-time gauges for the shared pools and the LLM governor
+registry.gauge("db_pool_open_connections", "Open connections in the DB pool", lambda: get_pool().stats()["open"])
+registry.gauge("db_pool_idle_connections", "Idle connections in the DB pool", lambda: get_pool().stats()["idle"])
+registry.gauge("llm_in_flight", "LLM calls in flight", lambda: llm_governor.stats()["in_flight"])
+registry.gauge("llm_waiting", "LLM calls waiting for capacity", lambda: llm_governor.stats()["waiting"])
+registry.gauge("write_behind_unflushed_turns", "Chat turns queued but not yet written", lambda: write_behind.stats()["unflushed"])
+registry.gauge("write_behind_dead_turns", "Dropped chat turns kept in the spool for the next start", lambda: write_behind.stats()["dead"])
+registry.gauge("conversation_locks_held", "Conversations with a turn in progress", lambda: conversation_locks.stats()["held"])
+registry.gauge("conversation_locks_waiting", "Turns waiting for an earlier turn of the same conversation",
+               lambda: conversation_locks.stats()["waiting"])
+
+
+# Write-through: keep the chatbot's history cache in sync with the committed turn
+def cache_chat_turn(conversation_id, user_id, message_count, user_message_id, user_message, assistant_message_id, assistant_message, elapsed_ms=0, created_at=None):
+    rows = [("user", user_message), ("assistant", assistant_message)]
+    history_cache.append(conversation_id, rows, new_conversation=message_count == 0)
+
+
+
+# Persist one chat turn in one transaction
+def save_chat_turn(*turn):
+    with stage("db_write"), span("db.transaction", {"chat.conv_id": turn[0]}):
+        get_store().append_turn(*turn)
+    cache_chat_turn(*turn)
+
+
+
+async def save_chat_turn_async(*turn):
+    with stage("db_write"), span("db.transaction", {"chat.conv_id": turn[0]}):
+        await get_store().aappend_turn(*turn)
+    cache_chat_turn(*turn)
+
+
+
+# Write-behind flush: persist a batch of queued turns in one transaction
+def save_chat_turns(turns):
+    with span("db.transaction", {"chat.turns": len(turns)}):
+        try:
+            get_store().append_turns(turns)
+        except ConversationConflictError:
+            # Cached copies may hold turns that will never be stored
+            for turn in turns:
+                history_cache.invalidate(turn[0])
+            raise
+
+
+# A queued turn the write-behind worker gave up on was cached when it was queued; re-read that history
+def forget_unsaved_turn(turn):
+    history_cache.invalidate(turn[0])
+
+
+
+# Hand the turn to the write-behind queue when it is running; write it directly otherwise
+# (queue disabled or full). Queued turns are cached right away and merged into history reads.
+def enqueue_chat_turn(*turn):
+    if not write_behind.running:
+        return False
+    with stage("db_enqueue"):
+        queued = write_behind.submit([*turn, datetime.now().isoformat()])
+    if queued:
+        cache_chat_turn(*turn)
+    return queued
+
+
+def persist_chat_turn(*turn):
+    if not enqueue_chat_turn(*turn):
+        save_chat_turn(*turn)
+
+
+async def persist_chat_turn_async(*turn):
+    if not enqueue_chat_turn(*turn):
+        await save_chat_turn_async(*turn)
+
+
+
+# Close out a turn's timing: total latency histogram, outcome counter and request span status
+def finish_turn(endpoint, status, timings, request_span):
+    record_stage("total", timings.elapsed_ms() / 1000)
+    REQUESTS.inc(endpoint=endpoint, status=status)
+    request_span.set_attribute("http.status_code", status)
+
+
+
+# Shed load with a 503 when the LLM governor's queue is full
+def overloaded_response(error):
+    return HTTPException(status_code=503, detail=str(error), headers={"Retry-After": str(max(1, round(error.retry_after)))})
+
+
+
+# Another turn of the conversation won the race (held the lock too long, or took the message_no in the DB)
+def conflict_response(error, conversation_id):
+    if isinstance(error, ConversationConflictError):
+        # Another process extended the conversation: drop our stale copy so the retry counts from the DB
+        history_cache.invalidate(conversation_id)
+    return HTTPException(status_code=409, detail=str(error))
+
+
+
+# Idempotent retries: a client message_id that already produced a turn gets that turn's reply back.
+# The same message_id from another user or with another text is a client bug, not a retry.
+def replay_turn(stored, user_id, message):
+    if not stored.matches(user_id, message):
+        raise HTTPException(status_code=409, detail="message_id was already used for a different message")
+    annotate({"chat.replayed": True})
+    return {"message": stored.reply, "conversation_id": stored.conversation_id}
+
+
+def cached_reply(user_id, message_id, message):
+    stored = idempotency_cache.get(message_id) if message_id else None
+    return None if stored is None else replay_turn(stored, user_id, message)
+
+
+def remember_turn(message_id, conversation_id, user_id, message, reply):
+    if message_id:
+        idempotency_cache.put(message_id, StoredTurn(conversation_id, user_id, message, reply))
+
+
+# The unique message_id index caught a retry the cache missed (expired, or served by another process)
+def replay_stored_turn(row, message_id, user_id, message):
+    if row is None:
+        raise HTTPException(status_code=409, detail=f"Message {message_id} is already stored")
+    stored = StoredTurn(*row)
+    idempotency_cache.put(message_id, stored)
+    return replay_turn(stored, user_id, message)
+
+
+
+# Turns of one conversation run one at a time (history read -> LLM -> persist). The history is read
+# once inside the lock and yielded: the turn builds its prompt from it and its first message_no is
+# len(history). New conversations start empty; their turn locks its message_id instead, so a retry
+# waits for its original. Async callers wait on the event loop, so queued turns do not tie up
+# threadpool workers.
+@contextmanager
+def conversation_turn(conversation_id, message_id=""):
+    if not conversation_id:
+        if not message_id:
+            yield []
+            return
+        with conversation_locks.hold(f"message:{message_id}"):
+            yield []
+        return
+    start = time.monotonic()
+    with conversation_locks.hold(conversation_id):
+        record_stage("conversation_lock_wait", time.monotonic() - start)
+        yield fetch_history(conversation_id)
+
+
+@asynccontextmanager
+async def aconversation_turn(conversation_id, message_id=""):
+    if not conversation_id:
+        if not message_id:
+            yield []
+            return
+        async with conversation_locks.ahold(f"message:{message_id}"):
+            yield []
+        return
+    start = time.monotonic()
+    async with conversation_locks.ahold(conversation_id):
+        record_stage("conversation_lock_wait", time.monotonic() - start)
+        yield await afetch_history(conversation_id) if CHAT_ASYNC_MODE else await run_in_threadpool(fetch_history, conversation_id)
+
+
+
+# Check the ChatResult returned by the chatbot core
+def check_chatbot_result(result):
+    if result is None:
+        raise HTTPException(status_code=500, detail="Empty response from chatbot_main")
+
+    if not result.ok:
+        raise HTTPException(status_code=500, detail=result.error)
 
-# Generate random varchar(16) ID
-def generate_random_id():
-    chars = string.ascii_lowercase + string.digits
-    parts = [8, 4]
-    result = '-'.join(''.join(random.choices(chars, k=p)) for p in parts)
     return result
 
 
@@ -60,135 +236,535 @@ def health():
 
 
 
-# Chat Message API
-@app.post("/chat-message")
-def chat_message(message: str, user_id: int, message_id: str, message_count: int, conversation_id: str = ""):
-    try:
-        # print(f"Received: message={message}, user_id={user_id}, message_count={message_count}")
+# Database Pool Stats API
+@app.get("/db-pool-stats")
+def db_pool_stats():
+    return get_pool().stats()
 
 
-        # Reset message count for new conversations
-        print("Okay 1")
-        if message_count == 1:
-            message_count = 0
 
-        print("message: ", message)
-        print("conversation_id: ", conversation_id)
+# Conversation Storage Stats API
+@app.get("/storage-stats")
+def storage_stats():
+    return get_store().stats()
 
-        # Get chatbot response
-        print("Okay 1.1")
-        response = chatbot_main(message, conversation_id)
 
-        print("Response: ", response)
 
+# History Cache Stats API
+@app.get("/history-cache-stats")
+def history_cache_stats():
+    return history_cache.stats()
+
+
+
+# Response Cache Stats API
+@app.get("/response-cache-stats")
+def response_cache_stats():
+    return get_response_cache().stats()
 
-        if not response:
-            raise HTTPException(status_code=500, detail="Empty response from chatbot_main")
 
-        try:
-            responseFormatted = json.loads(response)
-        except json.JSONDecodeError:
-            raise HTTPException(status_code=500, detail="Invalid JSON returned by chatbot_main")
 
+# Prometheus Metrics API
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
 
-        print("Type of response: ", type(response))
-        print("Okay 1.2")
 
-        responseFormatted = json.loads(response)
-        conversation_id = responseFormatted.get("conversation_id")
-        print("Okay 1.3")
+
+# Write-Behind Queue Stats API
+@app.get("/write-behind-stats")
+def write_behind_stats():
+    return write_behind.stats()
+
+
+
+# Idempotency Cache Stats API
+@app.get("/idempotency-cache-stats")
+def idempotency_cache_stats():
+    return idempotency_cache.stats()
+
+
+
+# LLM Client Stats API
+@app.get("/llm-client-stats")
+def llm_client_stats():
+    return {**client_stats(), "coalescing": completion_flight.stats(), "governor": llm_governor.stats(), "routing": get_router().stats()}
+
+
+
+# One turn: a retried message_id is answered from the idempotency cache, before and again once the
+# conversation lock is held (a retry that queued behind its original finds the original's reply)
+async def run_chat_turn(message, user_id, message_id, conversation_id):
+    replay = cached_reply(user_id, message_id, message)
+    if replay is not None:
+        return replay
+    # The server assigns message_no under the conversation lock; the client's message_count is advisory
+    async with aconversation_turn(conversation_id, message_id) as history:
+        replay = cached_reply(user_id, message_id, message)
+        if replay is not None:
+            return replay
+        if CHAT_ASYNC_MODE:
+            return await chat_message_async(message, user_id, message_id, len(history), conversation_id, history)
+        return await run_in_threadpool(chat_message_sync, message, user_id, message_id, len(history), conversation_id, history)
+
+
+# Chat Message API
+@app.post("/chat-message")
+async def chat_message(message: str, user_id: int, message_id: str, message_count: int, conversation_id: str = ""):
+    # Stage timings are collected on this turn (the threadpool worker shares the request context)
+    timings = start_turn()
+    status = 500
+    with span("chat.request", {"http.route": "/chat-message", "chat.user_id": user_id, "chat.conv_id": conversation_id or None,
+                               "chat.message_count": message_count, "chat.async": CHAT_ASYNC_MODE}) as request_span:
+        try:
+            response = await run_chat_turn(message, user_id, message_id, conversation_id)
+            status = 200
+            request_span.set_attribute("chat.conv_id", response["conversation_id"])
+            return response
+        except LockTimeoutError as e:
+            status = 409
+            raise conflict_response(e, conversation_id)
+        except HTTPException as e:
+            status = e.status_code
+            raise
+        finally:
+            finish_turn("chat-message", status, timings, request_span)
+
+
+def chat_message_sync(message: str, user_id: int, message_id: str, message_count: int, conversation_id: str = "", history=None):
+    try:
+        # Get chatbot response
+        result = check_chatbot_result(chatbot_main(message, conversation_id, history))
+
+        conversation_id = result.conversation_id
         # Generate unique message IDs for user and assistant messages
-        user_message_id = generate_random_id() if message_id == "" else message_id
-        assistant_message_id = generate_random_id()
-        print("Okay 1.5")
-        # Connect to database
-        db = db_connection()
-        cursor = db.cursor()
-        print("Okay 2")
-
-        # Insert the user message into message_store table
-        user_query = """INSERT INTO message_store 
-                       (role, conv_id, message_no, message_id, message, elapsed_time, Status, created_at, updated_at) 
-                       VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)"""
-        cursor.execute(user_query, ("user", conversation_id, message_count, user_message_id, message, 0, "Success", datetime.now(), datetime.now()))
-        db.commit()  # COMMIT THE USER MESSAGE
-        db.close()
-        print("Okay 3")
-        db = db_connection()
-        cursor = db.cursor()
-        print("Okay 4")
-        assistant_message = responseFormatted.get("message")
-        # Insert the assistant message into message_store table
-        assistant_query = """INSERT INTO message_store 
-                            (role, conv_id, message_no, message_id, message, elapsed_time, Status, created_at, updated_at) 
-                            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s)"""
-        cursor.execute(assistant_query, ("assistant", conversation_id, message_count + 1, assistant_message_id, assistant_message, 0, "Success", datetime.now(), datetime.now()))
-        db.commit()  # COMMIT THE ASSISTANT MESSAGE
-        db.close()  # CLOSE THE CONNECTION
-        print("Okay 5")
-        # Create conversation record only for new conversations (message_count == 0)
-        # Note: ID field is auto_increment, so we don't include it
-        if message_count == 0:
-            db = db_connection()
-            cursor = db.cursor()
-            conversation_query = """INSERT INTO conversation_store 
-                                   (chat_name, conv_id, user_id, message_count, created_at, updated_at) 
-                                   VALUES (%s, %s, %s, %s, %s, %s)"""
-            cursor.execute(conversation_query, ("NEW CHAT", conversation_id, user_id, 2, datetime.now(), datetime.now()))  # 2 messages: user + assistant
-            db.commit()  # COMMIT THE CONVERSATION
-            db.close()
-        print("Okay 6")
+        user_message_id = new_id() if message_id == "" else message_id
+        assistant_message_id = new_id()
+        assistant_message = result.message
+
+        # Persist the whole turn in a single transaction (or queue it for write-behind)
+        persist_chat_turn(conversation_id, user_id, message_count, user_message_id, message, assistant_message_id, assistant_message,
+                          current_turn().elapsed_ms())
+        remember_turn(message_id, conversation_id, user_id, message, assistant_message)
         return {"message": assistant_message, "conversation_id": conversation_id}
-        
+
+    except HTTPException:
+        raise
+    except LLMOverloadedError as e:
+        raise overloaded_response(e)
+    except DuplicateMessageError:
+        return replay_stored_turn(get_store().get_turn(message_id), message_id, user_id, message)
+    except ConversationConflictError as e:
+        raise conflict_response(e, conversation_id)
     except Exception as e:
-        # print("Here 1")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+async def chat_message_async(message: str, user_id: int, message_id: str, message_count: int, conversation_id: str = "", history=None):
+    try:
+        result = check_chatbot_result(await chatbot_amain(message, conversation_id, history))
+
+        conversation_id = result.conversation_id
+        user_message_id = new_id() if message_id == "" else message_id
+        assistant_message_id = new_id()
+        assistant_message = result.message
+
+        await persist_chat_turn_async(conversation_id, user_id, message_count, user_message_id, message, assistant_message_id, assistant_message,
+                                      current_turn().elapsed_ms())
+        remember_turn(message_id, conversation_id, user_id, message, assistant_message)
+        return {"message": assistant_message, "conversation_id": conversation_id}
+
+    except HTTPException:
+        raise
+    except LLMOverloadedError as e:
+        raise overloaded_response(e)
+    except DuplicateMessageError:
+        return replay_stored_turn(await get_store().aget_turn(message_id), message_id, user_id, message)
+    except ConversationConflictError as e:
+        raise conflict_response(e, conversation_id)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+
+
+# Server-Sent Event formatting
+def sse_event(data, event=None):
+    prefix = f"event: {event}\n" if event else ""
+    return f"{prefix}data: {json.dumps(data)}\n\n"
+
+
+# A replayed turn streams like a new one: meta, the stored reply as a single token, done
+def replay_events(replay):
+    yield sse_event({"conversation_id": replay["conversation_id"]}, event="meta")
+    yield sse_event({"token": replay["message"]})
+    yield sse_event(replay, event="done")
+
+
+# The token stream is started inside the conversation lock, from the history read there. Once the
+# lock is held the idempotency cache is checked again: a retry that queued behind its original
+# replays it instead of starting a second completion.
+def stream_chat_events(timings, request_span, conversation_id, user_id, new_conversation, message_id, message):
+    status = 500
+    try:
+        with conversation_turn(None if new_conversation else conversation_id, message_id) as history:
+            replay = cached_reply(user_id, message_id, message)
+            if replay is not None:
+                yield from replay_events(replay)
+                status = 200
+                return
+            message_count = len(history)
+            tokens = get_chatbot().stream_response(message, None if new_conversation else conversation_id, history)
+            yield sse_event({"conversation_id": conversation_id}, event="meta")
+            parts = []
+            for token in tokens:
+                parts.append(token)
+                yield sse_event({"token": token})
+            assistant_message = "".join(parts)
+
+            # Persist the turn once the stream has finished
+            persist_chat_turn(conversation_id, user_id, message_count, message_id or new_id(), message, new_id(), assistant_message,
+                              timings.elapsed_ms())
+            remember_turn(message_id, conversation_id, user_id, message, assistant_message)
+        status = 200
+        yield sse_event({"conversation_id": conversation_id, "message": assistant_message}, event="done")
+    except (ConversationConflictError, LockTimeoutError) as e:
+        status = conflict_response(e, conversation_id).status_code
+        yield sse_event({"error": str(e)}, event="error")
+    except HTTPException as e:
+        status = e.status_code
+        yield sse_event({"error": e.detail}, event="error")
+    except Exception as e:
+        yield sse_event({"error": str(e)}, event="error")
+    finally:
+        finish_turn("chat-message-stream", status, timings, request_span)
+        request_span.end()
+
+
+async def stream_chat_events_async(timings, request_span, conversation_id, user_id, new_conversation, message_id, message):
+    status = 500
+    try:
+        async with aconversation_turn(None if new_conversation else conversation_id, message_id) as history:
+            replay = cached_reply(user_id, message_id, message)
+            if replay is not None:
+                for event in replay_events(replay):
+                    yield event
+                status = 200
+                return
+            message_count = len(history)
+            tokens = get_chatbot().astream_response(message, None if new_conversation else conversation_id, history)
+            yield sse_event({"conversation_id": conversation_id}, event="meta")
+            parts = []
+            async for token in tokens:
+                parts.append(token)
+                yield sse_event({"token": token})
+            assistant_message = "".join(parts)
+
+            await persist_chat_turn_async(conversation_id, user_id, message_count, message_id or new_id(), message, new_id(), assistant_message,
+                                          timings.elapsed_ms())
+            remember_turn(message_id, conversation_id, user_id, message, assistant_message)
+        status = 200
+        yield sse_event({"conversation_id": conversation_id, "message": assistant_message}, event="done")
+    except (ConversationConflictError, LockTimeoutError) as e:
+        status = conflict_response(e, conversation_id).status_code
+        yield sse_event({"error": str(e)}, event="error")
+    except HTTPException as e:
+        status = e.status_code
+        yield sse_event({"error": e.detail}, event="error")
+    except Exception as e:
+        yield sse_event({"error": str(e)}, event="error")
+    finally:
+        finish_turn("chat-message-stream", status, timings, request_span)
+        request_span.end()
+
+
+# Streaming Chat Message API (SSE)
+@app.post("/chat-message/stream")
+async def chat_message_stream(message: str, user_id: int, message_id: str, message_count: int, conversation_id: str = ""):
+    if not message or not message.strip():
+        raise HTTPException(status_code=400, detail="No message provided")
+    replay = cached_reply(user_id, message_id, message)
+    if replay is not None:
+        REQUESTS.inc(endpoint="chat-message-stream", status=200)
+        return StreamingResponse(replay_events(replay), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+    if llm_governor.saturated():
+        raise overloaded_response(LLMOverloadedError("LLM request queue is full"))
+
+    new_conversation = not conversation_id
+    conversation_id = conversation_id or new_id()
+    timings = start_turn()
+    # Parent of the spans made while the response streams; ended when the stream finishes
+    request_span = start_span("chat.request", {"http.route": "/chat-message/stream", "chat.user_id": user_id, "chat.conv_id": conversation_id,
+                                               "chat.message_count": message_count, "chat.async": CHAT_ASYNC_MODE})
+    if CHAT_ASYNC_MODE:
+        events = ain_span(request_span, stream_chat_events_async(timings, request_span, conversation_id, user_id,
+                                                                 new_conversation, message_id, message))
+    else:
+        events = in_span(request_span, stream_chat_events(timings, request_span, conversation_id, user_id,
+                                                          new_conversation, message_id, message))
+
+    return StreamingResponse(events, media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
 
 
 # Get Conversation History API
+# Keyset pagination: rows with ID > after_id, oldest first
+HISTORY_PAGE_LIMIT = 100
+HISTORY_MAX_PAGE_LIMIT = 1000
+HISTORY_STREAM_CHUNK = 500
+
+
+def format_history_message(message):
+    return {
+        "id": message[0],
+        "role": message[1],
+        "message": message[3]
+    }
+
+
+# Messages of turns still in the write-behind queue (no ID yet), minus any flushed since the snapshot
+def pending_history_messages(pending, flushed_ids):
+    return [{"id": None, "role": role, "message": message, "pending": True}
+            for message_id, role, message in pending if message_id not in flushed_ids]
+
+
+def format_conversation_history(conversation_id, messages, limit, pending=()):
+    # Convert to structured format
+    conversation_history = [format_history_message(message) for message in messages]
+    next_after_id = conversation_history[-1]["id"] if len(conversation_history) == limit else None
+
+    # Last page: append unflushed turns so writes are readable before the queue flushes them
+    if next_after_id is None and pending:
+        conversation_history.extend(pending_history_messages(pending, {message[4] for message in messages}))
+    
+    return {
+        "conversation_id": conversation_id,
+        "message_count": len(conversation_history),
+        "messages": conversation_history,
+        "next_after_id": next_after_id
+    }
+
+
+def fetch_history_page(conversation_id, after_id, limit):
+    return get_store().get_history_page(conversation_id, after_id, limit)
+
+
+async def fetch_history_page_async(conversation_id, after_id, limit):
+    return await get_store().aget_history_page(conversation_id, after_id, limit)
+
+
 @app.get("/get-conversation-history/{conversation_id}")
-def get_conversation_history(conversation_id: str):
-    """Get conversation history for a specific conversation ID."""
+async def get_conversation_history(conversation_id: str, after_id: int = 0, limit: int = HISTORY_PAGE_LIMIT):
+    """Get one page of conversation history; pass next_after_id back as after_id for the next page."""
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_LIMIT))
+    if CHAT_ASYNC_MODE:
+        return await get_conversation_history_async(conversation_id, after_id, limit)
+    return await run_in_threadpool(get_conversation_history_sync, conversation_id, after_id, limit)
+
+
+def get_conversation_history_sync(conversation_id: str, after_id: int, limit: int):
     try:
-        db = db_connection()
-        cursor = db.cursor()
-        
-        # Get messages ordered by message_no
-        query = """
-        SELECT 
-            ID, role, message_no,
-            message
-        FROM message_store
-        WHERE conv_id = %s
-        ORDER BY ID ASC;
-        """
-        cursor.execute(query, (conversation_id,))
-        messages = cursor.fetchall()
-
-        db.close()
-
-        # return {
-        #     "messages": messages
-        # }
+        # Snapshot the queue before reading, so a turn flushed in between shows up at least once
+        pending = write_behind.pending_messages(conversation_id)
+        messages = fetch_history_page(conversation_id, after_id, limit)
+        return format_conversation_history(conversation_id, messages, limit, pending)
         
-        # Convert to structured format
-        conversation_history = []
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def get_conversation_history_async(conversation_id: str, after_id: int, limit: int):
+    try:
+        pending = write_behind.pending_messages(conversation_id)
+        messages = await fetch_history_page_async(conversation_id, after_id, limit)
+        return format_conversation_history(conversation_id, messages, limit, pending)
+
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+# Stream the whole history as NDJSON, one keyset chunk at a time (flat memory)
+def stream_history_ndjson(conversation_id, after_id):
+    pending = write_behind.pending_messages(conversation_id)
+    pending_ids, flushed_ids = {row[0] for row in pending}, set()
+    while True:
+        messages = fetch_history_page(conversation_id, after_id, HISTORY_STREAM_CHUNK)
         for message in messages:
-            conversation_history.append({
-                "role": message[1],
-                "message": message[3]   
-            })
-        
-        return {
-            "conversation_id": conversation_id,
-            "message_count": len(conversation_history),
-            "messages": conversation_history
-        }
-        
+            yield json.dumps(format_history_message(message)) + "\n"
+        flushed_ids.update(message[4] for message in messages if message[4] in pending_ids)
+        if len(messages) < HISTORY_STREAM_CHUNK:
+            break
+        after_id = messages[-1][0]
+    for message in pending_history_messages(pending, flushed_ids):
+        yield json.dumps(message) + "\n"
+
+
+async def stream_history_ndjson_async(conversation_id, after_id):
+    pending = write_behind.pending_messages(conversation_id)
+    pending_ids, flushed_ids = {row[0] for row in pending}, set()
+    while True:
+        messages = await fetch_history_page_async(conversation_id, after_id, HISTORY_STREAM_CHUNK)
+        for message in messages:
+            yield json.dumps(format_history_message(message)) + "\n"
+        flushed_ids.update(message[4] for message in messages if message[4] in pending_ids)
+        if len(messages) < HISTORY_STREAM_CHUNK:
+            break
+        after_id = messages[-1][0]
+    for message in pending_history_messages(pending, flushed_ids):
+        yield json.dumps(message) + "\n"
+
+
+@app.get("/get-conversation-history/{conversation_id}/stream")
+async def get_conversation_history_stream(conversation_id: str, after_id: int = 0):
+    """Stream the full conversation history as newline-delimited JSON."""
+    if CHAT_ASYNC_MODE:
+        lines = stream_history_ndjson_async(conversation_id, after_id)
+    else:
+        lines = stream_history_ndjson(conversation_id, after_id)
+    return StreamingResponse(lines, media_type="application/x-ndjson")
+
+
+
+# List Conversations API
+# Keyset pagination on (updated_at, ID), most recently active first; the cursor is "<updated_at ISO>,<ID>"
+CONVERSATION_PAGE_LIMIT = 20
+CONVERSATION_MAX_PAGE_LIMIT = 100
+
+
+def as_datetime(value):
+    return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+
+
+def parse_conversation_cursor(before):
+    try:
+        updated_at, row_id = before.rsplit(",", 1)
+        return as_datetime(updated_at), int(row_id)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="before must be a next_before value from a previous page") from None
+
+
+def format_conversation_list(user_id, rows, limit):
+    conversations = [{
+        "conversation_id": row[1],
+        "chat_name": row[2],
+        "message_count": row[3],
+        "created_at": row[4] and as_datetime(row[4]).isoformat(),
+        "updated_at": row[5] and as_datetime(row[5]).isoformat(),
+    } for row in rows]
+    next_before = f"{conversations[-1]['updated_at']},{rows[-1][0]}" if len(rows) == limit else None
+    return {"user_id": user_id, "conversations": conversations, "next_before": next_before}
+
+
+@app.get("/users/{user_id}/conversations")
+async def list_user_conversations(user_id: int, before: str = "", limit: int = CONVERSATION_PAGE_LIMIT):
+    """List a user's conversations, most recently active first; pass next_before back as before for the next page."""
+    limit = max(1, min(limit, CONVERSATION_MAX_PAGE_LIMIT))
+    cursor = parse_conversation_cursor(before) if before else None
+    try:
+        if CHAT_ASYNC_MODE:
+            rows = await get_store().alist_conversations(user_id, limit, cursor)
+        else:
+            rows = await run_in_threadpool(get_store().list_conversations, user_id, limit, cursor)
+        return format_conversation_list(user_id, rows, limit)
+
     except Exception as e:
-        # print("Here 2")
         raise HTTPException(status_code=500, detail=str(e))
 
 
+
+# Chat Batch API
+BATCH_MODES = ("live", "openai_batch")
+_running_batches = set()
+
+
+# Messages already stored for an existing conversation (next turn's message_no)
+def batch_message_count(conversation_id):
+    return len(fetch_history(conversation_id))
+
+
+# Live mode: one turn through the same path as /chat-message
+async def batch_chat_turn(item, conversation_id, message_count):
+    timings = start_turn()
+    status = 500
+    with span("chat.request", {"http.route": "/chat-batch", "chat.user_id": item.user_id, "chat.conv_id": conversation_id or None,
+                               "chat.message_count": message_count, "chat.async": CHAT_ASYNC_MODE}) as request_span:
+        try:
+            response = await run_chat_turn(item.message, item.user_id, item.message_id, conversation_id)
+            status = 200
+            return response["conversation_id"], response["message"]
+        except LockTimeoutError as e:
+            status = 409
+            raise RuntimeError(str(e)) from None
+        except HTTPException as e:
+            status = e.status_code
+            raise RuntimeError(e.detail) from None
+        finally:
+            finish_turn("chat-batch", status, timings, request_span)
+
+
+# OpenAI Batch API mode: build the prompt now, persist the turn once the batch returns its reply
+def batch_prepare(item, conversation_id):
+    history_rows, messages = prepare_messages(item.message, conversation_id)
+    return messages, (history_rows, messages)
+
+
+def batch_finish(item, conversation_id, message_count, context, reply, model):
+    history_rows, messages = context
+    with conversation_turn(conversation_id) as history:
+        message_no = len(history)
+        conversation_id = conversation_id or new_id()
+        get_chatbot().record_reply(conversation_id, history_rows, messages, item.message, reply, model)
+        try:
+            persist_chat_turn(conversation_id, item.user_id, message_no, item.message_id or new_id(), item.message, new_id(), reply)
+        except DuplicateMessageError:
+            # Stored by an earlier run that stopped before its checkpoint: keep that turn
+            conversation_id = replay_stored_turn(get_store().get_turn(item.message_id), item.message_id, item.user_id, item.message)["conversation_id"]
+    REQUESTS.inc(endpoint="chat-batch", status=200)
+    return conversation_id
+
+
+# Async iterator of result records for a parsed batch (shared by /chat-batch and chat_batch.py)
+def chat_batch_results(items, mode="live", concurrency=BATCH_CONCURRENCY, checkpoint=None):
+    if mode == "openai_batch":
+        backend = get_router().pick()
+        return run_openai_batch(items, batch_prepare, lambda *args: batch_finish(*args, backend.model), batch_message_count,
+                                backend.client, backend.model, COMPLETION_PARAMS, checkpoint)
+    return run_batch(items, batch_chat_turn, batch_message_count, checkpoint, concurrency)
+
+
+@app.post("/chat-batch")
+async def chat_batch(request: Request, mode: str = "live", concurrency: int = BATCH_CONCURRENCY, batch_id: str = ""):
+    """Run a JSONL body of {"conversation_id", "message"} lines and stream the results back as NDJSON.
+
+    Turns of one conversation run in order; conversations run `concurrency` at a time.
+    With a batch_id, results are checkpointed on the server and a repeated request
+    with the same batch_id resumes, skipping lines that already succeeded.
+    """
+    if mode not in BATCH_MODES:
+        raise HTTPException(status_code=400, detail=f"mode must be one of {', '.join(BATCH_MODES)}")
+    try:
+        items = parse_batch((await request.body()).splitlines())
+        path = checkpoint_path(batch_id) if batch_id else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ITEMS} lines per batch")
+    if batch_id in _running_batches:
+        raise HTTPException(status_code=409, detail=f"Batch {batch_id} is already running")
+
+    checkpoint = Checkpoint(path) if path else None
+    if batch_id:
+        assign_message_ids(items, batch_id)
+        _running_batches.add(batch_id)
+
+    async def lines():
+        try:
+            async for result in chat_batch_results(items, mode, max(1, concurrency), checkpoint):
+                yield json.dumps(result) + "\n"
+        finally:
+            if checkpoint is not None:
+                checkpoint.close()
+            _running_batches.discard(batch_id)
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson", headers={"X-Batch-Items": str(len(items))})
@@ -0,0 +1,98 @@
+# async_vs_sync.py
+#
+# Compares /chat-message throughput in sync mode (threadpool) and async mode
+# (event loop) against a stubbed LLM and a stubbed database.
+#
+# Usage:
+#   python Backend/Benchmark/async_vs_sync.py --requests 400 --concurrency 200 --llm-latency 0.5
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, os.path.join(ROOT, "Chatbot", "Main"))
+sys.path.insert(0, os.path.join(ROOT, "Backend", "API_Program"))
+
+import main as api  # noqa: E402
+from Chatbot import ChatResult  # noqa: E402
+
+
+def install_stubs(llm_latency, db_latency):
+    def chatbot_main(query, conversation_id, history_rows=None):
+        time.sleep(llm_latency)
+        return ChatResult.success(f"echo: {query}", conversation_id or "bench-conv")
+
+    async def chatbot_amain(query, conversation_id, history_rows=None):
+        await asyncio.sleep(llm_latency)
+        return ChatResult.success(f"echo: {query}", conversation_id or "bench-conv")
+
+    def save_chat_turn(*turn):
+        time.sleep(db_latency)
+
+    async def save_chat_turn_async(*turn):
+        await asyncio.sleep(db_latency)
+
+    api.chatbot_main = chatbot_main
+    api.chatbot_amain = chatbot_amain
+    api.save_chat_turn = save_chat_turn
+    api.save_chat_turn_async = save_chat_turn_async
+
+
+async def run_load(async_mode, total, concurrency):
+    api.CHAT_ASYNC_MODE = async_mode
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+
+        async def one(i):
+            async with semaphore:
+                start = time.perf_counter()
+                resp = await client.post("/chat-message", params={
+                    "message": f"hello {i}",
+                    "user_id": 1,
+                    "message_id": "",
+                    "message_count": 1,
+                    "conversation_id": "",
+                })
+                resp.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(total)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "mode": "async" if async_mode else "sync",
+        "requests": total,
+        "concurrency": concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(total / elapsed, 1),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sync vs async /chat-message throughput")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--llm-latency", type=float, default=0.5, help="Stubbed LLM latency in seconds")
+    parser.add_argument("--db-latency", type=float, default=0.005, help="Stubbed DB write latency in seconds")
+    args = parser.parse_args()
+
+    install_stubs(args.llm_latency, args.db_latency)
+    for async_mode in (False, True):
+        print(json.dumps(asyncio.run(run_load(async_mode, args.requests, args.concurrency))))
+
+
+if __name__ == "__main__":
+    main()
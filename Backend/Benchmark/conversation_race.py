@@ -0,0 +1,173 @@
+# conversation_race.py
+#
+# Concurrency stress test for per-conversation turn ordering. Serves the real
+# app (as load_test.py does: mock LLM, in-memory MySQL stand-in), opens
+# --conversations conversations with one turn each, then fires the remaining
+# --turns messages of every conversation all at once.
+#
+# Afterwards every conversation must hold consecutive message_no values
+# (0, 1, 2, ...), alternate user/assistant, and pair each reply with its own
+# message. Every reply must also have seen all earlier turns: the mock LLM
+# echoes how many earlier user turns the prompt carried. Wall time is compared
+# with the LLM time of one conversation, to show different conversations
+# still run in parallel.
+#
+# --unlocked turns the in-process conversation lock off, which is what two API
+# processes racing on one conversation look like. Racing turns must then be
+# rejected with HTTP 409 by the unique (conv_id, message_no) index instead of
+# corrupting the conversation; lost context is reported but expected.
+#
+# Usage:
+#   python Backend/Benchmark/conversation_race.py --conversations 20 --turns 6
+#   python Backend/Benchmark/conversation_race.py --mode async --storage sqlite
+#   python Backend/Benchmark/conversation_race.py --unlocked
+
+import argparse
+import asyncio
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager, asynccontextmanager
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, os.path.join(ROOT, "Chatbot", "Main"))
+sys.path.insert(0, os.path.join(ROOT, "Backend", "API_Program"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_openai_server import start_mock_server  # noqa: E402
+from fake_mysql import FakeMySQL  # noqa: E402
+from load_test import configure_environment, start_app  # noqa: E402
+
+CONTEXT = re.compile(r"context=(\d+)$")
+
+
+class NoLock:
+    """Stand-in for the conversation lock: every turn proceeds at once (like separate processes)."""
+
+    @contextmanager
+    def hold(self, key, timeout=None):
+        yield
+
+    @asynccontextmanager
+    async def ahold(self, key, timeout=None):
+        yield
+
+    def stats(self):
+        return {"held": 0, "waiting": 0, "acquired": 0, "contended": 0, "timeouts": 0}
+
+
+async def race(base_url, args, tag):
+    statuses = {}
+    limits = httpx.Limits(max_connections=args.conversations * args.turns)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+
+        async def send(conversation_id, message, message_count):
+            resp = await client.post("/chat-message", params={"message": message, "user_id": 1, "message_id": "",
+                                                              "message_count": message_count, "conversation_id": conversation_id})
+            statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+            return resp.json().get("conversation_id") if resp.status_code == 200 else None
+
+        conversations = await asyncio.gather(*(send("", f"{tag} c{c} opening", 1) for c in range(args.conversations)))
+        start = time.perf_counter()
+        # Every remaining turn of every conversation at once; all clients claim the same message_count
+        await asyncio.gather(*(send(conversation_id, f"{tag} c{c} turn {t}", 3)
+                               for t in range(1, args.turns) for c, conversation_id in enumerate(conversations)))
+        elapsed = time.perf_counter() - start
+    return [c for c in conversations if c], statuses, elapsed
+
+
+# Check one conversation; returns (integrity problems, turns that missed earlier context)
+def check_conversation(store, conversation_id):
+    rows = store.get_history_page(conversation_id, 0, 10000)
+    problems, lost_context = [], 0
+    if [row[2] for row in rows] != list(range(len(rows))):
+        problems.append(f"message_no not consecutive: {[row[2] for row in rows]}")
+    for turn, position in enumerate(range(0, len(rows) - 1, 2)):
+        user, assistant = rows[position], rows[position + 1]
+        if (user[1], assistant[1]) != ("user", "assistant"):
+            problems.append(f"roles out of order at message_no {position}")
+            continue
+        if not assistant[3].startswith(f"[mock] {user[3]} "):
+            problems.append(f"reply at message_no {position + 1} answers a different message")
+        match = CONTEXT.search(assistant[3])
+        if match is None or int(match.group(1)) != turn:
+            lost_context += 1
+    if len(rows) % 2:
+        problems.append("dangling message without its pair")
+    return problems, lost_context, len(rows) // 2
+
+
+def run(api, store, args, async_mode):
+    api.CHAT_ASYNC_MODE = async_mode
+    conversations, statuses, elapsed = asyncio.run(race(f"http://127.0.0.1:{args.port}", args, f"run{int(async_mode)}"))
+
+    problems, lost_context, stored_turns = [], 0, 0
+    for conversation_id in conversations:
+        conversation_problems, conversation_lost, turns = check_conversation(store, conversation_id)
+        problems.extend(f"{conversation_id}: {problem}" for problem in conversation_problems)
+        lost_context += conversation_lost
+        stored_turns += turns
+
+    accepted = statuses.get(200, 0)
+    serial_bound = (args.turns - 1) * args.llm_latency
+    print(f"\n== {'async' if async_mode else 'sync'} mode, lock {'off' if args.unlocked else 'on'} ==")
+    print(f"responses {dict(sorted(statuses.items()))}, stored turns {stored_turns} (accepted {accepted})")
+    print(f"racing turns finished in {elapsed:.2f}s; one conversation's LLM time is {serial_bound:.2f}s, "
+          f"all conversations in series would be {serial_bound * len(conversations):.2f}s")
+    print(f"integrity problems {len(problems)}, replies that missed earlier turns {lost_context}")
+    for problem in problems[:10]:
+        print(f"  {problem}")
+
+    failed = bool(problems) or stored_turns != accepted
+    if not args.unlocked:
+        failed = failed or lost_context > 0 or accepted != args.conversations * args.turns
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent turns on the same conversations: ordering and integrity")
+    parser.add_argument("--conversations", type=int, default=20)
+    parser.add_argument("--turns", type=int, default=6, help="Turns per conversation (keep below SUMMARY_EVERY_TURNS)")
+    parser.add_argument("--mode", choices=["sync", "async", "both"], default="both")
+    parser.add_argument("--storage", choices=["mysql", "sqlite", "memory"], default="mysql",
+                        help="Storage engine (mysql = the in-memory MySQL stand-in)")
+    parser.add_argument("--llm-latency", type=float, default=0.1, help="Mock LLM latency (s)")
+    parser.add_argument("--db-latency", type=float, default=0.001, help="Fake DB latency per round trip (s)")
+    parser.add_argument("--unlocked", action="store_true", help="Disable the in-process conversation lock")
+    parser.add_argument("--port", type=int, default=8766)
+    args = parser.parse_args()
+
+    mock = start_mock_server("mock", args.llm_latency, echo_context=True)
+    workdir = tempfile.mkdtemp(prefix="conversation_race-")
+    configure_environment(mock.base_url, 20, False, args.storage, workdir)
+    os.environ["RESPONSE_CACHE_ENABLED"] = "false"
+
+    import db_pool
+    import main as api
+    from storage import get_store
+
+    db_pool._pool = db_pool.ConnectionPool(FakeMySQL(latency=args.db_latency).connect, size=20)
+    if args.unlocked:
+        api.conversation_locks = NoLock()
+
+    server, thread = start_app(api, args.port)
+    failed = False
+    try:
+        for async_mode in {"sync": [False], "async": [True], "both": [False, True]}[args.mode]:
+            failed = run(api, get_store(), args, async_mode) or failed
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+        mock.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
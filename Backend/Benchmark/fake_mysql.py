@@ -0,0 +1,165 @@
+# fake_mysql.py
+#
+# In-memory stand-in for MySQL used by the load tests. It speaks the small
+# slice of the mysql.connector API the app uses (cursor/execute/fetchall,
+# commit/rollback, ping, in_transaction) on top of one SQLite database, with
+# an optional per-round-trip latency. Writes are buffered per connection and
+# applied atomically on commit.
+#
+# Usage:
+#   fake = FakeMySQL(latency=0.002)
+#   db_pool._pool = db_pool.ConnectionPool(fake.connect)
+
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(" "))
+
+SCHEMA = """
+CREATE TABLE conversation_store(
+  ID integer PRIMARY KEY AUTOINCREMENT,
+  chat_name text,
+  conv_id text,
+  user_id integer,
+  message_count integer,
+  created_at text,
+  updated_at text
+);
+CREATE TABLE message_store(
+  ID integer PRIMARY KEY AUTOINCREMENT,
+  role text,
+  conv_id text,
+  message_no integer,
+  message_id text,
+  message text,
+  elapsed_time integer,
+  Status text,
+  created_at text,
+  updated_at text
+);
+CREATE TABLE conversation_summary(
+  conv_id text PRIMARY KEY,
+  summary text,
+  summarized_count integer NOT NULL DEFAULT 0,
+  updated_at text
+);
+CREATE INDEX idx_conversation_store_conv_id ON conversation_store (conv_id);
+CREATE INDEX idx_message_store_conv_id ON message_store (conv_id, ID);
+CREATE UNIQUE INDEX idx_message_store_conv_msg ON message_store (conv_id, message_no);
+CREATE UNIQUE INDEX idx_message_store_message_id ON message_store (message_id);
+"""
+
+_UPSERT = re.compile(r"\s+ON DUPLICATE KEY UPDATE.*$", re.IGNORECASE | re.DOTALL)
+
+
+# MySQL-flavoured SQL -> SQLite
+def translate(query):
+    if _UPSERT.search(query):
+        query = _UPSERT.sub("", query).replace("INSERT INTO", "INSERT OR REPLACE INTO", 1)
+    return query.replace("%s", "?").rstrip().rstrip(";")
+
+
+def _is_read(query):
+    return query.lstrip().upper().startswith("SELECT")
+
+
+class FakeMySQL:
+    """Shared in-memory database; `connect()` hands out connections for the pool."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self._db = sqlite3.connect(":memory:", check_same_thread=False)
+        self._db.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+        # Stats
+        self.round_trips = 0
+        self.busy_time = 0.0
+        self.connections = 0
+
+    def connect(self):
+        with self._lock:
+            self.connections += 1
+        return FakeConnection(self)
+
+    # One network round trip: latency, then the work under the database lock
+    def round_trip(self, work):
+        start = time.monotonic()
+        if self.latency:
+            time.sleep(self.latency)
+        try:
+            with self._lock:
+                return work(self._db)
+        finally:
+            elapsed = time.monotonic() - start
+            with self._lock:
+                self.round_trips += 1
+                self.busy_time += elapsed
+
+    def stats(self):
+        with self._lock:
+            return {"round_trips": self.round_trips, "busy_time_s": round(self.busy_time, 3), "connections": self.connections}
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self._conn = conn
+        self._rows = []
+        self.rowcount = -1
+
+    def execute(self, query, params=()):
+        query, params = translate(query), tuple(params or ())
+        if _is_read(query):
+            self._rows = self._conn.server.round_trip(lambda db: db.execute(query, params).fetchall())
+            self.rowcount = len(self._rows)
+        else:
+            # Buffered until commit; the round trip is still paid now
+            self._conn.server.round_trip(lambda db: None)
+            self._conn.pending.append((query, params))
+            self._rows = []
+            self.rowcount = 1
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def close(self):
+        pass
+
+
+class FakeConnection:
+    def __init__(self, server):
+        self.server = server
+        self.pending = []
+
+    @property
+    def in_transaction(self):
+        return bool(self.pending)
+
+    def cursor(self, *args, **kwargs):
+        return FakeCursor(self)
+
+    def commit(self):
+        statements, self.pending = self.pending, []
+
+        def apply(db):
+            with db:
+                for query, params in statements:
+                    db.execute(query, params)
+
+        self.server.round_trip(apply)
+
+    def rollback(self):
+        self.pending = []
+
+    def ping(self, reconnect=False):
+        return True
+
+    def close(self):
+        self.pending = []
@@ -0,0 +1,117 @@
+# history_index_bench.py
+#
+# Seeds a scratch copy of message_store with millions of rows and measures the
+# history fetch (WHERE conv_id = ... ORDER BY ID) before and after the
+# migration indexes are added. Needs the DB_* environment variables.
+#
+# Usage:
+#   python Backend/Benchmark/history_index_bench.py --rows 2000000 --conversations 100000
+
+import argparse
+import os
+import random
+import string
+import sys
+import time
+from datetime import datetime
+
+import mysql.connector
+from dotenv import load_dotenv
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "DB"))
+from migrations import MESSAGE_STORE, MESSAGE_STORE_INDEXES, create_index  # noqa: E402
+
+load_dotenv()
+
+BENCH_TABLE = "message_store_bench"
+HISTORY_QUERY = f"SELECT role, message FROM {BENCH_TABLE} WHERE conv_id = %s ORDER BY ID ASC"
+
+
+def db_connection():
+    return mysql.connector.connect(
+        user=os.getenv("DB_USER"),
+        password=os.getenv("DB_PASSWORD"),
+        host=os.getenv("DB_HOST"),
+        port=os.getenv("DB_PORT"),
+        database=os.getenv("DB_NAME"),
+        ssl_ca=os.getenv("DB_SSL_CA")
+    )
+
+
+def random_conv_id():
+    chars = string.ascii_lowercase + string.digits
+    return ''.join(random.choices(chars, k=8)) + '-' + ''.join(random.choices(chars, k=4))
+
+
+def seed(db, rows, conversations, batch_size):
+    cursor = db.cursor()
+    cursor.execute(f"DROP TABLE IF EXISTS {BENCH_TABLE}")
+    cursor.execute(MESSAGE_STORE.replace("message_store(", f"{BENCH_TABLE}("))
+
+    conv_ids = [random_conv_id() for _ in range(conversations)]
+    message_no = {}
+    now = datetime.now()
+    placeholders = "(%s, %s, %s, %s, %s, %s, %s, %s, %s)"
+
+    start = time.perf_counter()
+    for offset in range(0, rows, batch_size):
+        params = []
+        count = min(batch_size, rows - offset)
+        for _ in range(count):
+            conv_id = random.choice(conv_ids)
+            n = message_no.get(conv_id, 0)
+            message_no[conv_id] = n + 1
+            params.extend(("user" if n % 2 == 0 else "assistant", conv_id, n, random_conv_id(), "x" * 80, 0, "Success", now, now))
+        cursor.execute(
+            f"INSERT INTO {BENCH_TABLE} (role, conv_id, message_no, message_id, message, elapsed_time, Status, created_at, updated_at) "
+            f"VALUES {', '.join([placeholders] * count)}",
+            params,
+        )
+        db.commit()
+    print(f"Seeded {rows} rows over {conversations} conversations in {time.perf_counter() - start:.1f}s")
+    return conv_ids
+
+
+def measure(db, conv_ids, samples):
+    cursor = db.cursor(buffered=True)
+    latencies = []
+    for conv_id in random.sample(conv_ids, min(samples, len(conv_ids))):
+        start = time.perf_counter()
+        cursor.execute(HISTORY_QUERY, (conv_id,))
+        cursor.fetchall()
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    return {
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 2),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 2),
+        "mean_ms": round(sum(latencies) / len(latencies) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="History fetch latency before/after indexes")
+    parser.add_argument("--rows", type=int, default=2_000_000)
+    parser.add_argument("--conversations", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=5_000)
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch table afterwards")
+    args = parser.parse_args()
+
+    db = db_connection()
+    try:
+        conv_ids = seed(db, args.rows, args.conversations, args.batch_size)
+        print("Before indexes:", measure(db, conv_ids, args.samples))
+
+        cursor = db.cursor(buffered=True)
+        for table, index_name, columns, unique in MESSAGE_STORE_INDEXES:
+            create_index(cursor, BENCH_TABLE, index_name, columns, unique)
+        print("After indexes: ", measure(db, conv_ids, args.samples))
+
+        if not args.keep:
+            cursor.execute(f"DROP TABLE {BENCH_TABLE}")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    main()
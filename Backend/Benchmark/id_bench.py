@@ -0,0 +1,146 @@
+# id_bench.py
+#
+# Microbenchmark and collision test for the shared ID generator
+# (Chatbot/Main/ids.py).
+#
+#   speed       IDs/s for the legacy random base36 IDs, uuid4 and the new
+#               time-ordered IDs (text and binary).
+#   index       Inserts N keys into an indexed SQLite table: legacy random
+#               IDs, random IDs of the new width, and time-ordered IDs. Reports
+#               insert rate and database size; random keys split B-tree pages
+#               all over the index, time-ordered keys append at its right edge.
+#   collisions  Streams --ids IDs from --nodes independent generators,
+#               interleaved as if they were separate processes. Memory stays
+#               O(IDs per millisecond). Each node must be strictly increasing,
+#               and no two nodes may produce the same ID. Also prints the
+#               birthday-bound estimate from the observed per-millisecond
+#               load. 10^8 IDs take a few minutes.
+#
+# Usage:
+#   python Backend/Benchmark/id_bench.py speed
+#   python Backend/Benchmark/id_bench.py index --rows 500000
+#   python Backend/Benchmark/id_bench.py collisions --ids 100000000 --nodes 4
+
+import argparse
+import os
+import random
+import sqlite3
+import string
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, os.path.join(ROOT, "Chatbot", "Main"))
+
+import ids  # noqa: E402
+
+
+# The ID format used before ids.py: 12 random base36 characters, not time-ordered
+def legacy_random_id():
+    chars = string.ascii_lowercase + string.digits
+    return '-'.join(''.join(random.choices(chars, k=p)) for p in [8, 4])
+
+
+def speed(args):
+    generators = [
+        ("legacy random_id", legacy_random_id),
+        ("uuid4", lambda: str(uuid.uuid4())),
+        ("ids.new_id", ids.new_id),
+        ("ids.new_id_bytes", ids.new_id_bytes),
+    ]
+    for name, generate in generators:
+        start = time.perf_counter()
+        for _ in range(args.count):
+            generate()
+        elapsed = time.perf_counter() - start
+        print(f"{name:<18} {args.count / elapsed:>12,.0f} IDs/s  {elapsed / args.count * 1e9:8.0f} ns/ID")
+
+
+def index(args):
+    with tempfile.TemporaryDirectory() as workdir:
+        # Same 26-character width for the random baseline, so only the key order differs
+        cases = [("random 13-char", legacy_random_id), ("random 26-char", lambda: ids.encode(random.getrandbits(128))),
+                 ("time-ordered", ids.new_id)]
+        for name, generate in cases:
+            keys = [generate() for _ in range(args.rows)]
+            db = sqlite3.connect(os.path.join(workdir, f"{name.replace(' ', '_')}.db"))
+            db.execute("CREATE TABLE message_store (ID integer PRIMARY KEY, message_id text)")
+            db.execute("CREATE INDEX idx_message_id ON message_store (message_id)")
+            start = time.perf_counter()
+            for offset in range(0, args.rows, args.batch_size):
+                with db:
+                    db.executemany("INSERT INTO message_store (message_id) VALUES (?)",
+                                   ((key,) for key in keys[offset:offset + args.batch_size]))
+            elapsed = time.perf_counter() - start
+            pages = db.execute("PRAGMA page_count").fetchone()[0]
+            page_size = db.execute("PRAGMA page_size").fetchone()[0]
+            db.close()
+            print(f"{name:<16} {args.rows / elapsed:>10,.0f} inserts/s  database {pages * page_size / 2**20:7.1f} MiB ({pages} pages)")
+
+
+def collisions(args):
+    nodes = [ids.IdGenerator() for _ in range(args.nodes)]
+    last = [-1] * args.nodes
+    buckets = {}          # millisecond -> IDs seen in it (all nodes)
+    per_ms_counts = {}    # millisecond -> IDs, for the birthday estimate
+    duplicates = out_of_order = 0
+    expected = 0.0
+    start = time.perf_counter()
+
+    for n in range(args.ids):
+        node = n % args.nodes
+        value = nodes[node].next_int()
+        if value <= last[node]:
+            out_of_order += 1
+        last[node] = value
+
+        ms = value >> 80
+        seen = buckets.get(ms)
+        if seen is None:
+            seen = buckets[ms] = set()
+        if value in seen:
+            duplicates += 1
+        seen.add(value)
+
+        # No node can produce an ID below its own last timestamp again, so older buckets are final
+        if node == args.nodes - 1 and len(buckets) > 2:
+            horizon = min(previous >> 80 for previous in last)
+            for old in [old for old in buckets if old < horizon]:
+                per_ms_counts[old] = len(buckets.pop(old))
+
+        if args.progress and n and n % args.progress == 0:
+            print(f"  {n:,} IDs, {duplicates} duplicates, {time.perf_counter() - start:.0f}s", file=sys.stderr)
+
+    for ms, seen in buckets.items():
+        per_ms_counts[ms] = len(seen)
+    # Pairs in the same millisecond that must also match 62 random bits (the counter bits only make it rarer)
+    expected = sum(count * (count - 1) / 2 for count in per_ms_counts.values()) / 2 ** 62
+    elapsed = time.perf_counter() - start
+
+    print(f"{args.ids:,} IDs from {args.nodes} generators in {elapsed:.1f}s ({args.ids / elapsed:,.0f} IDs/s)")
+    print(f"milliseconds spanned {len(per_ms_counts):,}, max IDs in one millisecond {max(per_ms_counts.values()):,}")
+    print(f"duplicates {duplicates}  out-of-order {out_of_order}  collision rate {duplicates / args.ids:.3g}")
+    print(f"birthday-bound expected collisions {expected:.3g}")
+    sys.exit(1 if duplicates or out_of_order else 0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ID generator microbenchmark and collision test")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p = sub.add_parser("speed")
+    p.add_argument("--count", type=int, default=200000)
+    p = sub.add_parser("index")
+    p.add_argument("--rows", type=int, default=300000)
+    p.add_argument("--batch-size", type=int, default=1000)
+    p = sub.add_parser("collisions")
+    p.add_argument("--ids", type=int, default=10 ** 8)
+    p.add_argument("--nodes", type=int, default=4, help="Independent generators (simulated processes)")
+    p.add_argument("--progress", type=int, default=10 ** 7, help="Print progress every N IDs (0 = quiet)")
+    args = parser.parse_args()
+    {"speed": speed, "index": index, "collisions": collisions}[args.command](args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+# load_test.py
+#
+# Self-contained load test: serves the real FastAPI app (Backend/API_Program/main.py)
+# with uvicorn on localhost, backed by a mock OpenAI-compatible server and an
+# in-memory MySQL stand-in, then drives it with simulated users. Needs no
+# network access, API key or database.
+#
+# Each simulated user holds one conversation of --turns turns. Reports RPS,
+# p50/p95/p99 latency, errors, and where the time went (DB vs LLM).
+#
+# Usage:
+#   python Backend/Benchmark/load_test.py --requests 1000 --concurrency 50 --turns 4
+#   python Backend/Benchmark/load_test.py --mode async --stream --llm-latency 0.3 --token-rate 80 --reply-words 40
+#   python Backend/Benchmark/load_test.py --mode both --db-latency 0.005 --json
+#   python Backend/Benchmark/load_test.py --mode sync --db-latency 0.02 --write-behind
+#   python Backend/Benchmark/load_test.py --storage sqlite
+
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import httpx
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, os.path.join(ROOT, "Chatbot", "Main"))
+sys.path.insert(0, os.path.join(ROOT, "Backend", "API_Program"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_openai_server import start_mock_server  # noqa: E402
+from fake_mysql import FakeMySQL  # noqa: E402
+from metrics import STAGE_SECONDS  # noqa: E402
+
+
+def configure_environment(mock_url, db_pool_size, write_behind, storage, workdir):
+    # Must run before the app modules are imported: they read their settings at import time
+    os.environ["OPENAI_API_KEY"] = "mock"
+    os.environ["OPENAI_BASE_URL"] = mock_url
+    os.environ["LLM_BACKENDS"] = ""
+    os.environ["DB_ASYNC_DRIVER"] = "executor"
+    os.environ["DB_POOL_SIZE"] = str(db_pool_size)
+    os.environ["WRITE_BEHIND_ENABLED"] = "true" if write_behind else "false"
+    os.environ["STORAGE_BACKEND"] = storage
+    os.environ["STORAGE_SQLITE_PATH"] = os.path.join(workdir, "load_test.db")
+    # Keep the client-side limiter out of the way unless explicitly configured
+    os.environ.setdefault("LLM_RPM", "1000000")
+    os.environ.setdefault("LLM_TPM", "1000000000")
+    os.environ.setdefault("LLM_MAX_CONCURRENCY", "10000")
+    os.environ.setdefault("LLM_MAX_QUEUE", "10000")
+
+
+def start_app(api, port):
+    import uvicorn
+
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=port, log_level="warning", access_log=False,
+                                          timeout_keep_alive=120))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, thread
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    return round(values[min(len(values) - 1, int(len(values) * p / 100))] * 1000, 1)
+
+
+async def send_turn(client, stream, params):
+    if not stream:
+        resp = await client.post("/chat-message", params=params)
+        resp.raise_for_status()
+        return resp.json()["conversation_id"], None
+
+    start = time.perf_counter()
+    first_token = None
+    conversation_id = params["conversation_id"]
+    async with client.stream("POST", "/chat-message/stream", params=params) as resp:
+        resp.raise_for_status()
+        event = None
+        async for line in resp.aiter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+            elif line.startswith("data: "):
+                data = json.loads(line[6:])
+                if event == "meta":
+                    conversation_id = data["conversation_id"]
+                elif event == "error":
+                    raise RuntimeError(data["error"])
+                elif event is None and first_token is None:
+                    first_token = time.perf_counter() - start
+            elif not line:
+                event = None
+    return conversation_id, first_token
+
+
+async def drive(base_url, total, concurrency, turns, stream, distinct_prompts, run_tag):
+    latencies, first_tokens, errors = [], [], {}
+    users = max(1, total // turns)
+    semaphore = asyncio.Semaphore(concurrency)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120, limits=limits) as client:
+
+        async def user(u):
+            conversation_id, message_count = "", 1
+            for turn in range(turns):
+                # Prompts are tagged per run so one run's cached replies don't leak into the next
+                if distinct_prompts:
+                    prompt = f"{run_tag} question {(u * turns + turn) % distinct_prompts}"
+                else:
+                    prompt = f"{run_tag} user {u} turn {turn}: tell me something"
+                params = {"message": prompt, "user_id": u, "message_id": "",
+                          "message_count": message_count, "conversation_id": conversation_id}
+                async with semaphore:
+                    start = time.perf_counter()
+                    try:
+                        conversation_id, first_token = await send_turn(client, stream, params)
+                    except Exception as e:
+                        key = type(e).__name__
+                        if isinstance(e, httpx.HTTPStatusError):
+                            key = f"HTTP {e.response.status_code}"
+                        errors[key] = errors.get(key, 0) + 1
+                        return
+                    latencies.append(time.perf_counter() - start)
+                    if first_token is not None:
+                        first_tokens.append(first_token)
+                message_count += 2
+
+        start = time.perf_counter()
+        await asyncio.gather(*(user(u) for u in range(users)))
+        elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    first_tokens.sort()
+    return elapsed, latencies, first_tokens, errors
+
+
+# Average ms per observation for each stage recorded during the run
+def stage_breakdown(before, after):
+    breakdown = {}
+    for key, (count, total) in sorted(after.items()):
+        prev_count, prev_total = before.get(key, (0, 0.0))
+        if count > prev_count:
+            breakdown[key[0]] = round((total - prev_total) / (count - prev_count) * 1000, 2)
+    return breakdown
+
+
+def run(api, fake_db, mock, args, async_mode):
+    api.CHAT_ASYNC_MODE = async_mode
+
+    # Warm up lazy singletons, connection pools and the tokenizer outside the measured window
+    if args.warmup:
+        asyncio.run(drive(f"http://127.0.0.1:{args.port}", args.warmup, min(args.warmup, args.concurrency), 1,
+                          args.stream, 0, f"[warmup {time.time_ns()}]"))
+    db_before, llm_before = fake_db.stats(), (mock.requests, mock.busy_time)
+    stages_before = STAGE_SECONDS.snapshot()
+
+    elapsed, latencies, first_tokens, errors = asyncio.run(drive(
+        f"http://127.0.0.1:{args.port}", args.requests, args.concurrency, args.turns, args.stream, args.distinct_prompts, f"[run {time.time_ns()}]"))
+
+    db_after = fake_db.stats()
+    db_time = db_after["busy_time_s"] - db_before["busy_time_s"]
+    llm_time = mock.busy_time - llm_before[1]
+    completed = len(latencies)
+    report = {
+        "mode": "async" if async_mode else "sync",
+        "endpoint": "/chat-message/stream" if args.stream else "/chat-message",
+        "storage": args.storage,
+        "requests": completed,
+        "errors": errors,
+        "concurrency": args.concurrency,
+        "elapsed_s": round(elapsed, 3),
+        "rps": round(completed / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50),
+        "p95_ms": percentile(latencies, 95),
+        "p99_ms": percentile(latencies, 99),
+        "llm": {"calls": mock.requests - llm_before[0], "time_s": round(llm_time, 3),
+                "avg_ms_per_request": round(llm_time / completed * 1000, 2) if completed else None},
+        "db": {"round_trips": db_after["round_trips"] - db_before["round_trips"], "time_s": round(db_time, 3),
+               "avg_ms_per_request": round(db_time / completed * 1000, 2) if completed else None},
+        "db_share_of_backend_time": round(db_time / (db_time + llm_time), 3) if db_time + llm_time else None,
+        "stages_avg_ms": stage_breakdown(stages_before, STAGE_SECONDS.snapshot()),
+    }
+    if api.write_behind.running:
+        wb = api.write_behind.stats()
+        report["write_behind"] = {"unflushed": wb["unflushed"], "batches": wb["batches"], "avg_batch_size": round(wb["avg_batch_size"], 1)}
+    if first_tokens:
+        report["ttft_p50_ms"] = percentile(first_tokens, 50)
+        report["ttft_p99_ms"] = percentile(first_tokens, 99)
+    return report
+
+
+def print_report(report):
+    print(f"\n== {report['mode']} {report['endpoint']} ({report['storage']}) ==")
+    print(f"requests {report['requests']}  errors {report['errors'] or 0}  concurrency {report['concurrency']}  elapsed {report['elapsed_s']}s")
+    print(f"throughput {report['rps']} req/s")
+    print(f"latency p50 {report['p50_ms']} ms  p95 {report['p95_ms']} ms  p99 {report['p99_ms']} ms")
+    if "ttft_p50_ms" in report:
+        print(f"time to first token p50 {report['ttft_p50_ms']} ms  p99 {report['ttft_p99_ms']} ms")
+    print(f"LLM  {report['llm']['calls']} calls, {report['llm']['time_s']}s total, {report['llm']['avg_ms_per_request']} ms/request")
+    # Round trips and DB time are measured on the MySQL stand-in; other engines show up in the stage averages
+    print(f"DB   {report['db']['round_trips']} round trips, {report['db']['time_s']}s total, {report['db']['avg_ms_per_request']} ms/request")
+    print(f"DB share of backend time {report['db_share_of_backend_time']}")
+    if "write_behind" in report:
+        wb = report["write_behind"]
+        print(f"write-behind {wb['batches']} batches, {wb['avg_batch_size']} turns/batch, {wb['unflushed']} unflushed at end of run")
+    print("stage averages (ms): " + "  ".join(f"{name} {ms}" for name, ms in report["stages_avg_ms"].items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline load test of the chat API (mock LLM + in-memory DB)")
+    parser.add_argument("--requests", type=int, default=500, help="Total chat turns to send")
+    parser.add_argument("--concurrency", type=int, default=50, help="Max in-flight requests")
+    parser.add_argument("--turns", type=int, default=4, help="Turns per simulated conversation")
+    parser.add_argument("--mode", choices=["sync", "async", "both"], default="both", help="CHAT_ASYNC_MODE to test")
+    parser.add_argument("--stream", action="store_true", help="Use /chat-message/stream (SSE) instead of /chat-message")
+    parser.add_argument("--distinct-prompts", type=int, default=0, help="Draw prompts from N distinct strings (exercises caches); 0 = all unique")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="Mock LLM time to first token (s)")
+    parser.add_argument("--llm-jitter", type=float, default=0.05)
+    parser.add_argument("--llm-tail-prob", type=float, default=0.0)
+    parser.add_argument("--llm-tail", type=float, default=0.0)
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Mock LLM tokens/s after the first (0 = instant)")
+    parser.add_argument("--reply-words", type=int, default=20, help="Words in each mock reply")
+    parser.add_argument("--db-latency", type=float, default=0.002, help="Fake DB latency per round trip (s)")
+    parser.add_argument("--db-pool-size", type=int, default=10)
+    parser.add_argument("--write-behind", action="store_true", help="Persist turns through the write-behind queue")
+    parser.add_argument("--storage", choices=["mysql", "sqlite", "memory"], default="mysql",
+                        help="Storage engine (mysql = the in-memory MySQL stand-in)")
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured requests sent before each run")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--json", action="store_true", help="Print reports as JSON lines")
+    args = parser.parse_args()
+
+    mock = start_mock_server("mock", args.llm_latency, args.llm_jitter, args.llm_tail_prob, args.llm_tail,
+                             token_rate=args.token_rate, reply_words=args.reply_words)
+    workdir = tempfile.mkdtemp(prefix="load_test-")
+    configure_environment(mock.base_url, args.db_pool_size, args.write_behind, args.storage, workdir)
+
+    import db_pool
+    import main as api
+
+    fake_db = FakeMySQL(latency=args.db_latency)
+    db_pool._pool = db_pool.ConnectionPool(fake_db.connect, size=args.db_pool_size)
+
+    server, thread = start_app(api, args.port)
+    try:
+        modes = {"sync": [False], "async": [True], "both": [False, True]}[args.mode]
+        for async_mode in modes:
+            report = run(api, fake_db, mock, args, async_mode)
+            if args.json:
+                print(json.dumps(report))
+            else:
+                print_report(report)
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5)
+        mock.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,323 @@
+# mock_openai_server.py
+#
+# Minimal OpenAI-compatible stub for benchmarks: POST /v1/chat/completions
+# (plain and stream=True) and POST /v1/embeddings. Latency is configurable
+# with a base delay (time to first token), uniform jitter, an occasional slow
+# tail and a token generation rate.
+#
+# Also a local stand-in for the Batch API (POST /v1/files, POST /v1/batches,
+# GET /v1/batches/{id}, GET /v1/files/{id}/content): a batch completes
+# --batch-delay seconds after creation. A request whose last message contains
+# "FAIL" gets an error line instead of a completion.
+#
+# Usage (standalone):
+#   python Backend/Benchmark/mock_openai_server.py --port 8001 --latency 0.3 --jitter 0.1 --tail-prob 0.05 --tail 2.0 --token-rate 50
+#
+# Or in-process:
+#   server = start_mock_server(latency=0.2)
+#   base_url = server.base_url  # http://127.0.0.1:<port>/v1
+
+import argparse
+import itertools
+import json
+import random
+import threading
+import time
+from email.parser import BytesParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class LatencyProfile:
+    """Base delay + uniform jitter, with `tail_prob` of requests taking an extra `tail` seconds.
+
+    `token_rate` is generated tokens per second after the first one (0 = instant).
+    """
+
+    def __init__(self, latency=0.1, jitter=0.0, tail_prob=0.0, tail=0.0, token_rate=0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.tail_prob = tail_prob
+        self.tail = tail
+        self.token_rate = token_rate
+
+    def sample(self):
+        delay = self.latency + random.uniform(0, self.jitter)
+        if self.tail_prob and random.random() < self.tail_prob:
+            delay += self.tail
+        return delay
+
+    def token_delay(self):
+        return 1.0 / self.token_rate if self.token_rate else 0.0
+
+
+def _completion(model, content, prompt_tokens):
+    completion_tokens = max(1, len(content) // 4)
+    return {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                  "total_tokens": prompt_tokens + completion_tokens},
+    }
+
+
+def _chunk(model, content, finish_reason=None):
+    delta = {"content": content} if content is not None else {}
+    return {
+        "id": "chatcmpl-mock",
+        "object": "chat.completion.chunk",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+    }
+
+
+# echo_context appends how many earlier user turns the prompt carried (checks that history was not lost)
+def _reply(server_name, messages, reply_words, echo_context=False):
+    last = messages[-1]["content"] if messages else ""
+    words = [f"[{server_name}]", last] + ["lorem"] * reply_words
+    if echo_context:
+        words.append(f"context={sum(m.get('role') == 'user' for m in messages[:-1])}")
+    return " ".join(words)
+
+
+def _prompt_tokens(messages):
+    return sum(len(m.get("content", "")) for m in messages) // 4 + 1
+
+
+# Fields of a multipart/form-data body: name -> bytes
+def _form_fields(content_type, body):
+    message = BytesParser().parsebytes(f"Content-Type: {content_type}\r\n\r\n".encode() + body)
+    return {part.get_param("name", header="content-disposition"): part.get_payload(decode=True)
+            for part in message.get_payload()}
+
+
+class BatchStore:
+    """In-memory files and batches for the Batch API stand-in."""
+
+    def __init__(self, server_name, reply_words, delay):
+        self.server_name = server_name
+        self.reply_words = reply_words
+        self.delay = delay
+        self.files = {}
+        self.batches = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add_file(self, content, filename="upload.jsonl", purpose="batch"):
+        with self._lock:
+            file_id = f"file-mock{next(self._ids)}"
+            self.files[file_id] = content
+        return {"id": file_id, "object": "file", "bytes": len(content), "created_at": int(time.time()),
+                "filename": filename, "purpose": purpose, "status": "processed"}
+
+    def create_batch(self, request):
+        with self._lock:
+            batch_id = f"batch_mock{next(self._ids)}"
+            batch = {"id": batch_id, "object": "batch", "endpoint": request.get("endpoint"),
+                     "input_file_id": request.get("input_file_id"), "completion_window": request.get("completion_window", "24h"),
+                     "status": "in_progress", "created_at": int(time.time()), "output_file_id": None, "error_file_id": None,
+                     "request_counts": {"total": 0, "completed": 0, "failed": 0}}
+            self.batches[batch_id] = batch
+        threading.Timer(self.delay, self._complete, args=(batch_id,)).start()
+        return dict(batch)
+
+    def _complete(self, batch_id):
+        batch = self.batches[batch_id]
+        outputs, errors = [], []
+        for line in self.files.get(batch["input_file_id"], b"").decode().splitlines():
+            if not line.strip():
+                continue
+            request = json.loads(line)
+            body = request.get("body", {})
+            messages = body.get("messages", [])
+            if messages and "FAIL" in messages[-1].get("content", ""):
+                errors.append({"id": f"req-{request['custom_id']}", "custom_id": request["custom_id"], "response": None,
+                               "error": {"code": "mock_failure", "message": "Requested failure"}})
+                continue
+            content = _reply(self.server_name, messages, self.reply_words)
+            outputs.append({"id": f"req-{request['custom_id']}", "custom_id": request["custom_id"], "error": None,
+                            "response": {"status_code": 200, "request_id": "mock",
+                                         "body": _completion(body.get("model", "mock"), content, _prompt_tokens(messages))}})
+        output_file = self.add_file("".join(json.dumps(o) + "\n" for o in outputs).encode()) if outputs else None
+        error_file = self.add_file("".join(json.dumps(e) + "\n" for e in errors).encode()) if errors else None
+        with self._lock:
+            batch["output_file_id"] = output_file["id"] if output_file else None
+            batch["error_file_id"] = error_file["id"] if error_file else None
+            batch["request_counts"] = {"total": len(outputs) + len(errors), "completed": len(outputs), "failed": len(errors)}
+            batch["status"] = "completed"
+
+
+def make_handler(server_name, profile, stats, reply_words, batches, echo_context=False):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, payload):
+            body = json.dumps(payload).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _send_bytes(self, body, status=200):
+            self.send_response(status)
+            self.send_header("Content-Type", "application/octet-stream")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _not_found(self):
+            body = json.dumps({"error": {"message": f"No route {self.path}", "type": "invalid_request_error"}}).encode()
+            self._send_bytes(body, status=404)
+
+        def do_GET(self):
+            parts = self.path.rstrip("/").split("/")
+            if len(parts) >= 2 and parts[-2] == "batches" and parts[-1] in batches.batches:
+                self._send_json(batches.batches[parts[-1]])
+            elif len(parts) >= 3 and parts[-3] == "files" and parts[-1] == "content" and parts[-2] in batches.files:
+                self._send_bytes(batches.files[parts[-2]])
+            else:
+                self._not_found()
+
+        def _write_chunk(self, data):
+            self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+        def do_POST(self):
+            start = time.monotonic()
+            try:
+                self._handle()
+            finally:
+                with stats["lock"]:
+                    stats["requests"] += 1
+                    stats["busy_time"] += time.monotonic() - start
+
+        def _handle(self):
+            length = int(self.headers.get("Content-Length", 0))
+            body = self.rfile.read(length)
+
+            if self.path.endswith("/files"):
+                fields = _form_fields(self.headers.get("Content-Type", ""), body)
+                self._send_json(batches.add_file(fields.get("file", b""), purpose=(fields.get("purpose") or b"batch").decode()))
+                return
+            request = json.loads(body or b"{}")
+            if self.path.endswith("/batches"):
+                self._send_json(batches.create_batch(request))
+                return
+
+            if self.path.endswith("/embeddings"):
+                text = request.get("input", "")
+                vector = [float(ord(c) % 7) for c in str(text)[:16]] + [0.0] * 16
+                self._send_json({"object": "list", "model": request.get("model"),
+                                 "data": [{"object": "embedding", "index": 0, "embedding": vector[:16]}],
+                                 "usage": {"prompt_tokens": 1, "total_tokens": 1}})
+                return
+
+            model = request.get("model", "mock")
+            messages = request.get("messages", [])
+            content = _reply(server_name, messages, reply_words, echo_context)
+            prompt_tokens = _prompt_tokens(messages)
+            delay = profile.sample()
+
+            if not request.get("stream"):
+                time.sleep(delay + len(content.split(" ")) * profile.token_delay())
+                self._send_json(_completion(model, content, prompt_tokens))
+                return
+
+            # Time to first token is the sampled delay; the rest trickles out word by word
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            time.sleep(delay)
+            for word in content.split(" "):
+                self._write_chunk(f"data: {json.dumps(_chunk(model, word + ' '))}\n\n".encode())
+                time.sleep(profile.token_delay())
+            self._write_chunk(f"data: {json.dumps(_chunk(model, None, 'stop'))}\n\n".encode())
+            if (request.get("stream_options") or {}).get("include_usage"):
+                usage = _completion(model, content, prompt_tokens)["usage"]
+                self._write_chunk(f"data: {json.dumps({**_chunk(model, None), 'choices': [], 'usage': usage})}\n\n".encode())
+            self._write_chunk(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+
+        def log_message(self, *args):
+            pass
+
+    return Handler
+
+
+class _QuietServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 1024  # the default backlog of 5 drops SYNs under load
+
+    # Hedged/cancelled clients hang up mid-response; that is expected here
+    def handle_error(self, request, client_address):
+        pass
+
+
+class MockOpenAIServer:
+    def __init__(self, name="mock", profile=None, host="127.0.0.1", port=0, reply_words=0, batch_delay=0.5, echo_context=False):
+        self.name = name
+        self.profile = profile or LatencyProfile()
+        self.stats = {"requests": 0, "busy_time": 0.0, "lock": threading.Lock()}
+        self.batches = BatchStore(name, reply_words, batch_delay)
+        self._server = _QuietServer((host, port), make_handler(name, self.profile, self.stats, reply_words, self.batches, echo_context))
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def base_url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    @property
+    def requests(self):
+        return self.stats["requests"]
+
+    # Total seconds spent serving requests (time the app spent waiting on the "LLM")
+    @property
+    def busy_time(self):
+        return self.stats["busy_time"]
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+# Start a stub in a background thread
+def start_mock_server(name="mock", latency=0.1, jitter=0.0, tail_prob=0.0, tail=0.0, port=0, token_rate=0.0, reply_words=0,
+                      batch_delay=0.5, echo_context=False):
+    profile = LatencyProfile(latency, jitter, tail_prob, tail, token_rate)
+    return MockOpenAIServer(name, profile, port=port, reply_words=reply_words, batch_delay=batch_delay, echo_context=echo_context).start()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server")
+    parser.add_argument("--name", default="mock")
+    parser.add_argument("--port", type=int, default=8001)
+    parser.add_argument("--latency", type=float, default=0.1)
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--tail-prob", type=float, default=0.0)
+    parser.add_argument("--tail", type=float, default=0.0)
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Generated tokens per second (0 = instant)")
+    parser.add_argument("--reply-words", type=int, default=0, help="Filler words appended to each reply")
+    parser.add_argument("--batch-delay", type=float, default=0.5, help="Seconds until a Batch API job completes")
+    args = parser.parse_args()
+
+    server = start_mock_server(args.name, args.latency, args.jitter, args.tail_prob, args.tail, args.port,
+                               args.token_rate, args.reply_words, args.batch_delay)
+    print(f"Mock OpenAI server '{args.name}' listening on {server.base_url}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+# provider_routing.py
+#
+# Starts several OpenAI-compatible stubs with different latency profiles and
+# sends completions through the ProviderRouter, with and without hedging.
+# Shows traffic shifting to the fastest backend and hedges cutting tail latency
+# (async only: sync completions are routed but never hedged).
+#
+# Usage:
+#   python Backend/Benchmark/provider_routing.py --requests 200 --concurrency 8
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, os.path.join(ROOT, "Chatbot", "Main"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from llm_client import create_openai_client, create_async_openai_client  # noqa: E402
+from providers import LLMBackend, ProviderRouter  # noqa: E402
+from mock_openai_server import start_mock_server  # noqa: E402
+
+PROFILES = {
+    # name: (latency, jitter, tail_prob, tail)
+    "fast-spiky": (0.05, 0.02, 0.04, 1.0),
+    "steady": (0.15, 0.02, 0.0, 0.0),
+    "slow": (0.40, 0.10, 0.0, 0.0),
+}
+
+PARAMS = {"max_tokens": 32, "temperature": 0.0}
+
+
+def build_router(servers, hedge):
+    backends = [
+        LLMBackend(name, create_openai_client(api_key="mock", base_url=server.base_url),
+                   create_async_openai_client(api_key="mock", base_url=server.base_url), model="mock")
+        for name, server in servers.items()
+    ]
+    return ProviderRouter(backends, hedge=hedge)
+
+
+def summarize(label, router, latencies, elapsed):
+    latencies.sort()
+    return {
+        "run": label,
+        "requests": len(latencies),
+        "elapsed_s": round(elapsed, 3),
+        "p50_ms": round(latencies[len(latencies) // 2] * 1000, 1),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1] * 1000, 1),
+        "routing": router.stats(),
+    }
+
+
+def run_sync(servers, hedge, total, concurrency):
+    router = build_router(servers, hedge)
+    latencies = []
+
+    def one(i):
+        start = time.perf_counter()
+        router.complete([{"role": "user", "content": f"hello {i}"}], PARAMS)
+        latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(total)))
+    return summarize(f"sync hedge={hedge}", router, latencies, time.perf_counter() - start)
+
+
+async def run_async(servers, hedge, total, concurrency):
+    router = build_router(servers, hedge)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(i):
+        async with semaphore:
+            start = time.perf_counter()
+            await router.acomplete([{"role": "user", "content": f"hello {i}"}], PARAMS)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(total)))
+    return summarize(f"async hedge={hedge}", router, latencies, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency-based routing and hedging against stub backends")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+
+    servers = {name: start_mock_server(name, *profile) for name, profile in PROFILES.items()}
+    try:
+        print(json.dumps(run_sync(servers, False, args.requests, args.concurrency), indent=2))
+        for hedge in (False, True):
+            print(json.dumps(asyncio.run(run_async(servers, hedge, args.requests, args.concurrency)), indent=2))
+    finally:
+        for server in servers.values():
+            server.stop()
+
+
+if __name__ == "__main__":
+    main()
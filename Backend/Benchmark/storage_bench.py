@@ -0,0 +1,229 @@
+# storage_bench.py
+#
+# Conformance checks and throughput benchmark for the conversation storage
+# engines (Chatbot/Main/storage.py). Every engine runs the same checks
+# (append/read round trips, keyset pages, conversation listing, summaries,
+# async variants) and then the same workload: simulated users appending
+# turns and reading their history from several threads.
+#
+# "mysql" runs the real MySQLStore against the in-memory MySQL stand-in
+# (fake_mysql.py, --db-latency per round trip); pass --real-mysql to use the
+# DB_* environment variables instead.
+#
+# Usage:
+#   python Backend/Benchmark/storage_bench.py
+#   python Backend/Benchmark/storage_bench.py --engines sqlite memory --turns 20000 --threads 8
+#   python Backend/Benchmark/storage_bench.py --check-only
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", ".."))
+sys.path.insert(0, os.path.join(ROOT, "Chatbot", "Main"))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import db_pool  # noqa: E402
+import async_db  # noqa: E402
+from storage import MemoryStore, MySQLStore, SQLiteStore, ConversationConflictError, DuplicateMessageError  # noqa: E402
+from fake_mysql import FakeMySQL  # noqa: E402
+
+
+def make_store(engine, args, workdir):
+    if engine == "memory":
+        return MemoryStore()
+    if engine == "sqlite":
+        return SQLiteStore(os.path.join(workdir, f"bench-{time.time_ns()}.db"))
+    if not args.real_mysql:
+        db_pool._pool = db_pool.ConnectionPool(FakeMySQL(latency=args.db_latency).connect, size=args.threads)
+        async_db.DB_ASYNC_DRIVER = "executor"
+    return MySQLStore()
+
+
+def new_id(prefix):
+    return f"{prefix}-{random.getrandbits(40):010x}"
+
+
+def turn(conv_id, user_id, message_count, text="hello"):
+    return [conv_id, user_id, message_count, new_id("u"), f"{text} {message_count}", new_id("a"), f"reply {message_count}", 12]
+
+
+# Conformance: the behaviour every engine must share
+def check(store):
+    results = []
+
+    def expect(name, condition):
+        results.append((name, bool(condition)))
+
+    user_id = random.randint(10**6, 10**7)
+    first, second = new_id("c"), new_id("c")
+    turns = [turn(first, user_id, 0), turn(first, user_id, 2), turn(first, user_id, 4)]
+    store.append_turn(*turns[0])
+    store.append_turns(turns[1:] + [turn(second, user_id, 0)])
+
+    history = store.get_history(first)
+    expect("history has both messages of every turn", len(history) == 6)
+    expect("history is oldest first with user/assistant pairs", [row[0] for row in history] == ["user", "assistant"] * 3)
+    expect("history carries message ids", [row[2] for row in history[:2]] == [turns[0][3], turns[0][5]])
+    expect("history of an unknown conversation is empty", store.get_history(new_id("c")) == [])
+
+    page = store.get_history_page(first, 0, 4)
+    rest = store.get_history_page(first, page[-1][0], 4)
+    expect("first page respects the limit", len(page) == 4)
+    expect("keyset page continues after the last ID", len(rest) == 2 and rest[0][0] > page[-1][0])
+    expect("page rows are (ID, role, message_no, message, message_id)",
+           page[1][1:] == ("assistant", 1, turns[0][6], turns[0][5]) and [row[2] for row in page + rest] == [0, 1, 2, 3, 4, 5])
+    expect("page of an unknown conversation is empty", store.get_history_page(new_id("c"), 0, 10) == [])
+
+    time.sleep(0.002)
+    store.append_turn(*turn(second, user_id, 2))
+    conversations = store.list_conversations(user_id)
+    expect("list_conversations returns the user's conversations", sorted(row[1] for row in conversations) == sorted([first, second]))
+    expect("list_conversations is latest first", conversations[0][1] == second)
+    expect("list_conversations respects the limit", len(store.list_conversations(user_id, limit=1)) == 1)
+    expect("list_conversations of an unknown user is empty", store.list_conversations(user_id + 1) == [])
+    expect("message_count counts every stored message", {row[1]: row[3] for row in conversations} == {first: 6, second: 4})
+    cursor = conversations[0]
+    before = (cursor[5] if isinstance(cursor[5], datetime) else datetime.fromisoformat(str(cursor[5])), cursor[0])
+    expect("list_conversations continues after the before cursor",
+           [row[1] for row in store.list_conversations(user_id, limit=1, before=before)] == [first])
+
+    expect("missing summary is (None, 0)", tuple(store.get_summary(first)) == (None, 0))
+    store.save_summary(first, "summary one", 4)
+    store.save_summary(first, "summary two", 6)
+    expect("save_summary upserts", tuple(store.get_summary(first)) == ("summary two", 6))
+
+    try:
+        store.append_turns([turn(first, user_id, 6), turn(first, user_id, 2)])
+        conflict = False
+    except ConversationConflictError:
+        conflict = True
+    expect("a taken message_no raises ConversationConflictError and writes nothing",
+           conflict and len(store.get_history(first)) == 6)
+
+    retry = turn(first, user_id, 6)
+    retry[3] = turns[1][3]
+    try:
+        store.append_turn(*retry)
+        duplicate = False
+    except DuplicateMessageError:
+        duplicate = True
+    expect("a stored message_id raises DuplicateMessageError and writes nothing", duplicate and len(store.get_history(first)) == 6)
+    expect("get_turn finds a turn by its user message_id",
+           tuple(store.get_turn(turns[1][3])) == (first, user_id, turns[1][4], turns[1][6])
+           and store.get_turn(turns[1][5]) is None and store.get_turn(new_id("u")) is None)
+
+    async def async_reads():
+        await store.aappend_turn(*turn(second, user_id, 4))
+        return (await store.aget_history(second), await store.aget_history_page(second, 0, 100),
+                await store.alist_conversations(user_id), await store.aget_summary(first), await store.aget_turn(turns[0][3]))
+
+    history_async, page_async, conversations_async, summary_async, turn_async = asyncio.run(async_reads())
+    expect("async variants match the sync ones",
+           [tuple(row) for row in history_async] == [tuple(row) for row in store.get_history(second)] and len(page_async) == 6
+           and len(conversations_async) == 2 and tuple(summary_async) == ("summary two", 6)
+           and tuple(turn_async) == tuple(store.get_turn(turns[0][3])))
+    return results
+
+
+def percentile(values, p):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(len(values) * p / 100))] * 1000, 3)
+
+
+# Throughput: each thread plays users that append a turn and read their history back
+def bench(store, total_turns, threads, turns_per_conversation, batch_size):
+    write_latencies, read_latencies = [], []
+    lock = threading.Lock()
+    per_thread = total_turns // threads
+
+    def worker(index):
+        writes, reads = [], []
+        user_id = 10**8 + index
+        conv_id, message_count = None, 0
+        batch = []
+        for n in range(per_thread):
+            if n % turns_per_conversation == 0:
+                conv_id, message_count = new_id("b"), 0
+            batch.append(turn(conv_id, user_id, message_count, "bench"))
+            message_count += 2
+            if len(batch) >= batch_size:
+                start = time.perf_counter()
+                store.append_turns(batch)
+                writes.append(time.perf_counter() - start)
+                batch = []
+                start = time.perf_counter()
+                store.get_history(conv_id)
+                reads.append(time.perf_counter() - start)
+        if batch:
+            store.append_turns(batch)
+        with lock:
+            write_latencies.extend(writes)
+            read_latencies.extend(reads)
+
+    start = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    return {
+        "turns": per_thread * threads,
+        "elapsed_s": round(elapsed, 3),
+        "turns_per_s": round(per_thread * threads / elapsed, 1),
+        "append_p50_ms": percentile(write_latencies, 50),
+        "append_p99_ms": percentile(write_latencies, 99),
+        "history_p50_ms": percentile(read_latencies, 50),
+        "history_p99_ms": percentile(read_latencies, 99),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conformance checks and benchmark for the storage engines")
+    parser.add_argument("--engines", nargs="+", default=["memory", "sqlite", "mysql"], choices=["memory", "sqlite", "mysql"])
+    parser.add_argument("--turns", type=int, default=5000, help="Turns appended per engine")
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--turns-per-conversation", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=1, help="Turns per append_turns call (write-behind batches > 1)")
+    parser.add_argument("--db-latency", type=float, default=0.0, help="Fake MySQL latency per round trip (s)")
+    parser.add_argument("--real-mysql", action="store_true", help="Use the MySQL server from the DB_* variables")
+    parser.add_argument("--check-only", action="store_true", help="Run the conformance checks only")
+    parser.add_argument("--json", action="store_true", help="Print reports as JSON lines")
+    args = parser.parse_args()
+
+    failed = False
+    with tempfile.TemporaryDirectory() as workdir:
+        for engine in args.engines:
+            store = make_store(engine, args, workdir)
+            results = check(store)
+            failures = [name for name, ok in results if not ok]
+            failed = failed or bool(failures)
+            report = {"engine": engine, "checks_passed": len(results) - len(failures), "checks_failed": failures}
+            if not args.check_only:
+                report.update(bench(store, args.turns, args.threads, args.turns_per_conversation, args.batch_size))
+
+            if args.json:
+                print(json.dumps(report))
+                continue
+            print(f"\n== {engine} ==")
+            print(f"conformance {report['checks_passed']}/{len(results)} passed" + (f", FAILED: {failures}" if failures else ""))
+            if not args.check_only:
+                print(f"{report['turns']} turns in {report['elapsed_s']}s: {report['turns_per_s']} turns/s")
+                print(f"append p50 {report['append_p50_ms']} ms  p99 {report['append_p99_ms']} ms  "
+                      f"history p50 {report['history_p50_ms']} ms  p99 {report['history_p99_ms']} ms")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,83 +1,57 @@
 # !uv pip install mysql-connector-python
 
+# Schema setup: applies pending migrations from migrations.py
+#
+#   python main.py            # apply all pending migrations
+#   python main.py --status   # list migrations and whether they are applied
+#   python main.py --to 2     # apply migrations up to version 2
 
-
+import argparse
 import mysql.connector
 import os
 from dotenv import load_dotenv
+from migrations import migrate, status
 
 load_dotenv()
 
-user = mysql.connector.connect(
-  user = os.getenv("DB_USER"),
-  password = os.getenv("DB_PASSWORD"),
-  host = os.getenv("DB_HOST"),
-  port = os.getenv("DB_PORT"),
-  database = os.getenv("DB_NAME")
-)
-
-user_cmd = user.cursor()
-
-query = '''
-CREATE TABLE conversation_store(
-  "ID" integer NOT NULL,
-  "chat_name" character varying(60),
-  "conv_id" character varying(20),
-  "user_id" integer NOT NULL,
-  "message_count" integer,
-  "created_at" timestamp,
-  "updated_at" timestamp,
-  PRIMARY KEY ("ID")
-);
-'''
-
-user_cmd.execute(query)
-
-
-
-# Show tables
-show_tables = 'SHOW TABLES;'
-user_cmd.execute(show_tables)
-
-# Fetch and print the result
-for table in user_cmd.fetchall():
-    print(table)
-
-
-user_cmd.execute('SELECT * FROM conversation_store LIMIT 0')
-
-# Extract column names
-column_names = [desc[0] for desc in user_cmd.description]
-print(column_names)
-
-message_store = '''
-CREATE TABLE message_store(
-  "ID" integer NOT NULL,
-  "role" integer,
-  "conv_id" character varying(20),
-  "message_no" integer,
-  "message_id" character varying(20),
-  "message" text,
-  "elapsed_time" integer,
-  "Status" integer,
-  "created_at" timestamp,
-  "updated_at" timestamp,
-  PRIMARY KEY ("ID")
-);
-'''
-
-user_cmd.execute(message_store)
-
-# Show tables
-show_tables = 'SHOW TABLES;'
-user_cmd.execute(show_tables)
-
-# Fetch and print the result
-for table in user_cmd.fetchall():
-    print(table)
-
-user_cmd.execute('SELECT * FROM message_store LIMIT 0')
 
-# Extract column names
-column_names = [desc[0] for desc in user_cmd.description]
-print(column_names)
\ No newline at end of file
+def db_connection():
+    return mysql.connector.connect(
+        user = os.getenv("DB_USER"),
+        password = os.getenv("DB_PASSWORD"),
+        host = os.getenv("DB_HOST"),
+        port = os.getenv("DB_PORT"),
+        database = os.getenv("DB_NAME"),
+        ssl_ca = os.getenv("DB_SSL_CA")
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply database schema migrations")
+    parser.add_argument("--status", action="store_true", help="Show migration status and exit")
+    parser.add_argument("--to", type=int, default=None, help="Apply migrations up to this version")
+    args = parser.parse_args()
+
+    user = db_connection()
+    try:
+        if args.status:
+            for version, description, applied in status(user):
+                print(f"{version:>4}  {'applied' if applied else 'pending':<8} {description}")
+            return
+
+        applied = migrate(user, target=args.to)
+        print(f"Applied {len(applied)} migration(s)" if applied else "Schema is up to date")
+
+        # Show tables and their columns
+        user_cmd = user.cursor()
+        user_cmd.execute('SHOW TABLES;')
+        for (table,) in user_cmd.fetchall():
+            user_cmd.execute(f'SELECT * FROM {table} LIMIT 0')
+            user_cmd.fetchall()
+            print(table, [desc[0] for desc in user_cmd.description])
+    finally:
+        user.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+# migrations.py
+#
+# Versioned, idempotent schema migrations. Each migration runs once and is
+# recorded in schema_migrations; every step also checks the live schema, so
+# re-running after a partial failure is safe (MySQL DDL is not transactional).
+
+from datetime import datetime
+
+
+MIGRATIONS_TABLE = """
+CREATE TABLE IF NOT EXISTS schema_migrations(
+  version integer NOT NULL,
+  description varchar(200),
+  applied_at timestamp NULL,
+  PRIMARY KEY (version)
+);
+"""
+
+CONVERSATION_STORE = """
+CREATE TABLE IF NOT EXISTS conversation_store(
+  ID integer NOT NULL AUTO_INCREMENT,
+  chat_name varchar(60),
+  conv_id varchar(20),
+  user_id integer NOT NULL,
+  message_count integer,
+  created_at timestamp NULL,
+  updated_at timestamp NULL,
+  PRIMARY KEY (ID)
+);
+"""
+
+MESSAGE_STORE = """
+CREATE TABLE IF NOT EXISTS message_store(
+  ID integer NOT NULL AUTO_INCREMENT,
+  role varchar(20),
+  conv_id varchar(20),
+  message_no integer,
+  message_id varchar(20),
+  message text,
+  elapsed_time integer,
+  Status varchar(20),
+  created_at timestamp NULL,
+  updated_at timestamp NULL,
+  PRIMARY KEY (ID)
+);
+"""
+
+CONVERSATION_SUMMARY = """
+CREATE TABLE IF NOT EXISTS conversation_summary(
+  conv_id varchar(20) NOT NULL,
+  summary text,
+  summarized_count integer NOT NULL DEFAULT 0,
+  updated_at timestamp NULL,
+  PRIMARY KEY (conv_id)
+);
+"""
+
+# (table, index name, columns, unique)
+MESSAGE_STORE_INDEXES = [
+    ("message_store", "idx_message_store_conv_msg", ["conv_id", "message_no"], False),
+]
+CONVERSATION_STORE_INDEXES = [
+    ("conversation_store", "idx_conversation_store_user_updated", ["user_id", "updated_at"], False),
+    ("conversation_store", "idx_conversation_store_conv", ["conv_id"], False),
+]
+# (table, column, widened definition)
+ID_COLUMNS = [
+    ("conversation_store", "conv_id", "varchar(26)"),
+    ("message_store", "conv_id", "varchar(26)"),
+    ("message_store", "message_id", "varchar(26)"),
+    ("conversation_summary", "conv_id", "varchar(26) NOT NULL"),
+]
+# Number every conversation's messages 0, 1, 2, ... in insertion order. message_no used to come
+# from the client, which left duplicates and gaps that the unique index would reject.
+MESSAGE_NO_RENUMBER = """
+UPDATE message_store m
+JOIN (
+    SELECT ID, ROW_NUMBER() OVER (PARTITION BY conv_id ORDER BY ID) - 1 AS position
+    FROM message_store
+) numbered ON numbered.ID = m.ID
+SET m.message_no = numbered.position
+WHERE m.message_no IS NULL OR m.message_no <> numbered.position
+"""
+# Client retries used to store a message twice under the same message_id. Keep the ID on the
+# first copy only; the later copies stay in the history but no longer claim the ID.
+MESSAGE_ID_DEDUPLICATE = """
+UPDATE message_store m
+JOIN (
+    SELECT message_id, MIN(ID) AS first_id
+    FROM message_store
+    WHERE message_id IS NOT NULL
+    GROUP BY message_id
+    HAVING COUNT(*) > 1
+) duplicated ON duplicated.message_id = m.message_id
+SET m.message_id = NULL
+WHERE m.ID > duplicated.first_id
+"""
+# message_count used to stay at 2 and updated_at at the first turn: recount from message_store
+CONVERSATION_COUNTS_BACKFILL = """
+UPDATE conversation_store c
+JOIN (
+    SELECT conv_id, COUNT(*) AS messages, MAX(created_at) AS last_message_at
+    FROM message_store
+    GROUP BY conv_id
+) counted ON counted.conv_id = c.conv_id
+SET c.message_count = counted.messages,
+    c.updated_at = COALESCE(GREATEST(c.updated_at, counted.last_message_at), counted.last_message_at, c.updated_at)
+"""
+# Keyset pagination of the conversation list needs an updated_at on every row
+CONVERSATION_UPDATED_AT_BACKFILL = "UPDATE conversation_store SET updated_at = created_at WHERE updated_at IS NULL"
+
+
+# Schema helpers
+def index_exists(cursor, table, index_name):
+    cursor.execute(
+        "SELECT COUNT(*) FROM information_schema.statistics "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s",
+        (table, index_name),
+    )
+    return cursor.fetchone()[0] > 0
+
+
+def create_index(cursor, table, index_name, columns, unique=False):
+    if index_exists(cursor, table, index_name):
+        return
+    kind = "UNIQUE INDEX" if unique else "INDEX"
+    cursor.execute(f"CREATE {kind} {index_name} ON {table} ({', '.join(columns)})")
+
+
+def index_is_unique(cursor, table, index_name):
+    cursor.execute(
+        "SELECT MIN(NON_UNIQUE) FROM information_schema.statistics "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND index_name = %s",
+        (table, index_name),
+    )
+    row = cursor.fetchone()
+    return row is not None and row[0] == 0
+
+
+def column_is_auto_increment(cursor, table, column):
+    cursor.execute(
+        "SELECT EXTRA FROM information_schema.columns "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+        (table, column),
+    )
+    row = cursor.fetchone()
+    return row is not None and "auto_increment" in (row[0] or "").lower()
+
+
+def column_length(cursor, table, column):
+    cursor.execute(
+        "SELECT CHARACTER_MAXIMUM_LENGTH FROM information_schema.columns "
+        "WHERE table_schema = DATABASE() AND table_name = %s AND column_name = %s",
+        (table, column),
+    )
+    row = cursor.fetchone()
+    return row[0] if row else None
+
+
+# Migrations
+def migration_001_initial_schema(cursor):
+    cursor.execute(CONVERSATION_STORE)
+    cursor.execute(MESSAGE_STORE)
+
+
+def migration_002_auto_increment_ids(cursor):
+    for table in ("conversation_store", "message_store"):
+        if not column_is_auto_increment(cursor, table, "ID"):
+            cursor.execute(f"ALTER TABLE {table} MODIFY ID integer NOT NULL AUTO_INCREMENT")
+
+
+def migration_003_lookup_indexes(cursor):
+    for table, index_name, columns, unique in MESSAGE_STORE_INDEXES + CONVERSATION_STORE_INDEXES:
+        create_index(cursor, table, index_name, columns, unique)
+
+
+def migration_004_conversation_summary(cursor):
+    cursor.execute(CONVERSATION_SUMMARY)
+
+
+def migration_005_history_keyset_index(cursor):
+    create_index(cursor, "message_store", "idx_message_store_conv_id", ["conv_id", "ID"])
+
+
+# Time-ordered IDs (Chatbot/Main/ids.py) are 26 characters; existing 13-character IDs still fit
+def migration_006_time_ordered_id_columns(cursor):
+    for table, column, definition in ID_COLUMNS:
+        length = column_length(cursor, table, column)
+        if length is not None and length < 26:
+            cursor.execute(f"ALTER TABLE {table} MODIFY {column} {definition}")
+
+
+# Optimistic concurrency for chat turns: a second writer of the same (conv_id, message_no) fails
+def migration_007_unique_message_no(cursor):
+    if index_is_unique(cursor, "message_store", "idx_message_store_conv_msg"):
+        return
+    cursor.execute(MESSAGE_NO_RENUMBER)
+    if index_exists(cursor, "message_store", "idx_message_store_conv_msg"):
+        cursor.execute("DROP INDEX idx_message_store_conv_msg ON message_store")
+    create_index(cursor, "message_store", "idx_message_store_conv_msg", ["conv_id", "message_no"], unique=True)
+
+
+# Idempotent retries: a message_id is stored once, so a retried turn cannot be inserted twice
+def migration_008_unique_message_id(cursor):
+    if index_is_unique(cursor, "message_store", "idx_message_store_message_id"):
+        return
+    cursor.execute(MESSAGE_ID_DEDUPLICATE)
+    create_index(cursor, "message_store", "idx_message_store_message_id", ["message_id"], unique=True)
+
+
+# Conversation list: message_count and updated_at are now maintained with each turn
+def migration_009_backfill_conversation_counts(cursor):
+    cursor.execute(CONVERSATION_COUNTS_BACKFILL)
+    cursor.execute(CONVERSATION_UPDATED_AT_BACKFILL)
+
+
+MIGRATIONS = [
+    (1, "Create conversation_store and message_store", migration_001_initial_schema),
+    (2, "Make ID columns AUTO_INCREMENT", migration_002_auto_increment_ids),
+    (3, "Add conv_id/message_no and user_id/updated_at indexes", migration_003_lookup_indexes),
+    (4, "Create conversation_summary", migration_004_conversation_summary),
+    (5, "Add conv_id/ID index for keyset-paginated history", migration_005_history_keyset_index),
+    (6, "Widen conv_id/message_id to 26 characters for time-ordered IDs", migration_006_time_ordered_id_columns),
+    (7, "Renumber message_no and make conv_id/message_no unique", migration_007_unique_message_no),
+    (8, "Make message_id unique for idempotent retries", migration_008_unique_message_id),
+    (9, "Backfill conversation message_count and updated_at", migration_009_backfill_conversation_counts),
+]
+
+
+def applied_versions(cursor):
+    cursor.execute(MIGRATIONS_TABLE)
+    cursor.execute("SELECT version FROM schema_migrations")
+    return {row[0] for row in cursor.fetchall()}
+
+
+# Apply every pending migration in order; returns the versions applied
+def migrate(db, target=None):
+    cursor = db.cursor(buffered=True)
+    done = applied_versions(cursor)
+    applied = []
+
+    for version, description, apply in MIGRATIONS:
+        if version in done or (target is not None and version > target):
+            continue
+        print(f"Applying migration {version}: {description}")
+        apply(cursor)
+        cursor.execute(
+            "INSERT INTO schema_migrations (version, description, applied_at) VALUES (%s, %s, %s)",
+            (version, description, datetime.now()),
+        )
+        db.commit()
+        applied.append(version)
+
+    return applied
+
+
+def status(db):
+    cursor = db.cursor(buffered=True)
+    done = applied_versions(cursor)
+    return [(version, description, version in done) for version, description, _ in MIGRATIONS]
@@ -1,141 +1,366 @@
 # Chatbot.py
 
-import mysql.connector
-import os
 import sys
-import json
-from openai import OpenAI
-import string
-import random
+import asyncio
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
 from dotenv import load_dotenv
+from storage import get_store
+from ids import new_id
+from history_cache import history_cache
+from context_builder import build_context, token_counter
+from summarizer import summarizer
+from llm_client import OPENAI_API_KEY
+from providers import LLM_BACKENDS, LLMBackend, ProviderRouter, get_router
+from response_cache import get_response_cache, fingerprint
+from single_flight import completion_flight
+from rate_limiter import llm_governor, LLMOverloadedError
+from metrics import stage, record_stage, record_usage
+from tracing import span, start_span, annotate, usage_attributes
+from write_behind import write_behind
 
 load_dotenv()
 
-# Environment Variables
-DB_USER = os.getenv("DB_USER")
-DB_PASSWORD = os.getenv("DB_PASSWORD")
-DB_HOST = os.getenv("DB_HOST")
-DB_PORT = os.getenv("DB_PORT")
-DB_NAME = os.getenv("DB_NAME")
-DB_SSL_CA = os.getenv("DB_SSL_CA")
-OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-
-# Database Connection
-def db_connection():
-    return mysql.connector.connect(
-        user=DB_USER,
-        password=DB_PASSWORD,
-        host=DB_HOST,
-        port=DB_PORT,
-        database=DB_NAME,
-        ssl_ca=DB_SSL_CA
-    )
-
-# Generate Conversation ID
-def generate_random_id():
-    chars = string.ascii_lowercase + string.digits
-    parts = [8, 4]
-    return '-'.join(''.join(random.choices(chars, k=p)) for p in parts)
+@dataclass
+class ChatResult:
+    """Outcome of one chat turn, passed to callers as an object; JSON encoding happens once, at the HTTP edge."""
+    __slots__ = ("message", "conversation_id", "error")
+    message: Optional[str]
+    conversation_id: Optional[str]
+    error: Optional[str]
+
+    @classmethod
+    def success(cls, message: str, conversation_id: str):
+        return cls(message, conversation_id, None)
+
+    @classmethod
+    def failure(cls, error: str, conversation_id: Optional[str] = None):
+        return cls(None, conversation_id, error)
+
+    @property
+    def ok(self):
+        return self.error is None
+
+    def to_dict(self):
+        if not self.ok:
+            return {"error": self.error}
+        return {"message": self.message, "conversation_id": self.conversation_id}
+
+SYSTEM_PROMPT = "You are a helpful assistant. Be concise and friendly."
+COMPLETION_PARAMS = {"max_tokens": 512, "temperature": 0.7}
+# Ask for a final usage chunk so streamed turns are counted too
+STREAM_OPTIONS = {"stream_options": {"include_usage": True}}
+# (role, message) rows, followed by turns still waiting in the write-behind queue (read-your-writes)
+def merge_pending(db_rows, pending):
+    flushed_ids = {row[2] for row in db_rows}
+    rows = [(role, message) for role, message, _ in db_rows]
+    rows.extend((role, message) for message_id, role, message in pending if message_id not in flushed_ids)
+    return rows
+
+# Fetch previous messages of a conversation (served from the history cache when hot)
+def fetch_history(conversation_id: str):
+    rows = history_cache.get(conversation_id)
+    annotate({"chat.history_cache_hit": rows is not None})
+    if rows is not None:
+        return rows
+
+    # Snapshot the queue before reading, so a turn flushed in between shows up at least once
+    pending = write_behind.pending_messages(conversation_id)
+    rows = merge_pending(get_store().get_history(conversation_id), pending)
+
+    history_cache.set(conversation_id, rows)
+    return rows
+
+async def afetch_history(conversation_id: str):
+    rows = history_cache.get(conversation_id)
+    annotate({"chat.history_cache_hit": rows is not None})
+    if rows is not None:
+        return rows
+
+    pending = write_behind.pending_messages(conversation_id)
+    rows = merge_pending(await get_store().aget_history(conversation_id), pending)
+    history_cache.set(conversation_id, rows)
+    return rows
+
+# Build the prompt messages: rolling summary + unsummarized turns within the context token budget
+def build_messages(history_rows, user_message: str, summary=None, summarized_count=0):
+    return build_context(history_rows[summarized_count:], user_message, SYSTEM_PROMPT, summary=summary)
+
+# Tokens reserved against the TPM budget: prompt + maximum completion
+def estimate_tokens(messages):
+    return sum(token_counter.count_message(m) for m in messages) + COMPLETION_PARAMS["max_tokens"]
+
+# History, summary and prompt messages for one turn; history_rows already read by the caller are reused
+def prepare_messages(user_message: str, conversation_id: str, history_rows=None):
+    if not conversation_id:
+        return [], build_messages([], user_message)
+    with stage("history_fetch"), span("chat.history", {"chat.conv_id": conversation_id}) as history_span:
+        if history_rows is None:
+            history_rows = fetch_history(conversation_id)
+        summary, summarized_count = summarizer.summary_for(conversation_id)
+        history_span.set_attributes({"chat.history_rows": len(history_rows), "chat.summarized_count": summarized_count})
+    return history_rows, build_messages(history_rows, user_message, summary, summarized_count)
+
+async def aprepare_messages(user_message: str, conversation_id: str, history_rows=None):
+    if not conversation_id:
+        return [], build_messages([], user_message)
+    with stage("history_fetch"), span("chat.history", {"chat.conv_id": conversation_id}) as history_span:
+        if history_rows is None:
+            history_rows = await afetch_history(conversation_id)
+        summary, summarized_count = await summarizer.asummary_for(conversation_id)
+        history_span.set_attributes({"chat.history_rows": len(history_rows), "chat.summarized_count": summarized_count})
+    return history_rows, build_messages(history_rows, user_message, summary, summarized_count)
 
 # OpenAI Chatbot Class
 class OpenAIChatbot:
-    def __init__(self):
-        api_key = OPENAI_API_KEY
-        if not api_key:
-            print("Error: OPENAI_API_KEY not found in environment variables.")
-            sys.exit(1)
-        self.client = OpenAI(api_key=api_key)
-        self.model = "gpt-4o-mini"
-
-    def get_response(self, user_message: str, conversation_id: str):
-        try:
-            history_str = ""
+    def __init__(self, client=None, async_client=None, response_cache=None, flight=None, governor=None, router=None):
+        # Clients or a router can be injected; by default the process-wide router (shared keep-alive clients) is used
+        if router is None and (client is not None or async_client is not None):
+            router = ProviderRouter([LLMBackend("injected", client, async_client)])
+        if router is None:
+            if not OPENAI_API_KEY and not LLM_BACKENDS:
+                print("Error: OPENAI_API_KEY not found in environment variables.")
+                sys.exit(1)
+            router = get_router()
+        self.router = router
+        self.response_cache = response_cache or get_response_cache()
+        self.flight = flight or completion_flight
+        self.governor = governor or llm_governor
+
+    # A request is routed once: the cache lookup and fingerprint use the chosen backend's model, and the
+    # reply is stored under the model of the backend that actually answered (a hedge may win instead)
+    def _complete(self, messages, backend):
+        # Serve repeated prompts from the response cache
+        cached = self.response_cache.lookup(backend.model, messages, COMPLETION_PARAMS)
+        annotate({"llm.cache_hit": cached is not None})
+        if cached is not None:
+            return cached
 
-            # Fetch previous messages if conversation ID exists
-            if conversation_id:
-                db = db_connection()
-                cursor = db.cursor()
-                query = f"SELECT role, message FROM message_store WHERE conv_id = '{conversation_id}' ORDER BY ID ASC;"
-                cursor.execute(query)
-                result = cursor.fetchall()
-                db.close()
+        # Identical prompts already in flight share one upstream call
+        key = fingerprint(backend.model, messages, COMPLETION_PARAMS)
+        return self.flight.do(key, lambda: self._fetch_completion(messages, backend))
 
-                conversation_messages = []
-                for row in result:
-                    conversation_messages.append({"role": row[0], "message": row[1]})
+    def _fetch_completion(self, messages, backend):
+        # OpenAI API call, admitted and retried by the rate limiter
+        with span("llm.request", {"gen_ai.request.model": backend.model}) as request_span:
+            served, response = self.governor.call(lambda: self.router.complete(messages, COMPLETION_PARAMS, backend),
+                                                  estimate_tokens(messages))
+            request_span.set_attributes({"gen_ai.request.model": served.model, **usage_attributes(response.usage)})
+        record_usage(response.usage)
+        reply = response.choices[0].message.content
+        self.response_cache.store(served.model, messages, COMPLETION_PARAMS, reply)
+        return reply
 
-                print("Conversation Messages type: ", type(conversation_messages))
+    async def _acomplete(self, messages, backend):
+        cached = await self._acache_lookup(messages, backend.model)
+        annotate({"llm.cache_hit": cached is not None})
+        if cached is not None:
+            return cached
 
-                for i in conversation_messages:
-                    history_str += f"{i['role']}: {i['message']}\n"
-            else:
-                history_str = "It's a new conversation."
+        key = fingerprint(backend.model, messages, COMPLETION_PARAMS)
+        return await self.flight.ado(key, lambda: self._afetch_completion(messages, backend))
+
+    async def _afetch_completion(self, messages, backend):
+        with span("llm.request", {"gen_ai.request.model": backend.model}) as request_span:
+            served, response = await self.governor.acall(lambda: self.router.acomplete(messages, COMPLETION_PARAMS, backend),
+                                                         estimate_tokens(messages))
+            request_span.set_attributes({"gen_ai.request.model": served.model, **usage_attributes(response.usage)})
+        record_usage(response.usage)
+        reply = response.choices[0].message.content
+        await self._acache_store(messages, served.model, reply)
+        return reply
+
+    async def _acache_lookup(self, messages, model):
+        if self.response_cache.blocking:
+            return await asyncio.to_thread(self.response_cache.lookup, model, messages, COMPLETION_PARAMS)
+        return self.response_cache.lookup(model, messages, COMPLETION_PARAMS)
+
+    async def _acache_store(self, messages, model, reply):
+        if self.response_cache.blocking:
+            await asyncio.to_thread(self.response_cache.store, model, messages, COMPLETION_PARAMS, reply)
+        else:
+            self.response_cache.store(model, messages, COMPLETION_PARAMS, reply)
+
+    def get_response(self, user_message: str, conversation_id: str, history_rows=None):
+        try:
+            # Fetch previous messages and summary if conversation ID exists
+            history_rows, messages = prepare_messages(user_message, conversation_id, history_rows)
 
             # Always generate a new conversation ID (if none given)
             if not conversation_id:
-                conversation_id = generate_random_id()
+                conversation_id = new_id()
 
-            messages = [
-                {"role": "system", "content": "You are a helpful assistant. Be concise and friendly."},
-                {"role": "user", "content": f"The conversation history is as follows: {history_str}\nUser: {user_message}"}
-            ]
+            backend = self.router.pick()
+            with stage("llm"), span("llm.completion", {"chat.conv_id": conversation_id, "gen_ai.request.model": backend.model,
+                                                        "chat.prompt_messages": len(messages)}):
+                assistant_message = self._complete(messages, backend)
+            self.schedule_summary(conversation_id, history_rows, user_message, assistant_message)
 
-            # OpenAI API call
-            response = self.client.chat.completions.create(
-                model=self.model,
-                messages=messages,
-                max_tokens=512,
-                temperature=0.7
-            )
+            return ChatResult.success(assistant_message, conversation_id)
 
-            formatted_response = {
-                "message": response.choices[0].message.content,
-                "conversation_id": conversation_id
-            }
+        except LLMOverloadedError:
+            raise
+        except Exception as e:
+            return ChatResult.failure(str(e))
+
+    async def aget_response(self, user_message: str, conversation_id: str, history_rows=None):
+        """Async variant of get_response: awaits the DB and the LLM instead of blocking a worker."""
+        try:
+            history_rows, messages = await aprepare_messages(user_message, conversation_id, history_rows)
+
+            if not conversation_id:
+                conversation_id = new_id()
 
-            return json.dumps(formatted_response)
+            backend = self.router.pick()
+            with stage("llm"), span("llm.completion", {"chat.conv_id": conversation_id, "gen_ai.request.model": backend.model,
+                                                        "chat.prompt_messages": len(messages)}):
+                assistant_message = await self._acomplete(messages, backend)
+            self.schedule_summary(conversation_id, history_rows, user_message, assistant_message)
 
+            return ChatResult.success(assistant_message, conversation_id)
+
+        except LLMOverloadedError:
+            raise
         except Exception as e:
-            return json.dumps({"error": str(e)})
+            return ChatResult.failure(str(e))
 
-    def chat(self, query: str, conversation_id: str):
-        if not query or not query.strip():
-            return json.dumps({"error": "No message provided"})
+    def schedule_summary(self, conversation_id: str, history_rows, user_message: str, assistant_message: str):
+        # Refresh the rolling summary in the background every SUMMARY_EVERY_TURNS turns
+        if conversation_id and history_rows:
+            rows = list(history_rows) + [("user", user_message), ("assistant", assistant_message)]
+            summarizer.maybe_schedule(conversation_id, rows, self.router)
+
+    def record_reply(self, conversation_id: str, history_rows, messages, user_message: str, assistant_message: str, model: str):
+        """Book a reply produced outside get_response (e.g. by the OpenAI Batch API): response cache and summary schedule."""
+        self.response_cache.store(model, messages, COMPLETION_PARAMS, assistant_message)
+        self.schedule_summary(conversation_id, history_rows, user_message, assistant_message)
+
+    def stream_response(self, user_message: str, conversation_id: str, history_rows=None):
+        """Yield the assistant reply token by token (stream=True completion)."""
+        history_rows, messages = prepare_messages(user_message, conversation_id, history_rows)
+
+        start = time.monotonic()
+        backend = self.router.pick()
+        # The span outlives single iterations of this generator, so it is ended explicitly instead of used as a with-block
+        llm_span = start_span("llm.stream", {"chat.conv_id": conversation_id, "gen_ai.request.model": backend.model,
+                                             "chat.prompt_messages": len(messages)})
+        try:
+            cached = self.response_cache.lookup(backend.model, messages, COMPLETION_PARAMS)
+            llm_span.set_attribute("llm.cache_hit", cached is not None)
+            if cached is not None:
+                record_stage("llm_first_token", time.monotonic() - start)
+                record_stage("llm", time.monotonic() - start)
+                yield cached
+                self.schedule_summary(conversation_id, history_rows, user_message, cached)
+                return
+
+            tokens = estimate_tokens(messages)
+            self.governor.acquire(tokens)
+            try:
+                served, stream = self.governor.with_retries(
+                    lambda: self.router.stream(messages, {**COMPLETION_PARAMS, **STREAM_OPTIONS}, backend))
+                llm_span.set_attribute("gen_ai.request.model", served.model)
+                parts = []
+                for chunk in stream:
+                    record_usage(chunk.usage)
+                    llm_span.set_attributes(usage_attributes(chunk.usage))
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if not parts:
+                            record_stage("llm_first_token", time.monotonic() - start)
+                        parts.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+            finally:
+                self.governor.release(tokens)
+            record_stage("llm", time.monotonic() - start)
+        finally:
+            llm_span.end()
+        reply = "".join(parts)
+        self.response_cache.store(served.model, messages, COMPLETION_PARAMS, reply)
+        self.schedule_summary(conversation_id, history_rows, user_message, reply)
 
-        response = self.get_response(query, conversation_id)
+    async def astream_response(self, user_message: str, conversation_id: str, history_rows=None):
+        """Async variant of stream_response."""
+        history_rows, messages = await aprepare_messages(user_message, conversation_id, history_rows)
 
-        # Prevent JSON decoding errors
+        start = time.monotonic()
+        backend = self.router.pick()
+        llm_span = start_span("llm.stream", {"chat.conv_id": conversation_id, "gen_ai.request.model": backend.model,
+                                             "chat.prompt_messages": len(messages)})
         try:
-            response = json.loads(response)
-        except json.JSONDecodeError:
-            return json.dumps({"error": "Invalid response from OpenAI"})
+            cached = await self._acache_lookup(messages, backend.model)
+            llm_span.set_attribute("llm.cache_hit", cached is not None)
+            if cached is not None:
+                record_stage("llm_first_token", time.monotonic() - start)
+                record_stage("llm", time.monotonic() - start)
+                yield cached
+                self.schedule_summary(conversation_id, history_rows, user_message, cached)
+                return
+
+            tokens = estimate_tokens(messages)
+            await self.governor.aacquire(tokens)
+            try:
+                served, stream = await self.governor.awith_retries(
+                    lambda: self.router.astream(messages, {**COMPLETION_PARAMS, **STREAM_OPTIONS}, backend))
+                llm_span.set_attribute("gen_ai.request.model", served.model)
+                parts = []
+                async for chunk in stream:
+                    record_usage(chunk.usage)
+                    llm_span.set_attributes(usage_attributes(chunk.usage))
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        if not parts:
+                            record_stage("llm_first_token", time.monotonic() - start)
+                        parts.append(chunk.choices[0].delta.content)
+                        yield chunk.choices[0].delta.content
+            finally:
+                self.governor.release(tokens)
+            record_stage("llm", time.monotonic() - start)
+        finally:
+            llm_span.end()
+        reply = "".join(parts)
+        await self._acache_store(messages, served.model, reply)
+        self.schedule_summary(conversation_id, history_rows, user_message, reply)
+
+    def chat(self, query: str, conversation_id: str, history_rows=None) -> ChatResult:
+        if not query or not query.strip():
+            return ChatResult.failure("No message provided")
 
-        if "error" in response:
-            return json.dumps(response)
+        return self.get_response(query, conversation_id, history_rows)
 
-        return json.dumps({
-            "message": response["message"],
-            "conversation_id": response["conversation_id"]
-        })
+    async def achat(self, query: str, conversation_id: str, history_rows=None) -> ChatResult:
+        if not query or not query.strip():
+            return ChatResult.failure("No message provided")
+
+        return await self.aget_response(query, conversation_id, history_rows)
+
+_chatbot = None
+_chatbot_lock = threading.Lock()
 
-# Main Function
-def main(query: str, conversation_id: str):
+# Process-wide chatbot instance
+def get_chatbot():
+    global _chatbot
+    if _chatbot is None:
+        with _chatbot_lock:
+            if _chatbot is None:
+                _chatbot = OpenAIChatbot()
+    return _chatbot
+
+# Main Function (history_rows: the conversation's history, if the caller has already read it)
+def main(query: str, conversation_id: str, history_rows=None) -> ChatResult:
     if not query:
-        return json.dumps({"error": "No query provided"})
+        return ChatResult.failure("No query provided")
 
-    chatbot = OpenAIChatbot()
-    response = chatbot.chat(query, conversation_id)
+    return get_chatbot().chat(query, conversation_id, history_rows)
 
-    # Final safeguard in case of errors
-    try:
-        response = json.loads(response)
-        print("Response: ", response)
-    except json.JSONDecodeError:
-        return json.dumps({"error": "Failed to parse response"})
+# Async Main Function
+async def amain(query: str, conversation_id: str, history_rows=None) -> ChatResult:
+    if not query:
+        return ChatResult.failure("No query provided")
 
-    return json.dumps(response)
+    return await get_chatbot().achat(query, conversation_id, history_rows)
 
 if __name__ == "__main__":
     query = "Hello"
     conversation_id = ""
-    print(main(query, conversation_id))
+    print(main(query, conversation_id).to_dict())
@@ -0,0 +1,89 @@
+# async_db.py
+
+import asyncio
+import contextvars
+import functools
+import os
+import ssl
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+import db_pool
+from tracing import db_span
+
+try:
+    import aiomysql
+except ImportError:  # Fall back to the pooled sync driver in an executor
+    aiomysql = None
+
+load_dotenv()
+
+# Use a native async driver unless explicitly disabled
+DB_ASYNC_DRIVER = os.getenv("DB_ASYNC_DRIVER", "aiomysql" if aiomysql else "executor")
+
+_pool = None
+_pool_lock = asyncio.Lock()
+_executor = ThreadPoolExecutor(max_workers=db_pool.DB_POOL_SIZE, thread_name_prefix="db")
+
+
+async def _get_aiomysql_pool():
+    global _pool
+    if _pool is None:
+        async with _pool_lock:
+            if _pool is None:
+                ssl_ctx = ssl.create_default_context(cafile=db_pool.DB_SSL_CA) if db_pool.DB_SSL_CA else None
+                _pool = await aiomysql.create_pool(
+                    minsize=1,
+                    maxsize=db_pool.DB_POOL_SIZE,
+                    host=db_pool.DB_HOST,
+                    port=int(db_pool.DB_PORT or 3306),
+                    user=db_pool.DB_USER,
+                    password=db_pool.DB_PASSWORD,
+                    db=db_pool.DB_NAME,
+                    ssl=ssl_ctx,
+                    autocommit=False,
+                    pool_recycle=int(db_pool.DB_POOL_RECYCLE),
+                )
+    return _pool
+
+
+async def _run_in_executor(func, *args):
+    loop = asyncio.get_running_loop()
+    # Carry the caller's context (current trace span, turn timings) into the worker thread
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executor, functools.partial(context.run, func, *args))
+
+
+# Run a SELECT and return all rows
+async def fetch_all(query, params=()):
+    if DB_ASYNC_DRIVER != "aiomysql":
+        return await _run_in_executor(db_pool.fetch_all, query, params)
+
+    pool = await _get_aiomysql_pool()
+    async with pool.acquire() as conn:
+        async with conn.cursor() as cursor:
+            with db_span(query) as query_span:
+                await cursor.execute(query, params)
+                rows = await cursor.fetchall()
+                query_span.set_attribute("db.rows", len(rows))
+        # Close the implicit read transaction before the connection goes back
+        await conn.commit()
+        return rows
+
+
+# Run (query, params) statements in one transaction
+async def execute_transaction(statements):
+    if DB_ASYNC_DRIVER != "aiomysql":
+        return await _run_in_executor(db_pool.execute_transaction, statements)
+
+    pool = await _get_aiomysql_pool()
+    async with pool.acquire() as conn:
+        try:
+            async with conn.cursor() as cursor:
+                for query, params in statements:
+                    with db_span(query) as statement_span:
+                        await cursor.execute(query, params)
+                        statement_span.set_attribute("db.rows", cursor.rowcount)
+            await conn.commit()
+        except Exception:
+            await conn.rollback()
+            raise
@@ -0,0 +1,347 @@
+# batch.py
+#
+# Bulk chat processing for /chat-batch and Backend/API_Program/chat_batch.py.
+#
+# Input is JSON lines: {"conversation_id": ..., "message": ...} plus optional
+# "custom_id", "user_id" and "message_id". Lines that share a conversation_id
+# are turns of one conversation and run strictly in file order; a line without
+# one starts a new conversation. Different conversations run in parallel.
+#
+# Results are JSON lines too, in completion order (each carries its "line"):
+#   {"custom_id", "line", "status": "ok" | "error" | "skipped", "conversation_id", "message", "error"}
+# A failed turn skips the rest of its conversation, since later turns would
+# miss its context.
+#
+# Resumable: every result is appended to a checkpoint file before the next
+# turn of its conversation starts. A rerun with the same checkpoint skips the
+# lines already "ok" and retries the rest. Lines without a message_id get one
+# derived from the batch and their custom_id (assign_message_ids), so a turn
+# persisted in the instant before a crash, but not checkpointed, hits the
+# unique message_id index on the rerun and is answered from the stored turn
+# instead of being stored twice.
+#
+# Two execution modes:
+#   run_batch         live completions, at most `concurrency` conversations at a time
+#   run_openai_batch  OpenAI Batch API (/v1/files + /v1/batches), one batch per
+#                     "wave" holding the next turn of every conversation. The
+#                     submitted batch ID is checkpointed, so a rerun polls it
+#                     instead of paying for it twice.
+
+import asyncio
+import json
+import os
+import re
+from collections import OrderedDict, deque
+from dataclasses import dataclass
+from typing import Optional
+from dotenv import load_dotenv
+
+from ids import name_id
+
+load_dotenv()
+
+# Batch Settings
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))          # conversations processed at once
+BATCH_DIR = os.getenv("BATCH_DIR", "batch_jobs")                      # checkpoints of /chat-batch jobs
+BATCH_POLL_INTERVAL = float(os.getenv("BATCH_POLL_INTERVAL", "10"))   # seconds between Batch API status checks
+BATCH_COMPLETION_WINDOW = os.getenv("BATCH_COMPLETION_WINDOW", "24h")
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "100000"))         # lines accepted by /chat-batch
+
+BATCH_ENDPOINT = "/v1/chat/completions"
+BATCH_FINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+SKIPPED_ERROR = "Skipped: an earlier turn of this conversation failed"
+_BATCH_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+@dataclass
+class BatchItem:
+    line: int
+    custom_id: str
+    conversation_id: str
+    message: str
+    user_id: int = 0
+    message_id: str = ""
+
+
+# Parse JSONL input; raises ValueError naming the offending line
+def parse_batch(lines):
+    items, seen = [], set()
+    for line_no, raw in enumerate(lines, start=1):
+        if isinstance(raw, bytes):
+            raw = raw.decode()
+        if not raw.strip():
+            continue
+        try:
+            record = json.loads(raw)
+        except json.JSONDecodeError as e:
+            raise ValueError(f"Line {line_no}: invalid JSON ({e.msg})") from None
+        if not isinstance(record, dict) or not str(record.get("message") or "").strip():
+            raise ValueError(f"Line {line_no}: a non-empty \"message\" is required")
+        custom_id = str(record.get("custom_id") or f"line-{line_no}")
+        if custom_id in seen:
+            raise ValueError(f"Line {line_no}: duplicate custom_id {custom_id!r}")
+        seen.add(custom_id)
+        try:
+            user_id = int(record.get("user_id") or 0)
+        except (TypeError, ValueError):
+            raise ValueError(f"Line {line_no}: user_id must be an integer") from None
+        items.append(BatchItem(line_no, custom_id, str(record.get("conversation_id") or ""), str(record["message"]),
+                               user_id, str(record.get("message_id") or "")))
+    return items
+
+
+# Stable message_ids for a resumable batch: the same line of the same batch maps to the same ID on every run
+def assign_message_ids(items, batch_id):
+    for item in items:
+        if not item.message_id:
+            item.message_id = name_id(f"batch:{batch_id}:{item.custom_id}")
+    return items
+
+
+# Pending turns grouped by conversation, in file order; lines without a conversation_id stand alone
+def plan_conversations(items, done=()):
+    groups = OrderedDict()
+    for item in items:
+        if item.custom_id in done:
+            continue
+        key = item.conversation_id or f"new:{item.custom_id}"
+        groups.setdefault(key, deque()).append(item)
+    return groups
+
+
+def checkpoint_path(batch_id, directory=BATCH_DIR):
+    if not _BATCH_ID_PATTERN.match(batch_id):
+        raise ValueError("batch_id must be 1-64 characters of letters, digits, '-' or '_'")
+    return os.path.join(directory, f"{batch_id}.jsonl")
+
+
+class Checkpoint:
+    """Append-only JSONL of results (and submitted Batch API jobs) for resuming a batch."""
+
+    def __init__(self, path):
+        self.path = path
+        self.done = set()          # custom_ids with an "ok" result
+        self.open_batches = {}     # frozenset(custom_ids) -> Batch API batch ID not yet collected
+        self._file = None
+        if os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        batches = {}
+        with open(self.path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn final line after a crash
+                if "openai_batch" in record:
+                    batches[frozenset(record["custom_ids"])] = record["openai_batch"]
+                elif record.get("status") == "ok":
+                    self.done.add(record["custom_id"])
+        self.open_batches = {ids: batch_id for ids, batch_id in batches.items() if not ids <= self.done}
+
+    def _write(self, record):
+        if self._file is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            self._file = open(self.path, "a")
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def record(self, result):
+        self._write(result)
+        if result["status"] == "ok":
+            self.done.add(result["custom_id"])
+
+    def record_openai_batch(self, batch_id, custom_ids):
+        self._write({"openai_batch": batch_id, "custom_ids": list(custom_ids)})
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def result_record(item, status, conversation_id=None, message=None, error: Optional[str] = None):
+    return {"custom_id": item.custom_id, "line": item.line, "status": status,
+            "conversation_id": conversation_id or item.conversation_id or None, "message": message, "error": error}
+
+
+class _Results:
+    """Checkpoints each result, then hands it to the consumer of the batch."""
+
+    def __init__(self, checkpoint):
+        self.checkpoint = checkpoint
+        self.queue = asyncio.Queue()
+
+    def put(self, result):
+        if self.checkpoint is not None:
+            self.checkpoint.record(result)
+        self.queue.put_nowait(result)
+
+    def fail(self, items, error):
+        items = list(items)
+        self.put(result_record(items[0], "error", error=error))
+        for item in items[1:]:
+            self.put(result_record(item, "skipped", error=SKIPPED_ERROR))
+
+
+# Live mode. turn(item, conversation_id, message_count) -> (conversation_id, reply) is awaited;
+# message_count(conversation_id) -> messages already stored for an existing conversation (sync).
+async def run_batch(items, turn, message_count, checkpoint=None, concurrency=BATCH_CONCURRENCY):
+    groups = plan_conversations(items, checkpoint.done if checkpoint is not None else ())
+    conversations = iter(groups.values())
+    results = _Results(checkpoint)
+
+    async def worker():
+        # Each worker takes whole conversations, so turns of one conversation never overlap
+        for turns in conversations:
+            conversation_id = turns[0].conversation_id
+            try:
+                count = await asyncio.to_thread(message_count, conversation_id) if conversation_id else 0
+            except Exception as e:
+                results.fail(turns, str(e))
+                continue
+            while turns:
+                item = turns[0]
+                try:
+                    conversation_id, reply = await turn(item, conversation_id, count)
+                except Exception as e:
+                    results.fail(turns, str(e))
+                    break
+                turns.popleft()
+                count += 2
+                results.put(result_record(item, "ok", conversation_id, reply))
+
+    async for result in _drain(results, [worker() for _ in range(max(1, min(concurrency, len(groups))))]):
+        yield result
+
+
+# Yield results while the producers run; cancel them if the consumer goes away
+async def _drain(results, producers):
+    tasks = [asyncio.ensure_future(producer) for producer in producers]
+    finished = asyncio.ensure_future(asyncio.gather(*tasks))
+    getter = None
+    try:
+        while True:
+            getter = asyncio.ensure_future(results.queue.get())
+            await asyncio.wait({getter, finished}, return_when=asyncio.FIRST_COMPLETED)
+            if getter.done():
+                yield getter.result()
+                continue
+            getter.cancel()
+            while not results.queue.empty():
+                yield results.queue.get_nowait()
+            finished.result()  # surface a crashed producer
+            return
+    finally:
+        if getter is not None and not getter.done():
+            getter.cancel()
+        for task in tasks:
+            task.cancel()
+        if not finished.done():
+            finished.cancel()
+
+
+# OpenAI Batch API mode.
+#   prepare(item, conversation_id) -> (messages, context)       builds the prompt (sync)
+#   finish(item, conversation_id, message_count, context, reply) -> conversation_id   persists the turn (sync)
+# `client` is a sync OpenAI client; `params` are the completion parameters for every request.
+async def run_openai_batch(items, prepare, finish, message_count, client, model, params, checkpoint=None,
+                           poll_interval=BATCH_POLL_INTERVAL, completion_window=BATCH_COMPLETION_WINDOW):
+    groups = plan_conversations(items, checkpoint.done if checkpoint is not None else ())
+    results = _Results(checkpoint)
+    open_batches = dict(checkpoint.open_batches) if checkpoint is not None else {}
+
+    async def waves():
+        state = {}  # conversation key -> [conversation_id, message_count]
+        for key, turns in list(groups.items()):
+            conversation_id = turns[0].conversation_id
+            try:
+                state[key] = [conversation_id, await asyncio.to_thread(message_count, conversation_id) if conversation_id else 0]
+            except Exception as e:
+                results.fail(turns, str(e))
+                del groups[key]
+
+        while groups:
+            # One wave: the next pending turn of every conversation
+            wave, lines = [], []
+            for key, turns in list(groups.items()):
+                item = turns[0]
+                try:
+                    messages, context = await asyncio.to_thread(prepare, item, state[key][0])
+                except Exception as e:
+                    results.fail(turns, str(e))
+                    del groups[key]
+                    continue
+                wave.append((key, item, context))
+                lines.append(json.dumps({"custom_id": item.custom_id, "method": "POST", "url": BATCH_ENDPOINT,
+                                         "body": {"model": model, "messages": messages, **params}}))
+            if not wave:
+                return
+
+            custom_ids = frozenset(item.custom_id for _, item, _ in wave)
+            batch_id = open_batches.pop(custom_ids, None)
+            if batch_id is None:
+                batch_id = await asyncio.to_thread(_submit_openai_batch, client, "\n".join(lines) + "\n", completion_window)
+                if checkpoint is not None:
+                    checkpoint.record_openai_batch(batch_id, custom_ids)
+            replies, errors = await _collect_openai_batch(client, batch_id, poll_interval)
+
+            for key, item, context in wave:
+                turns = groups[key]
+                reply = replies.get(item.custom_id)
+                if reply is None:
+                    results.fail(turns, errors.get(item.custom_id) or errors.get("*", "No result in the batch output"))
+                    del groups[key]
+                    continue
+                conversation_id, count = state[key]
+                try:
+                    conversation_id = await asyncio.to_thread(finish, item, conversation_id, count, context, reply)
+                except Exception as e:
+                    results.fail(turns, str(e))
+                    del groups[key]
+                    continue
+                state[key] = [conversation_id, count + 2]
+                turns.popleft()
+                results.put(result_record(item, "ok", conversation_id, reply))
+                if not turns:
+                    del groups[key]
+
+    async for result in _drain(results, [waves()]):
+        yield result
+
+
+def _submit_openai_batch(client, body, completion_window):
+    upload = client.files.create(file=("chat_batch.jsonl", body.encode()), purpose="batch")
+    batch = client.batches.create(input_file_id=upload.id, endpoint=BATCH_ENDPOINT, completion_window=completion_window)
+    return batch.id
+
+
+# Wait for a batch to finish; returns ({custom_id: reply}, {custom_id: error})
+async def _collect_openai_batch(client, batch_id, poll_interval):
+    while True:
+        batch = await asyncio.to_thread(client.batches.retrieve, batch_id)
+        if batch.status in BATCH_FINAL_STATUSES:
+            break
+        await asyncio.sleep(poll_interval)
+
+    replies, errors = {}, {}
+    for file_id in (batch.output_file_id, batch.error_file_id):
+        if not file_id:
+            continue
+        content = await asyncio.to_thread(client.files.content, file_id)
+        for line in content.text.splitlines():
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code", 200) != 200:
+                error = record.get("error") or (response.get("body") or {}).get("error") or f"HTTP {response.get('status_code')}"
+                errors[record["custom_id"]] = error.get("message", str(error)) if isinstance(error, dict) else str(error)
+            else:
+                replies[record["custom_id"]] = response["body"]["choices"][0]["message"]["content"]
+    if batch.status != "completed":
+        errors["*"] = f"Batch {batch_id} ended with status {batch.status}"
+    return replies, errors
@@ -0,0 +1,98 @@
+# context_builder.py
+
+import os
+import threading
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+try:
+    import tiktoken
+except ImportError:  # Fall back to a character-based estimate
+    tiktoken = None
+
+load_dotenv()
+
+# Context Settings
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))  # prompt tokens for system + history + user message
+TOKEN_COUNT_CACHE_SIZE = int(os.getenv("TOKEN_COUNT_CACHE_SIZE", "50000"))
+
+# Every chat message costs a few tokens of framing on top of its content
+MESSAGE_OVERHEAD_TOKENS = 4
+CHAT_ROLES = ("system", "user", "assistant")
+
+
+class TokenCounter:
+    """Counts tokens with tiktoken and remembers the count per message text."""
+
+    def __init__(self, model="gpt-4o-mini", max_entries=TOKEN_COUNT_CACHE_SIZE):
+        self.model = model
+        self.max_entries = max_entries
+        self._encoding = None
+        self._encoding_loaded = False
+        self._counts = OrderedDict()
+        self._lock = threading.Lock()
+        self._encoding_lock = threading.Lock()
+
+    def _get_encoding(self):
+        # Load once: tiktoken may fetch the BPE file over the network, so concurrent first callers must not all try
+        if not self._encoding_loaded:
+            with self._encoding_lock:
+                if not self._encoding_loaded:
+                    if tiktoken is not None:
+                        try:
+                            self._encoding = tiktoken.encoding_for_model(self.model)
+                        except Exception:
+                            try:
+                                self._encoding = tiktoken.get_encoding("o200k_base")
+                            except Exception:
+                                self._encoding = None
+                    self._encoding_loaded = True
+        return self._encoding
+
+    def _count(self, text):
+        encoding = self._get_encoding()
+        if encoding is None:
+            return max(1, len(text) // 4)
+        return len(encoding.encode(text, disallowed_special=()))
+
+    def count(self, text):
+        text = text or ""
+        with self._lock:
+            cached = self._counts.get(text)
+            if cached is not None:
+                self._counts.move_to_end(text)
+                return cached
+
+        tokens = self._count(text)
+        with self._lock:
+            self._counts[text] = tokens
+            if len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+        return tokens
+
+    def count_message(self, message):
+        return self.count(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+token_counter = TokenCounter()
+
+
+# Build role-separated messages that fit the token budget, keeping the most recent turns
+def build_context(history_rows, user_message, system_prompt, budget=CONTEXT_TOKEN_BUDGET, counter=token_counter, summary=None):
+    system = [{"role": "system", "content": system_prompt}]
+    if summary:
+        system.append({"role": "system", "content": f"Summary of the earlier conversation: {summary}"})
+    user = {"role": "user", "content": user_message}
+    remaining = budget - sum(counter.count_message(m) for m in system) - counter.count_message(user)
+
+    history = []
+    for role, message in reversed(history_rows):
+        entry = {"role": role if role in CHAT_ROLES else "user", "content": message or ""}
+        tokens = counter.count_message(entry)
+        if tokens > remaining:
+            break
+        history.append(entry)
+        remaining -= tokens
+
+    history.reverse()
+    return system + history + [user]
@@ -0,0 +1,264 @@
+# db_pool.py
+
+import os
+import queue
+import threading
+import time
+from collections import OrderedDict
+import mysql.connector
+from dotenv import load_dotenv
+from tracing import db_span
+
+load_dotenv()
+
+# Environment Variables
+DB_USER = os.getenv("DB_USER")
+DB_PASSWORD = os.getenv("DB_PASSWORD")
+DB_HOST = os.getenv("DB_HOST")
+DB_PORT = os.getenv("DB_PORT")
+DB_NAME = os.getenv("DB_NAME")
+DB_SSL_CA = os.getenv("DB_SSL_CA")
+
+# Pool Settings
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))    # seconds to wait for a free connection
+DB_POOL_RECYCLE = float(os.getenv("DB_POOL_RECYCLE", "1800"))  # seconds before a connection is replaced
+DB_PREPARED_STATEMENTS = os.getenv("DB_PREPARED_STATEMENTS", "true").lower() in ("1", "true", "yes")
+DB_PREPARED_PER_CONNECTION = 32  # prepared statements kept open per connection (LRU)
+
+
+class PoolTimeoutError(Exception):
+    """Raised when no connection becomes available within the pool timeout."""
+
+
+class PooledConnection:
+    """Wraps a raw MySQL connection so that close() hands it back to the pool."""
+
+    def __init__(self, pool, raw):
+        self._pool = pool
+        self._raw = raw
+        self.created_at = time.monotonic()
+        self._checked_out = False
+        self._prepared = OrderedDict()  # query -> server-side prepared cursor
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    # Cursor for one statement: prepared once per connection and reused while the connection lives
+    def statement_cursor(self, query):
+        if not DB_PREPARED_STATEMENTS:
+            return self._raw.cursor()
+        cursor = self._prepared.get(query)
+        if cursor is not None:
+            self._prepared.move_to_end(query)
+            return cursor
+        cursor = self._prepared[query] = self._raw.cursor(prepared=True)
+        if len(self._prepared) > DB_PREPARED_PER_CONNECTION:
+            _, evicted = self._prepared.popitem(last=False)
+            try:
+                evicted.close()
+            except Exception:
+                pass
+        return cursor
+
+    def close(self):
+        if self._checked_out:
+            self._checked_out = False
+            self._pool._release(self)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            try:
+                self._raw.rollback()
+            except Exception:
+                pass
+        self.close()
+
+
+class ConnectionPool:
+    """Size-bounded MySQL connection pool shared by the API and the chatbot core.
+
+    Connections are health-checked on checkout and replaced once they are older
+    than ``recycle`` seconds, so a steady stream of requests opens no new
+    connections.
+    """
+
+    def __init__(self, connect, size=DB_POOL_SIZE, timeout=DB_POOL_TIMEOUT, recycle=DB_POOL_RECYCLE):
+        self._connect = connect
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._opened = 0
+
+        # Stats
+        self.connections_created = 0
+        self.connections_recycled = 0
+        self.connections_failed_check = 0
+        self.checkouts = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def _new_connection(self):
+        conn = PooledConnection(self, self._connect())
+        with self._lock:
+            self.connections_created += 1
+        return conn
+
+    def _discard(self, conn):
+        try:
+            conn._raw.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._opened -= 1
+
+    def _is_healthy(self, conn):
+        try:
+            conn._raw.ping(reconnect=False)
+            return True
+        except Exception:
+            return False
+
+    def get_connection(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        conn = None
+
+        while conn is None:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                # Open a new connection if we are still below the size bound
+                with self._lock:
+                    can_open = self._opened < self.size
+                    if can_open:
+                        self._opened += 1
+                if can_open:
+                    try:
+                        conn = self._new_connection()
+                    except Exception:
+                        with self._lock:
+                            self._opened -= 1
+                        raise
+                    break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    raise PoolTimeoutError(f"No database connection available after {self.timeout}s")
+                try:
+                    conn = self._idle.get(timeout=remaining)
+                except queue.Empty:
+                    raise PoolTimeoutError(f"No database connection available after {self.timeout}s")
+
+            # Recycle stale connections
+            if time.monotonic() - conn.created_at > self.recycle:
+                self._discard(conn)
+                with self._lock:
+                    self.connections_recycled += 1
+                conn = None
+                continue
+
+            # Health check on checkout
+            if not self._is_healthy(conn):
+                self._discard(conn)
+                with self._lock:
+                    self.connections_failed_check += 1
+                conn = None
+
+        waited = time.monotonic() - start
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait_time += waited
+            self.max_wait_time = max(self.max_wait_time, waited)
+
+        conn._checked_out = True
+        return conn
+
+    def _release(self, conn):
+        # Never hand back a connection with an open transaction
+        try:
+            if conn._raw.in_transaction:
+                conn._raw.rollback()
+        except Exception:
+            self._discard(conn)
+            return
+        self._idle.put(conn)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "open": self._opened,
+                "idle": self._idle.qsize(),
+                "checkouts": self.checkouts,
+                "connections_created": self.connections_created,
+                "connections_recycled": self.connections_recycled,
+                "connections_failed_check": self.connections_failed_check,
+                "avg_wait_ms": (self.total_wait_time / self.checkouts * 1000) if self.checkouts else 0.0,
+                "max_wait_ms": self.max_wait_time * 1000,
+            }
+
+
+def _mysql_connect():
+    return mysql.connector.connect(
+        user=DB_USER,
+        password=DB_PASSWORD,
+        host=DB_HOST,
+        port=DB_PORT,
+        database=DB_NAME,
+        ssl_ca=DB_SSL_CA
+    )
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(_mysql_connect)
+    return _pool
+
+
+# Database Connection (pooled)
+def db_connection():
+    return get_pool().get_connection()
+
+
+# Run a SELECT on a pooled connection and return all rows
+def fetch_all(query, params=(), attributes=None):
+    db = db_connection()
+    try:
+        cursor = db.statement_cursor(query)
+        with db_span(query, attributes) as query_span:
+            cursor.execute(query, params)
+            rows = cursor.fetchall()
+            query_span.set_attribute("db.rows", len(rows))
+        return rows
+    finally:
+        db.close()
+
+
+# Run (query, params) statements in one transaction on a pooled connection
+def execute_transaction(statements):
+    db = db_connection()
+    try:
+        for query, params in statements:
+            cursor = db.statement_cursor(query)
+            with db_span(query) as statement_span:
+                cursor.execute(query, params)
+                statement_span.set_attribute("db.rows", cursor.rowcount)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
@@ -0,0 +1,89 @@
+# history_cache.py
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Cache Settings
+HISTORY_CACHE_SIZE = int(os.getenv("HISTORY_CACHE_SIZE", "1000"))    # conversations kept in memory
+HISTORY_CACHE_TTL = float(os.getenv("HISTORY_CACHE_TTL", "900"))     # seconds an entry stays valid
+
+
+class HistoryCache:
+    """LRU + TTL cache of (role, message) rows per conv_id.
+
+    Filled on a read miss and kept current by write-through after each chat
+    turn is committed, so a hot conversation needs no history SELECT.
+    """
+
+    def __init__(self, max_entries=HISTORY_CACHE_SIZE, ttl=HISTORY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # conv_id -> (expires_at, [(role, message), ...])
+        self._lock = threading.Lock()
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, conv_id):
+        with self._lock:
+            entry = self._entries.get(conv_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[conv_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(conv_id)
+            self.hits += 1
+            return list(entry[1])
+
+    def set(self, conv_id, rows):
+        with self._lock:
+            self._entries[conv_id] = (time.monotonic() + self.ttl, [tuple(row) for row in rows])
+            self._entries.move_to_end(conv_id)
+            self._evict()
+
+    def append(self, conv_id, rows, new_conversation=False):
+        """Write-through after a commit. Unknown conversations are only cached when new."""
+        with self._lock:
+            entry = self._entries.get(conv_id)
+            if entry is not None and entry[0] >= time.monotonic():
+                cached = entry[1] + [tuple(row) for row in rows]
+            elif new_conversation:
+                cached = [tuple(row) for row in rows]
+            else:
+                self._entries.pop(conv_id, None)
+                return
+            self._entries[conv_id] = (time.monotonic() + self.ttl, cached)
+            self._entries.move_to_end(conv_id)
+            self._evict()
+
+    def invalidate(self, conv_id):
+        with self._lock:
+            self._entries.pop(conv_id, None)
+
+    def _evict(self):
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+history_cache = HistoryCache()
@@ -0,0 +1,84 @@
+# idempotency.py
+
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Idempotency Settings
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))  # recent turns kept by message_id
+IDEMPOTENCY_CACHE_TTL = float(os.getenv("IDEMPOTENCY_CACHE_TTL", "600"))    # seconds a retry is answered from memory
+
+
+@dataclass(frozen=True)
+class StoredTurn:
+    """A completed turn, as returned again to a retry of the same message_id (field order of get_turn rows)."""
+
+    conversation_id: str
+    user_id: int
+    message: str  # the user message; a retry must resend the same text
+    reply: str
+
+    def matches(self, user_id, message):
+        return self.user_id == user_id and self.message == message
+
+
+class IdempotencyCache:
+    """LRU + TTL map from a client message_id to the turn it produced.
+
+    Filled when a turn is persisted (or queued for write-behind), so a client
+    retry after a timeout is answered with the original reply by one lookup,
+    without history reads or another completion. Older retries fall back to
+    the unique message_id index in the database.
+    """
+
+    def __init__(self, max_entries=IDEMPOTENCY_CACHE_SIZE, ttl=IDEMPOTENCY_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # message_id -> (expires_at, StoredTurn)
+        self._lock = threading.Lock()
+
+        # Stats
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, message_id):
+        with self._lock:
+            entry = self._entries.get(message_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[message_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(message_id)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, message_id, turn):
+        with self._lock:
+            self._entries[message_id] = (time.monotonic() + self.ttl, turn)
+            self._entries.move_to_end(message_id)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            }
+
+
+idempotency_cache = IdempotencyCache()
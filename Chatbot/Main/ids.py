@@ -0,0 +1,120 @@
+# ids.py
+#
+# Time-ordered IDs for conv_id and message_id (stdlib only, so the Streamlit
+# apps can import it too).
+#
+# Layout is UUIDv7 (RFC 9562): 48-bit Unix milliseconds, version 7, a 12-bit
+# per-millisecond counter (randomly seeded each millisecond), the variant bits
+# and 62 random bits from os.urandom. IDs from one process are strictly
+# increasing; across processes they collide only if both the millisecond and
+# the 74 counter/random bits match.
+#
+# Text form is 26 Crockford base32 characters (ULID alphabet), which sort in
+# time order, so new keys land at the right edge of a B-tree index. Binary
+# form is the 16 raw bytes, for BINARY(16) columns.
+
+import base64
+import hashlib
+import os
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+ID_LENGTH = 26
+_ALPHABET = "0123456789ABCDEFGHJKMNPQRSTVWXYZ"
+_RFC4648 = "ABCDEFGHIJKLMNOPQRSTUVWXYZ234567"
+_TO_CROCKFORD = str.maketrans(_RFC4648, _ALPHABET)
+# I, L, O and U are not Crockford digits; map them to a character b32decode rejects
+_FROM_CROCKFORD = str.maketrans(_ALPHABET + _ALPHABET.lower() + "ILOUilou", _RFC4648 + _RFC4648.lower() + "!" * 8)
+
+_COUNTER_BITS = 12
+_COUNTER_MAX = (1 << _COUNTER_BITS) - 1
+_RANDOM_BITS = 62
+_VERSION = 0x7
+_VARIANT = 0b10
+
+
+class IdGenerator:
+    """Monotonic UUIDv7 generator; thread-safe."""
+
+    def __init__(self, clock=time.time_ns):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._last_ms = -1
+        self._counter = 0
+
+    def _seed_counter(self):
+        # Random start with the top bit clear leaves at least 2048 IDs of headroom per millisecond
+        return int.from_bytes(os.urandom(2), "big") & (_COUNTER_MAX >> 1)
+
+    def next_int(self):
+        random_bits = int.from_bytes(os.urandom(8), "big") >> (64 - _RANDOM_BITS)
+        now_ms = self._clock() // 1_000_000
+        with self._lock:
+            if now_ms > self._last_ms:
+                self._last_ms, self._counter = now_ms, self._seed_counter()
+            elif self._counter < _COUNTER_MAX:
+                # Same millisecond (or the clock stepped back): keep counting from the last timestamp
+                self._counter += 1
+            else:
+                # Counter exhausted: borrow the next millisecond rather than repeat or go backwards
+                self._last_ms, self._counter = self._last_ms + 1, self._seed_counter()
+            timestamp_ms, counter = self._last_ms, self._counter
+        return (timestamp_ms << 80) | (_VERSION << 76) | (counter << 64) | (_VARIANT << 62) | random_bits
+
+
+_generator = IdGenerator()
+
+
+# 128-bit value -> 26 base32 characters. base64's encoder works on 40-bit groups, so the
+# value is left-padded to 160 bits and the 6 leading (zero) characters are dropped.
+def encode(value):
+    return base64.b32encode(value.to_bytes(20, "big"))[6:].decode().translate(_TO_CROCKFORD)
+
+
+def decode(text):
+    if len(text) != ID_LENGTH:
+        raise ValueError(f"Expected a {ID_LENGTH}-character ID, got {len(text)} characters")
+    try:
+        value = int.from_bytes(base64.b32decode("AAAAAA" + text.translate(_FROM_CROCKFORD).upper()), "big")
+    except ValueError:
+        raise ValueError(f"Invalid characters in ID {text!r}") from None
+    if value >> 128:
+        raise ValueError("ID out of range")
+    return value
+
+
+# New time-ordered ID as 26 sortable characters
+def new_id():
+    return encode(_generator.next_int())
+
+
+# Deterministic ID for a name, for keys that must come out the same on every run (UUIDv8
+# layout: 122 bits of SHA-256 plus the version and variant bits). Not time-ordered.
+def name_id(name):
+    value = int.from_bytes(hashlib.sha256(name.encode()).digest()[:16], "big")
+    value &= ~((0xF << 76) | (0b11 << 62))
+    return encode(value | (0x8 << 76) | (_VARIANT << 62))
+
+
+# New time-ordered ID as 16 bytes (BINARY(16) storage)
+def new_id_bytes():
+    return _generator.next_int().to_bytes(16, "big")
+
+
+def to_bytes(text):
+    return decode(text).to_bytes(16, "big")
+
+
+def from_bytes(raw):
+    return encode(int.from_bytes(raw, "big"))
+
+
+def to_uuid(text):
+    return uuid.UUID(int=decode(text))
+
+
+# Creation time encoded in an ID
+def id_timestamp(text):
+    return datetime.fromtimestamp((decode(text) >> 80) / 1000, tz=timezone.utc)
@@ -0,0 +1,150 @@
+# keyed_lock.py
+
+import asyncio
+import os
+import threading
+from collections import deque
+from contextlib import contextmanager, asynccontextmanager
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Conversation Lock Settings
+CONVERSATION_LOCK_TIMEOUT = float(os.getenv("CONVERSATION_LOCK_TIMEOUT", "120"))  # seconds a turn waits for the previous one
+
+
+class LockTimeoutError(Exception):
+    """Raised when a key stays locked longer than the caller is willing to wait."""
+
+
+class _ThreadWaiter:
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+        self.abandoned = False
+
+    def grant(self):
+        self.granted = True
+        self.event.set()
+
+
+class _TaskWaiter:
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.future = self.loop.create_future()
+        self.granted = False
+        self.abandoned = False
+
+    def grant(self):
+        self.granted = True
+        # Release may happen on another thread (sync holders share the lock)
+        self.loop.call_soon_threadsafe(lambda: self.future.done() or self.future.set_result(None))
+
+
+class _Entry:
+    __slots__ = ("waiters",)
+
+    def __init__(self):
+        self.waiters = deque()
+
+
+class KeyedLock:
+    """One FIFO mutex per key, shared by threads and coroutines.
+
+    Holders of different keys never contend. Waiters on a key are served in
+    arrival order and the lock is handed over directly on release, so turns of
+    one conversation run in the order they arrived. A key's entry exists only
+    while it is held or awaited. Ownership is not tied to a thread, so a
+    generator may acquire on one worker thread and release on another.
+    """
+
+    def __init__(self, timeout=CONVERSATION_LOCK_TIMEOUT):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._held = {}  # key -> _Entry
+
+        # Stats
+        self.acquired = 0
+        self.contended = 0
+        self.timeouts = 0
+
+    # Take the key if free; otherwise queue a waiter (returns None when acquired immediately)
+    def _enter(self, key, waiter_type):
+        with self._lock:
+            entry = self._held.get(key)
+            if entry is None:
+                self._held[key] = _Entry()
+                self.acquired += 1
+                return None
+            waiter = waiter_type()
+            entry.waiters.append(waiter)
+            self.contended += 1
+            return waiter
+
+    # Hand the key to the next live waiter, or free it
+    def _release(self, key):
+        with self._lock:
+            entry = self._held[key]
+            while entry.waiters:
+                waiter = entry.waiters.popleft()
+                if not waiter.abandoned:
+                    self.acquired += 1
+                    waiter.grant()
+                    return
+            del self._held[key]
+
+    # Give up waiting; returns True if the key was granted in the meantime (the caller then owns it)
+    def _abandon(self, key, waiter, timed_out=True):
+        with self._lock:
+            if waiter.granted:
+                return True
+            waiter.abandoned = True
+            self.timeouts += 1 if timed_out else 0
+            return False
+
+    @contextmanager
+    def hold(self, key, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        waiter = self._enter(key, _ThreadWaiter)
+        if waiter is not None and not waiter.event.wait(timeout) and not self._abandon(key, waiter):
+            raise LockTimeoutError(f"Timed out after {timeout:g}s waiting for {key!r}")
+        try:
+            yield
+        finally:
+            self._release(key)
+
+    @asynccontextmanager
+    async def ahold(self, key, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        waiter = self._enter(key, _TaskWaiter)
+        if waiter is not None:
+            try:
+                await asyncio.wait_for(asyncio.shield(waiter.future), timeout)
+            except asyncio.TimeoutError:
+                if not self._abandon(key, waiter):
+                    raise LockTimeoutError(f"Timed out after {timeout:g}s waiting for {key!r}") from None
+            except asyncio.CancelledError:
+                if self._abandon(key, waiter, timed_out=False):
+                    self._release(key)
+                raise
+        try:
+            yield
+        finally:
+            self._release(key)
+
+    def locked(self, key):
+        with self._lock:
+            return key in self._held
+
+    def stats(self):
+        with self._lock:
+            return {
+                "held": len(self._held),
+                "waiting": sum(not waiter.abandoned for entry in self._held.values() for waiter in entry.waiters),
+                "acquired": self.acquired,
+                "contended": self.contended,
+                "timeouts": self.timeouts,
+            }
+
+
+conversation_locks = KeyedLock()
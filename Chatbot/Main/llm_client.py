@@ -0,0 +1,136 @@
+# llm_client.py
+
+import os
+import threading
+import httpx
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Environment Variables
+OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL")  # Optional, e.g. an OpenAI-compatible server
+
+# HTTP Pool Settings
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", "100"))
+OPENAI_MAX_KEEPALIVE = int(os.getenv("OPENAI_MAX_KEEPALIVE", "20"))
+OPENAI_KEEPALIVE_EXPIRY = float(os.getenv("OPENAI_KEEPALIVE_EXPIRY", "60"))
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", "true").lower() in ("1", "true", "yes")
+
+try:
+    import h2  # noqa: F401
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+class ConnectionReuseStats:
+    """Counts requests against newly opened TCP connections to derive a reuse rate."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_new_connection(self):
+        with self._lock:
+            self.new_connections += 1
+
+    def stats(self):
+        with self._lock:
+            reused = max(self.requests - self.new_connections, 0)
+            return {
+                "requests": self.requests,
+                "new_connections": self.new_connections,
+                "reuse_rate": (reused / self.requests) if self.requests else 0.0,
+            }
+
+
+reuse_stats = ConnectionReuseStats()
+
+
+def _trace(event_name, info):
+    if event_name == "connection.connect_tcp.started":
+        reuse_stats.record_new_connection()
+
+
+async def _atrace(event_name, info):
+    _trace(event_name, info)
+
+
+def _on_request(request):
+    reuse_stats.record_request()
+    request.extensions["trace"] = _trace
+
+
+async def _on_request_async(request):
+    reuse_stats.record_request()
+    request.extensions["trace"] = _atrace
+
+
+def _limits():
+    return httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE,
+        keepalive_expiry=OPENAI_KEEPALIVE_EXPIRY,
+    )
+
+
+# Build a fresh sync client (tests and tools can inject their own instead)
+def create_openai_client(api_key=None, base_url=None):
+    http_client = DefaultHttpxClient(
+        http2=OPENAI_HTTP2 and HTTP2_AVAILABLE,
+        limits=_limits(),
+        event_hooks={"request": [_on_request]},
+    )
+    # Retries are handled by the LLM governor (rate_limiter.py), not the SDK
+    return OpenAI(api_key=api_key or OPENAI_API_KEY, base_url=base_url or OPENAI_BASE_URL, http_client=http_client, max_retries=0)
+
+
+# Build a fresh async client
+def create_async_openai_client(api_key=None, base_url=None):
+    http_client = DefaultAsyncHttpxClient(
+        http2=OPENAI_HTTP2 and HTTP2_AVAILABLE,
+        limits=_limits(),
+        event_hooks={"request": [_on_request_async]},
+    )
+    return AsyncOpenAI(api_key=api_key or OPENAI_API_KEY, base_url=base_url or OPENAI_BASE_URL, http_client=http_client, max_retries=0)
+
+
+_client = None
+_async_client = None
+_client_lock = threading.Lock()
+
+
+# Process-wide sync client with a warm keep-alive pool
+def get_openai_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                _client = create_openai_client()
+    return _client
+
+
+# Process-wide async client
+def get_async_openai_client():
+    global _async_client
+    if _async_client is None:
+        with _client_lock:
+            if _async_client is None:
+                _async_client = create_async_openai_client()
+    return _async_client
+
+
+def client_stats():
+    return {
+        "http2": OPENAI_HTTP2 and HTTP2_AVAILABLE,
+        "max_connections": OPENAI_MAX_CONNECTIONS,
+        "max_keepalive_connections": OPENAI_MAX_KEEPALIVE,
+        **reuse_stats.stats(),
+    }
@@ -0,0 +1,287 @@
+# providers.py
+
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import deque
+from dotenv import load_dotenv
+from llm_client import get_openai_client, get_async_openai_client, create_openai_client, create_async_openai_client
+from tracing import annotate
+
+load_dotenv()
+
+# Provider Settings
+CHAT_MODEL = os.getenv("CHAT_MODEL", "gpt-4o-mini")
+# JSON list of backends, e.g. [{"name": "local", "base_url": "http://localhost:8001/v1", "api_key": "x", "model": "llama3"}]
+LLM_BACKENDS = os.getenv("LLM_BACKENDS", "")
+LLM_HEDGE = os.getenv("LLM_HEDGE", "false").lower() in ("1", "true", "yes")
+LLM_HEDGE_MIN_SAMPLES = int(os.getenv("LLM_HEDGE_MIN_SAMPLES", "20"))  # latency samples needed before hedging
+LLM_HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "0.2"))
+LLM_BACKEND_FAILURE_THRESHOLD = int(os.getenv("LLM_BACKEND_FAILURE_THRESHOLD", "3"))
+LLM_BACKEND_COOLDOWN = float(os.getenv("LLM_BACKEND_COOLDOWN", "30"))
+
+
+class LLMBackend:
+    """One OpenAI-compatible endpoint with a rolling latency window and a simple circuit breaker."""
+
+    def __init__(self, name, client, async_client, model=CHAT_MODEL, window=200):
+        self.name = name
+        self.client = client
+        self.async_client = async_client
+        self.model = model
+        self._latencies = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+
+    def record_success(self, latency):
+        with self._lock:
+            self.requests += 1
+            self.consecutive_failures = 0
+            self._latencies.append(latency)
+
+    def record_failure(self):
+        with self._lock:
+            self.requests += 1
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.consecutive_failures >= LLM_BACKEND_FAILURE_THRESHOLD:
+                self.unhealthy_until = time.monotonic() + LLM_BACKEND_COOLDOWN
+
+    @property
+    def healthy(self):
+        return time.monotonic() >= self.unhealthy_until
+
+    @property
+    def samples(self):
+        return len(self._latencies)
+
+    def percentile(self, p):
+        with self._lock:
+            latencies = sorted(self._latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p / 100))]
+
+    def stats(self):
+        return {
+            "model": self.model,
+            "healthy": self.healthy,
+            "requests": self.requests,
+            "failures": self.failures,
+            "p50_ms": round(self.percentile(50) * 1000, 1) if self.samples else None,
+            "p95_ms": round(self.percentile(95) * 1000, 1) if self.samples else None,
+            "p99_ms": round(self.percentile(99) * 1000, 1) if self.samples else None,
+        }
+
+
+class ProviderRouter:
+    """Routes completions to the fastest healthy backend, optionally hedging slow requests.
+
+    Backends without latency samples are tried first so every backend gets
+    measured. With hedging on, an async request (arun) sends a second request
+    to the next-best backend once the primary exceeds its own p95 latency; the
+    loser is cancelled. Sync requests are never hedged: a blocking HTTP call
+    cannot be cancelled, so the loser would keep a thread and its upstream
+    request running.
+    """
+
+    def __init__(self, backends=None, hedge=LLM_HEDGE):
+        self.backends = list(backends or [])
+        self.hedge = hedge
+        self._lock = threading.Lock()
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def register(self, backend):
+        self.backends.append(backend)
+
+    def ranked(self):
+        healthy = [b for b in self.backends if b.healthy]
+        candidates = healthy or sorted(self.backends, key=lambda b: b.unhealthy_until)
+        return sorted(candidates, key=lambda b: b.percentile(50) if b.samples else 0.0)
+
+    def pick(self):
+        return self.ranked()[0]
+
+    # A caller that picked its backend up front (e.g. to key a cache on its model) keeps it,
+    # unless it has been marked unhealthy since
+    def _route(self, backend=None):
+        if backend is None or not backend.healthy:
+            return self.pick()
+        return backend
+
+    def _hedge_plan(self, backend=None):
+        primary = self._route(backend)
+        others = [b for b in self.ranked() if b is not primary]
+        if not self.hedge or not others or primary.samples < LLM_HEDGE_MIN_SAMPLES:
+            return primary, None, None
+        return primary, others[0], max(LLM_HEDGE_MIN_DELAY, primary.percentile(95))
+
+    def _timed(self, backend, call):
+        start = time.monotonic()
+        try:
+            response = call(backend)
+        except Exception:
+            backend.record_failure()
+            raise
+        backend.record_success(time.monotonic() - start)
+        return backend, response
+
+    async def _atimed(self, backend, call):
+        start = time.monotonic()
+        try:
+            response = await call(backend)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            backend.record_failure()
+            raise
+        backend.record_success(time.monotonic() - start)
+        return backend, response
+
+    def _count_hedge(self, won):
+        with self._lock:
+            self.hedged += 1
+            self.hedge_wins += 1 if won else 0
+
+    # Run call(backend) on `backend` or the best one; returns (backend that answered, result)
+    def run(self, call, backend=None):
+        backend = self._route(backend)
+        annotate({"llm.backend": backend.name})
+        return self._timed(backend, call)
+
+    # Async twin of run, hedged if enabled
+    async def arun(self, call, backend=None):
+        primary, secondary, delay = self._hedge_plan(backend)
+        annotate({"llm.backend": primary.name, "llm.hedge_backend": secondary.name if secondary else None})
+        if secondary is None:
+            return await self._atimed(primary, call)
+
+        first = asyncio.ensure_future(self._atimed(primary, call))
+        tasks = [first]
+        try:
+            done, _ = await asyncio.wait({first}, timeout=delay)
+            if done:
+                return first.result()
+
+            second = asyncio.ensure_future(self._atimed(secondary, call))
+            tasks.append(second)
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self._count_hedge(won=task is second)
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # Cancel the loser (or everything, if we were cancelled ourselves)
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    # The completion calls return (backend that answered, response)
+    def complete(self, messages, params, backend=None):
+        return self.run(lambda b: b.client.chat.completions.create(model=b.model, messages=messages, **params), backend)
+
+    async def acomplete(self, messages, params, backend=None):
+        return await self.arun(lambda b: b.async_client.chat.completions.create(model=b.model, messages=messages, **params), backend)
+
+    # Streams are never hedged; their latency sample is the time to the first chunk
+    def stream(self, messages, params, backend=None):
+        backend = self._route(backend)
+        start = time.monotonic()
+        try:
+            stream = backend.client.chat.completions.create(model=backend.model, messages=messages, stream=True, **params)
+        except Exception:
+            backend.record_failure()
+            raise
+        return backend, self._timed_stream(backend, stream, start)
+
+    async def astream(self, messages, params, backend=None):
+        backend = self._route(backend)
+        start = time.monotonic()
+        try:
+            stream = await backend.async_client.chat.completions.create(model=backend.model, messages=messages, stream=True, **params)
+        except Exception:
+            backend.record_failure()
+            raise
+        return backend, self._atimed_stream(backend, stream, start)
+
+    def _timed_stream(self, backend, stream, start):
+        first = True
+        try:
+            for chunk in stream:
+                if first:
+                    backend.record_success(time.monotonic() - start)
+                    first = False
+                yield chunk
+        except Exception:
+            if first:
+                backend.record_failure()
+            raise
+        if first:
+            backend.record_success(time.monotonic() - start)
+
+    async def _atimed_stream(self, backend, stream, start):
+        first = True
+        try:
+            async for chunk in stream:
+                if first:
+                    backend.record_success(time.monotonic() - start)
+                    first = False
+                yield chunk
+        except Exception:
+            if first:
+                backend.record_failure()
+            raise
+        if first:
+            backend.record_success(time.monotonic() - start)
+
+    def stats(self):
+        with self._lock:
+            hedged, hedge_wins = self.hedged, self.hedge_wins
+        return {
+            "hedging": self.hedge,
+            "hedged_requests": hedged,
+            "hedge_wins": hedge_wins,
+            "backends": {b.name: b.stats() for b in self.backends},
+        }
+
+
+def backends_from_config(config):
+    backends = []
+    for entry in json.loads(config):
+        api_key = entry.get("api_key") or os.getenv(entry.get("api_key_env", "OPENAI_API_KEY"))
+        backends.append(LLMBackend(
+            entry["name"],
+            create_openai_client(api_key=api_key, base_url=entry.get("base_url")),
+            create_async_openai_client(api_key=api_key, base_url=entry.get("base_url")),
+            model=entry.get("model", CHAT_MODEL),
+        ))
+    return backends
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+# Process-wide router; defaults to the single shared OpenAI client
+def get_router():
+    global _router
+    if _router is None:
+        with _router_lock:
+            if _router is None:
+                if LLM_BACKENDS:
+                    backends = backends_from_config(LLM_BACKENDS)
+                else:
+                    backends = [LLMBackend("openai", get_openai_client(), get_async_openai_client())]
+                _router = ProviderRouter(backends)
+    return _router
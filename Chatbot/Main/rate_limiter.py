@@ -0,0 +1,294 @@
+# rate_limiter.py
+
+import asyncio
+import os
+from collections import deque
+import random
+import threading
+import time
+import openai
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Limiter Settings
+LLM_RPM = float(os.getenv("LLM_RPM", "500"))                  # requests per minute
+LLM_TPM = float(os.getenv("LLM_TPM", "200000"))               # tokens per minute (prompt + max completion)
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "100"))        # callers allowed to wait for capacity
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "30"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+
+RETRYABLE_ERRORS = (openai.RateLimitError, openai.APIConnectionError, openai.APITimeoutError, openai.InternalServerError)
+
+
+class LLMOverloadedError(Exception):
+    """Raised when the LLM queue is full or capacity does not free up in time (maps to HTTP 503)."""
+
+    def __init__(self, message, retry_after=1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Continuously refilling bucket; capacity is one minute's allowance."""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated = time.monotonic()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    # Seconds until `amount` is available (0 means it can be taken now)
+    def wait_time(self, amount, now):
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def take(self, amount):
+        self.tokens -= min(amount, self.capacity)
+
+    def give_back(self, amount):
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class _Waiter:
+    """A caller queued for capacity; woken when a slot or tokens are released, or when it reaches the head."""
+
+    def __init__(self):
+        self.event = threading.Event()
+
+    def wake(self):
+        self.event.set()
+
+
+class _AsyncWaiter(_Waiter):
+    # Releases can come from worker threads, so the event is set on the waiter's own loop
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.event = asyncio.Event()
+
+    def wake(self):
+        self.loop.call_soon_threadsafe(self.event.set)
+
+
+class LLMGovernor:
+    """Client-side RPM/TPM limiter, concurrency cap and bounded wait queue for LLM calls.
+
+    Callers wait (up to LLM_QUEUE_TIMEOUT) for request, token and concurrency
+    budget and are admitted in arrival order, so a large request cannot be
+    starved by smaller ones; once LLM_MAX_QUEUE callers are already waiting,
+    new ones are shed with LLMOverloadedError. Retryable upstream errors are retried with
+    jittered exponential backoff that honors Retry-After.
+    """
+
+    def __init__(self, rpm=LLM_RPM, tpm=LLM_TPM, max_concurrency=LLM_MAX_CONCURRENCY, max_queue=LLM_MAX_QUEUE,
+                 queue_timeout=LLM_QUEUE_TIMEOUT, max_retries=LLM_MAX_RETRIES):
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.max_retries = max_retries
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._waiters = deque()
+
+        # Stats
+        self.admitted = 0
+        self.shed = 0
+        self.retries = 0
+        self.total_wait_time = 0.0
+
+    # Try to admit one call; returns seconds until the bucket has room (0 = admitted),
+    # or None when it must wait for a release or for the callers queued ahead of it
+    def _try_admit(self, tokens, waiter=None):
+        now = time.monotonic()
+        with self._lock:
+            if self._waiters and self._waiters[0] is not waiter:
+                return None
+            if self._in_flight >= self.max_concurrency:
+                return None
+            wait = max(self.requests.wait_time(1, now), self.tokens.wait_time(tokens, now))
+            if wait > 0:
+                return wait
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            self._in_flight += 1
+            self.admitted += 1
+            if waiter is not None:
+                self._waiters.popleft()
+                self._wake_head()
+            return 0.0
+
+    # Called with the lock held
+    def _wake_head(self):
+        if self._waiters:
+            self._waiters[0].wake()
+
+    def _enter_queue(self, waiter):
+        with self._lock:
+            if len(self._waiters) >= self.max_queue:
+                self.shed += 1
+                raise LLMOverloadedError("LLM request queue is full")
+            self._waiters.append(waiter)
+
+    def _leave_queue(self, waiter, waited):
+        with self._lock:
+            if waiter in self._waiters:
+                was_head = self._waiters[0] is waiter
+                self._waiters.remove(waiter)
+                if was_head:
+                    self._wake_head()
+            self.total_wait_time += waited
+
+    # Seconds to sleep before trying again; raises once capacity cannot arrive within the queue timeout
+    def _sleep_time(self, start, wait):
+        remaining = start + self.queue_timeout - time.monotonic()
+        if remaining <= 0 or (wait is not None and wait > remaining):
+            with self._lock:
+                self.shed += 1
+            raise LLMOverloadedError("Timed out waiting for LLM capacity", retry_after=wait or 1.0)
+        return remaining if wait is None else wait
+
+    def acquire(self, tokens):
+        if self._try_admit(tokens) == 0:
+            return
+        waiter = _Waiter()
+        self._enter_queue(waiter)
+        start = time.monotonic()
+        try:
+            while True:
+                waiter.event.clear()
+                wait = self._try_admit(tokens, waiter)
+                if wait == 0:
+                    return
+                waiter.event.wait(self._sleep_time(start, wait))
+        finally:
+            self._leave_queue(waiter, time.monotonic() - start)
+
+    async def aacquire(self, tokens):
+        if self._try_admit(tokens) == 0:
+            return
+        waiter = _AsyncWaiter()
+        self._enter_queue(waiter)
+        start = time.monotonic()
+        try:
+            while True:
+                waiter.event.clear()
+                wait = self._try_admit(tokens, waiter)
+                if wait == 0:
+                    return
+                sleep = self._sleep_time(start, wait)
+                try:
+                    await asyncio.wait_for(waiter.event.wait(), sleep)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            self._leave_queue(waiter, time.monotonic() - start)
+
+    # Release the concurrency slot and refund unused reserved tokens
+    def release(self, reserved_tokens=0, used_tokens=None):
+        with self._lock:
+            self._in_flight -= 1
+            if used_tokens is not None and used_tokens < reserved_tokens:
+                self.tokens.give_back(reserved_tokens - used_tokens)
+            self._wake_head()
+
+    def _backoff(self, attempt, error):
+        delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+        retry_after = retry_after_seconds(error)
+        return max(delay, retry_after) if retry_after is not None else delay
+
+    def _give_up(self, attempt, error):
+        if attempt >= self.max_retries:
+            if isinstance(error, openai.RateLimitError):
+                raise LLMOverloadedError("Upstream LLM is rate limiting", retry_after=retry_after_seconds(error) or 1.0) from error
+            raise error
+        with self._lock:
+            self.retries += 1
+
+    def with_retries(self, fn):
+        attempt = 0
+        while True:
+            try:
+                return fn()
+            except RETRYABLE_ERRORS as e:
+                self._give_up(attempt, e)
+                time.sleep(self._backoff(attempt, e))
+                attempt += 1
+
+    async def awith_retries(self, coro_fn):
+        attempt = 0
+        while True:
+            try:
+                return await coro_fn()
+            except RETRYABLE_ERRORS as e:
+                self._give_up(attempt, e)
+                await asyncio.sleep(self._backoff(attempt, e))
+                attempt += 1
+
+    # Admit, call with retries and release in one step (non-streaming completions)
+    def call(self, fn, tokens):
+        self.acquire(tokens)
+        response = None
+        try:
+            response = self.with_retries(fn)
+            return response
+        finally:
+            self.release(tokens, used_tokens(response))
+
+    async def acall(self, coro_fn, tokens):
+        await self.aacquire(tokens)
+        response = None
+        try:
+            response = await self.awith_retries(coro_fn)
+            return response
+        finally:
+            self.release(tokens, used_tokens(response))
+
+    def saturated(self):
+        with self._lock:
+            return len(self._waiters) >= self.max_queue
+
+    def stats(self):
+        with self._lock:
+            return {
+                "in_flight": self._in_flight,
+                "waiting": len(self._waiters),
+                "admitted": self.admitted,
+                "shed": self.shed,
+                "retries": self.retries,
+                "avg_queue_wait_ms": (self.total_wait_time / self.admitted * 1000) if self.admitted else 0.0,
+            }
+
+
+def retry_after_seconds(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    headers = response.headers
+    try:
+        if "retry-after-ms" in headers:
+            return float(headers["retry-after-ms"]) / 1000
+        if "retry-after" in headers:
+            return float(headers["retry-after"])
+    except ValueError:
+        return None
+    return None
+
+
+def used_tokens(response):
+    usage = getattr(response, "usage", None)
+    return getattr(usage, "total_tokens", None) if usage is not None else None
+
+
+llm_governor = LLMGovernor()
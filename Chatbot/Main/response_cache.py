@@ -0,0 +1,248 @@
+# response_cache.py
+
+import hashlib
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Cache Settings
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "5000"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "3600"))
+# Requests sampled above this temperature are treated as non-deterministic and bypass the cache.
+# Chat completions run at temperature 0.7, so by default only greedy (temperature 0) requests are cached.
+RESPONSE_CACHE_MAX_TEMPERATURE = float(os.getenv("RESPONSE_CACHE_MAX_TEMPERATURE", "0"))
+
+# Optional embedding-similarity tier (new-conversation prompts only)
+RESPONSE_CACHE_SEMANTIC = os.getenv("RESPONSE_CACHE_SEMANTIC", "false").lower() in ("1", "true", "yes")
+RESPONSE_CACHE_SEMANTIC_SIZE = int(os.getenv("RESPONSE_CACHE_SEMANTIC_SIZE", "1000"))
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "text-embedding-3-small")
+
+
+def normalize_text(text):
+    return " ".join((text or "").lower().split())
+
+
+# Stable fingerprint of a completion request: model, params and normalized messages
+def fingerprint(model, messages, params):
+    payload = {
+        "model": model,
+        "params": params,
+        "messages": [[m["role"], normalize_text(m["content"])] for m in messages],
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+class ExactMatchTier:
+    """LRU + TTL map from a hash of (model, params, normalized messages) to a reply."""
+
+    name = "exact"
+
+    def __init__(self, max_entries=RESPONSE_CACHE_SIZE, ttl=RESPONSE_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, model, messages, params):
+        key = fingerprint(model, messages, params)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, model, messages, params, reply):
+        key = fingerprint(model, messages, params)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, reply)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": (self.hits / lookups) if lookups else 0.0}
+
+
+class SemanticTier:
+    """Brute-force cosine index over embeddings of new-conversation prompts.
+
+    Only prompts without history are indexed, so a near-duplicate opening
+    message ("hello!" vs "hello there") can reuse a reply.
+    """
+
+    name = "semantic"
+
+    def __init__(self, embed, max_entries=RESPONSE_CACHE_SEMANTIC_SIZE, ttl=RESPONSE_CACHE_TTL, threshold=RESPONSE_CACHE_SIMILARITY):
+        self.embed = embed  # callable: text -> list[float]
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries = OrderedDict()  # (model, params json, text) -> (expires_at, unit vector, reply)
+        self._vectors = OrderedDict()  # text -> unit vector, so a miss followed by put embeds once
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _prompt(messages):
+        # system + one user message == a new conversation
+        if len(messages) == 2 and messages[0]["role"] == "system" and messages[1]["role"] == "user":
+            return normalize_text(messages[1]["content"])
+        return None
+
+    def _vector(self, text):
+        with self._lock:
+            vector = self._vectors.get(text)
+        if vector is None:
+            raw = self.embed(text)
+            norm = math.sqrt(sum(x * x for x in raw)) or 1.0
+            vector = [x / norm for x in raw]
+            with self._lock:
+                self._vectors[text] = vector
+                while len(self._vectors) > 256:
+                    self._vectors.popitem(last=False)
+        return vector
+
+    def get(self, model, messages, params):
+        text = self._prompt(messages)
+        if text is None:
+            return None
+        vector = self._vector(text)
+        scope = (model, json.dumps(params, sort_keys=True))
+        now = time.monotonic()
+
+        best, best_score = None, self.threshold
+        with self._lock:
+            for key, (expires_at, other, reply) in list(self._entries.items()):
+                if expires_at < now:
+                    del self._entries[key]
+                    continue
+                if key[:2] != scope:
+                    continue
+                score = sum(a * b for a, b in zip(vector, other))
+                if score >= best_score:
+                    best, best_score = reply, score
+            if best is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return best
+
+    def put(self, model, messages, params, reply):
+        text = self._prompt(messages)
+        if text is None:
+            return
+        vector = self._vector(text)
+        key = (model, json.dumps(params, sort_keys=True), text)
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, vector, reply)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses,
+                    "hit_rate": (self.hits / lookups) if lookups else 0.0}
+
+
+class ResponseCache:
+    """Tiered cache in front of chat completions; tiers are checked in order."""
+
+    def __init__(self, tiers, enabled=RESPONSE_CACHE_ENABLED, max_temperature=RESPONSE_CACHE_MAX_TEMPERATURE):
+        self.tiers = tiers
+        self.enabled = enabled
+        self.max_temperature = max_temperature
+        self.bypassed = 0
+        self._lock = threading.Lock()
+
+    @property
+    def blocking(self):
+        # Semantic lookups call the embeddings API, so async callers should run them in a thread
+        return any(isinstance(tier, SemanticTier) for tier in self.tiers)
+
+    def cacheable(self, params):
+        if not self.enabled:
+            return False
+        if params.get("temperature", 1.0) > self.max_temperature:
+            with self._lock:
+                self.bypassed += 1
+            return False
+        return True
+
+    def lookup(self, model, messages, params):
+        if not self.cacheable(params):
+            return None
+        for tier in self.tiers:
+            reply = tier.get(model, messages, params)
+            if reply is not None:
+                # Promote into the earlier tiers
+                for earlier in self.tiers[:self.tiers.index(tier)]:
+                    earlier.put(model, messages, params, reply)
+                return reply
+        return None
+
+    def store(self, model, messages, params, reply):
+        if not reply or not self.enabled or params.get("temperature", 1.0) > self.max_temperature:
+            return
+        for tier in self.tiers:
+            tier.put(model, messages, params, reply)
+
+    def stats(self):
+        with self._lock:
+            bypassed = self.bypassed
+        return {
+            "enabled": self.enabled,
+            "max_temperature": self.max_temperature,
+            "bypassed": bypassed,
+            "tiers": {tier.name: tier.stats() for tier in self.tiers},
+        }
+
+
+# With a governor, embedding calls are admitted, retried and counted like completions
+def openai_embedder(client, model=EMBEDDING_MODEL, governor=None, count_tokens=len):
+    def embed(text):
+        request = lambda: client.embeddings.create(model=model, input=text)
+        response = governor.call(request, count_tokens(text)) if governor is not None else request()
+        return response.data[0].embedding
+    return embed
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+# Process-wide response cache
+def get_response_cache():
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                tiers = [ExactMatchTier()]
+                if RESPONSE_CACHE_SEMANTIC:
+                    from context_builder import token_counter
+                    from llm_client import get_openai_client
+                    from rate_limiter import llm_governor
+                    tiers.append(SemanticTier(openai_embedder(get_openai_client(), governor=llm_governor,
+                                                              count_tokens=token_counter.count)))
+                _cache = ResponseCache(tiers)
+    return _cache
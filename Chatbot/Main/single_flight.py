@@ -0,0 +1,105 @@
+# single_flight.py
+
+import asyncio
+import threading
+
+
+class _Call:
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent calls that share a key into one upstream call.
+
+    The first caller for a key runs the function; callers arriving while it is
+    in flight wait for and share its result (or its exception). If an async
+    leader is cancelled, a waiting caller runs the function instead.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}    # key -> _Call (threads)
+        self._futures = {}  # key -> asyncio.Future (event loop)
+
+        # Stats
+        self.executed = 0
+        self.coalesced = 0
+
+    def do(self, key, fn):
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._calls[key] = call
+                self.executed += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = fn()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+
+    async def ado(self, key, coro_fn):
+        future = self._futures.get(key)
+        if future is not None:
+            with self._lock:
+                self.coalesced += 1
+        while future is not None:
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # A cancelled leader (its client went away) must not fail the followers: the first
+                # one to wake takes over the call and the others wait for it
+                if not future.cancelled():
+                    raise
+            future = self._futures.get(key)
+
+        future = asyncio.get_running_loop().create_future()
+        # Avoid "exception was never retrieved" when nobody else was waiting
+        future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        self._futures[key] = future
+        with self._lock:
+            self.executed += 1
+
+        try:
+            result = await coro_fn()
+            future.set_result(result)
+            return result
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            self._futures.pop(key, None)
+
+    def stats(self):
+        with self._lock:
+            total = self.executed + self.coalesced
+            return {
+                "in_flight": len(self._calls) + len(self._futures),
+                "upstream_calls": self.executed,
+                "coalesced_calls": self.coalesced,
+                "coalesced_rate": (self.coalesced / total) if total else 0.0,
+            }
+
+
+completion_flight = SingleFlight()
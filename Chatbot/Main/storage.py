@@ -0,0 +1,587 @@
+# storage.py
+
+import asyncio
+import bisect
+import itertools
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from dotenv import load_dotenv
+import db_pool
+import async_db
+from tracing import db_span
+
+load_dotenv()
+
+# Storage Settings
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mysql")           # mysql | sqlite | memory
+STORAGE_SQLITE_PATH = os.getenv("STORAGE_SQLITE_PATH", "chatbot.db")
+CONVERSATION_LIST_LIMIT = 50
+# Unique (conv_id, message_no) index: the optimistic check that rejects a turn whose position is already taken
+MESSAGE_NO_INDEX = "idx_message_store_conv_msg"
+# Unique message_id index: a retried turn cannot be stored twice
+MESSAGE_ID_INDEX = "idx_message_store_message_id"
+
+
+class ConversationConflictError(Exception):
+    """A turn's message_no is already taken: another writer extended the conversation first."""
+
+
+class DuplicateMessageError(ConversationConflictError):
+    """A turn's message_id is already stored: the turn is a retry of one that was saved."""
+
+
+# Map a duplicate (conv_id, message_no) or message_id error to its conflict type (None for anything else).
+# MySQL names the violated key; SQLite names its columns.
+def conflict_error(error, turns):
+    text = str(error)
+    if MESSAGE_ID_INDEX in text or "message_store.message_id" in text:
+        message_ids = ", ".join(str(turn[3]) for turn in turns)
+        return DuplicateMessageError(f"Message {message_ids} is already stored")
+    if MESSAGE_NO_INDEX not in text and "message_store.conv_id, message_store.message_no" not in text:
+        return None
+    conversations = ", ".join(sorted({str(turn[0]) for turn in turns}))
+    return ConversationConflictError(f"Conversation {conversations} was extended concurrently; reload its history and retry")
+
+
+# Normalize one chat turn's fields
+# elapsed_ms is the turn's latency up to persistence and is stored on the assistant message;
+# created_at is an ISO timestamp for turns that went through the write-behind queue
+def turn_fields(conversation_id, user_id, message_count, user_message_id, user_message, assistant_message_id, assistant_message, elapsed_ms=0, created_at=None):
+    created_at = datetime.fromisoformat(created_at) if created_at else datetime.now()
+    return conversation_id, user_id, message_count, user_message_id, user_message, assistant_message_id, assistant_message, elapsed_ms, created_at
+
+
+class ConversationStore(ABC):
+    """Storage interface for conversations, messages and rolling summaries.
+
+    A turn is the argument list of ``turn_fields``. Row shapes are shared by
+    every engine:
+      get_history       -> [(role, message, message_id)], oldest first
+      get_history_page  -> [(ID, role, message_no, message, message_id)] with ID > after_id
+      list_conversations -> [(ID, conv_id, chat_name, message_count, created_at, updated_at)], most recently
+                            updated first; with before=(updated_at, ID), only rows after that position
+      get_summary       -> (summary, summarized_count), (None, 0) when absent
+      get_turn          -> (conv_id, user_id, user message, assistant reply) of a user message_id, None when absent
+    The async variants run the sync ones in a worker thread when ``blocking``.
+    """
+
+    name = "base"
+    blocking = True
+
+    @abstractmethod
+    def append_turns(self, turns):
+        raise NotImplementedError
+
+    def append_turn(self, *turn):
+        self.append_turns([turn])
+
+    @abstractmethod
+    def get_history(self, conv_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_history_page(self, conv_id, after_id, limit):
+        raise NotImplementedError
+
+    @abstractmethod
+    def list_conversations(self, user_id, limit=CONVERSATION_LIST_LIMIT, before=None):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_summary(self, conv_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_turn(self, message_id):
+        raise NotImplementedError
+
+    @abstractmethod
+    def save_summary(self, conv_id, summary, summarized_count):
+        raise NotImplementedError
+
+    async def _offload(self, func, *args):
+        if self.blocking:
+            return await asyncio.to_thread(func, *args)
+        return func(*args)
+
+    async def aappend_turns(self, turns):
+        return await self._offload(self.append_turns, turns)
+
+    async def aappend_turn(self, *turn):
+        return await self.aappend_turns([turn])
+
+    async def aget_history(self, conv_id):
+        return await self._offload(self.get_history, conv_id)
+
+    async def aget_history_page(self, conv_id, after_id, limit):
+        return await self._offload(self.get_history_page, conv_id, after_id, limit)
+
+    async def alist_conversations(self, user_id, limit=CONVERSATION_LIST_LIMIT, before=None):
+        return await self._offload(self.list_conversations, user_id, limit, before)
+
+    async def aget_summary(self, conv_id):
+        return await self._offload(self.get_summary, conv_id)
+
+    async def aget_turn(self, message_id):
+        return await self._offload(self.get_turn, message_id)
+
+    def stats(self):
+        return {"backend": self.name}
+
+
+# MySQL
+MYSQL_HISTORY_QUERY = "SELECT role, message, message_id FROM message_store WHERE conv_id = %s ORDER BY ID ASC"
+# Keyset pagination: (conv_id, ID) index seek, no OFFSET scans
+MYSQL_HISTORY_PAGE_QUERY = """
+SELECT
+    ID, role, message_no,
+    message, message_id
+FROM message_store
+WHERE conv_id = %s AND ID > %s
+ORDER BY ID ASC
+LIMIT %s
+"""
+# Keyset pagination on (updated_at, ID): a (user_id, updated_at) index range scan (InnoDB appends ID), no OFFSET
+MYSQL_CONVERSATIONS_QUERY = """
+SELECT ID, conv_id, chat_name, message_count, created_at, updated_at
+FROM conversation_store
+WHERE user_id = %s
+ORDER BY updated_at DESC, ID DESC
+LIMIT %s
+"""
+MYSQL_CONVERSATIONS_PAGE_QUERY = """
+SELECT ID, conv_id, chat_name, message_count, created_at, updated_at
+FROM conversation_store
+WHERE user_id = %s AND (updated_at < %s OR (updated_at = %s AND ID < %s))
+ORDER BY updated_at DESC, ID DESC
+LIMIT %s
+"""
+MYSQL_SUMMARY_QUERY = "SELECT summary, summarized_count FROM conversation_summary WHERE conv_id = %s"
+# A stored turn by its user message_id: unique message_id seek, then the (conv_id, message_no) index for the reply
+MYSQL_TURN_QUERY = """
+SELECT request.conv_id, conversation.user_id, request.message, reply.message
+FROM message_store request
+JOIN message_store reply ON reply.conv_id = request.conv_id AND reply.message_no = request.message_no + 1
+JOIN conversation_store conversation ON conversation.conv_id = request.conv_id
+WHERE request.message_id = %s AND request.role = 'user'
+LIMIT 1
+"""
+MYSQL_SUMMARY_UPSERT = """INSERT INTO conversation_summary (conv_id, summary, summarized_count, updated_at)
+                          VALUES (%s, %s, %s, %s)
+                          ON DUPLICATE KEY UPDATE summary = VALUES(summary),
+                                                  summarized_count = VALUES(summarized_count),
+                                                  updated_at = VALUES(updated_at)"""
+MYSQL_MESSAGE_ROW = "(%s, %s, %s, %s, %s, %s, %s, %s, %s)"
+MYSQL_CONVERSATION_ROW = "(%s, %s, %s, %s, %s, %s)"
+
+
+# Statements for a batch of turns: one multi-row INSERT for all messages, one for new
+# conversation records and one UPDATE per distinct increment for the existing ones
+# (message_count += 2 per turn, in the turn's transaction, so concurrent writers never lose a count)
+def mysql_turn_statements(turns):
+    message_params, conversation_params, touched = [], [], {}
+    latest = None
+    for turn in turns:
+        conversation_id, user_id, message_count, user_message_id, user_message, assistant_message_id, assistant_message, elapsed_ms, now = turn_fields(*turn)
+        latest = max(latest, now) if latest else now
+        message_params.extend((
+            "user", conversation_id, message_count, user_message_id, user_message, 0, "Success", now, now,
+            "assistant", conversation_id, message_count + 1, assistant_message_id, assistant_message, elapsed_ms, "Success", now, now,
+        ))
+        # Create the conversation record for new conversations, otherwise touch it
+        # Note: ID field is auto_increment, so we don't include it
+        if message_count == 0:
+            conversation_params.extend(("NEW CHAT", conversation_id, user_id, 2, now, now))  # 2 messages: user + assistant
+        else:
+            touched[conversation_id] = touched.get(conversation_id, 0) + 2
+
+    message_query = """INSERT INTO message_store
+                      (role, conv_id, message_no, message_id, message, elapsed_time, Status, created_at, updated_at)
+                      VALUES """ + ", ".join([MYSQL_MESSAGE_ROW] * (2 * len(turns)))
+    statements = [(message_query, tuple(message_params))]
+
+    if conversation_params:
+        conversation_query = """INSERT INTO conversation_store
+                               (chat_name, conv_id, user_id, message_count, created_at, updated_at)
+                               VALUES """ + ", ".join([MYSQL_CONVERSATION_ROW] * (len(conversation_params) // 6))
+        statements.append((conversation_query, tuple(conversation_params)))
+    by_increment = {}
+    for conversation_id, increment in touched.items():
+        by_increment.setdefault(increment, []).append(conversation_id)
+    for increment, conversation_ids in sorted(by_increment.items()):
+        conversation_query = f"""UPDATE conversation_store SET message_count = message_count + %s, updated_at = %s
+                                WHERE conv_id IN ({', '.join(['%s'] * len(conversation_ids))})"""
+        statements.append((conversation_query, (increment, latest, *conversation_ids)))
+
+    return statements
+
+
+class MySQLStore(ConversationStore):
+    """The production engine: pooled mysql.connector connections with per-connection
+    prepared statements, and aiomysql (or the pool in an executor) for the async variants."""
+
+    name = "mysql"
+
+    def append_turns(self, turns):
+        try:
+            db_pool.execute_transaction(mysql_turn_statements(turns))
+        except Exception as e:
+            conflict = conflict_error(e, turns)
+            if conflict is None:
+                raise
+            raise conflict from e
+
+    def get_history(self, conv_id):
+        return db_pool.fetch_all(MYSQL_HISTORY_QUERY, (conv_id,), {"chat.conv_id": conv_id})
+
+    def get_history_page(self, conv_id, after_id, limit):
+        return db_pool.fetch_all(MYSQL_HISTORY_PAGE_QUERY, (conv_id, after_id, limit), {"chat.conv_id": conv_id})
+
+    def list_conversations(self, user_id, limit=CONVERSATION_LIST_LIMIT, before=None):
+        if before is None:
+            return db_pool.fetch_all(MYSQL_CONVERSATIONS_QUERY, (user_id, limit), {"chat.user_id": user_id})
+        updated_at, row_id = before
+        return db_pool.fetch_all(MYSQL_CONVERSATIONS_PAGE_QUERY, (user_id, updated_at, updated_at, row_id, limit), {"chat.user_id": user_id})
+
+    def get_summary(self, conv_id):
+        rows = db_pool.fetch_all(MYSQL_SUMMARY_QUERY, (conv_id,), {"chat.conv_id": conv_id})
+        return (rows[0][0], rows[0][1]) if rows else (None, 0)
+
+    def get_turn(self, message_id):
+        rows = db_pool.fetch_all(MYSQL_TURN_QUERY, (message_id,), {"chat.message_id": message_id})
+        return tuple(rows[0]) if rows else None
+
+    def save_summary(self, conv_id, summary, summarized_count):
+        db_pool.execute_transaction([(MYSQL_SUMMARY_UPSERT, (conv_id, summary, summarized_count, datetime.now()))])
+
+    async def aappend_turns(self, turns):
+        try:
+            await async_db.execute_transaction(mysql_turn_statements(turns))
+        except Exception as e:
+            conflict = conflict_error(e, turns)
+            if conflict is None:
+                raise
+            raise conflict from e
+
+    async def aget_history(self, conv_id):
+        return await async_db.fetch_all(MYSQL_HISTORY_QUERY, (conv_id,))
+
+    async def aget_history_page(self, conv_id, after_id, limit):
+        return await async_db.fetch_all(MYSQL_HISTORY_PAGE_QUERY, (conv_id, after_id, limit))
+
+    async def alist_conversations(self, user_id, limit=CONVERSATION_LIST_LIMIT, before=None):
+        if before is None:
+            return await async_db.fetch_all(MYSQL_CONVERSATIONS_QUERY, (user_id, limit))
+        updated_at, row_id = before
+        return await async_db.fetch_all(MYSQL_CONVERSATIONS_PAGE_QUERY, (user_id, updated_at, updated_at, row_id, limit))
+
+    async def aget_summary(self, conv_id):
+        rows = await async_db.fetch_all(MYSQL_SUMMARY_QUERY, (conv_id,))
+        return (rows[0][0], rows[0][1]) if rows else (None, 0)
+
+    async def aget_turn(self, message_id):
+        rows = await async_db.fetch_all(MYSQL_TURN_QUERY, (message_id,))
+        return tuple(rows[0]) if rows else None
+
+    def stats(self):
+        return {"backend": self.name, "prepared_statements": db_pool.DB_PREPARED_STATEMENTS, "pool": db_pool.get_pool().stats()}
+
+
+# SQLite
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversation_store(
+  ID integer PRIMARY KEY AUTOINCREMENT,
+  chat_name text,
+  conv_id text,
+  user_id integer NOT NULL,
+  message_count integer,
+  created_at text,
+  updated_at text
+);
+CREATE TABLE IF NOT EXISTS message_store(
+  ID integer PRIMARY KEY AUTOINCREMENT,
+  role text,
+  conv_id text,
+  message_no integer,
+  message_id text,
+  message text,
+  elapsed_time integer,
+  Status text,
+  created_at text,
+  updated_at text
+);
+CREATE TABLE IF NOT EXISTS conversation_summary(
+  conv_id text PRIMARY KEY,
+  summary text,
+  summarized_count integer NOT NULL DEFAULT 0,
+  updated_at text
+);
+CREATE INDEX IF NOT EXISTS idx_message_store_conv_id ON message_store (conv_id, ID);
+CREATE INDEX IF NOT EXISTS idx_conversation_store_conv ON conversation_store (conv_id);
+CREATE INDEX IF NOT EXISTS idx_conversation_store_user_updated ON conversation_store (user_id, updated_at);
+"""
+# Files created before the unique index may hold duplicate message_no values: renumber by insertion order first
+SQLITE_MESSAGE_NO_UNIQUE = f"""
+UPDATE message_store SET message_no = (SELECT COUNT(*) FROM message_store AS earlier
+                                       WHERE earlier.conv_id = message_store.conv_id AND earlier.ID < message_store.ID);
+CREATE UNIQUE INDEX IF NOT EXISTS {MESSAGE_NO_INDEX} ON message_store (conv_id, message_no);
+"""
+# Retries used to store a message_id twice: only the first copy keeps it
+SQLITE_MESSAGE_ID_UNIQUE = f"""
+UPDATE message_store SET message_id = NULL
+WHERE message_id IS NOT NULL AND ID NOT IN (SELECT MIN(ID) FROM message_store WHERE message_id IS NOT NULL GROUP BY message_id);
+CREATE UNIQUE INDEX IF NOT EXISTS {MESSAGE_ID_INDEX} ON message_store (message_id);
+"""
+# Unique indexes added after the first release, with the clean-up each needs on older files
+SQLITE_UPGRADES = [(MESSAGE_NO_INDEX, SQLITE_MESSAGE_NO_UNIQUE), (MESSAGE_ID_INDEX, SQLITE_MESSAGE_ID_UNIQUE)]
+# message_count used to stay at 2 after the first turn: recount once per file (PRAGMA user_version 0 -> 1)
+SQLITE_MESSAGE_COUNT_BACKFILL = """
+UPDATE conversation_store SET message_count = (SELECT COUNT(*) FROM message_store WHERE message_store.conv_id = conversation_store.conv_id)
+WHERE EXISTS (SELECT 1 FROM message_store WHERE message_store.conv_id = conversation_store.conv_id);
+PRAGMA user_version = 1;
+"""
+# Fixed statements: sqlite3 compiles each once per connection and reuses it (statement cache)
+SQLITE_MESSAGE_INSERT = """INSERT INTO message_store
+                           (role, conv_id, message_no, message_id, message, elapsed_time, Status, created_at, updated_at)
+                           VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+SQLITE_CONVERSATION_INSERT = """INSERT INTO conversation_store (chat_name, conv_id, user_id, message_count, created_at, updated_at)
+                                VALUES (?, ?, ?, ?, ?, ?)"""
+SQLITE_CONVERSATION_TOUCH = "UPDATE conversation_store SET message_count = message_count + 2, updated_at = ? WHERE conv_id = ?"
+SQLITE_HISTORY_QUERY = "SELECT role, message, message_id FROM message_store WHERE conv_id = ? ORDER BY ID ASC"
+SQLITE_HISTORY_PAGE_QUERY = """SELECT ID, role, message_no, message, message_id FROM message_store
+                               WHERE conv_id = ? AND ID > ? ORDER BY ID ASC LIMIT ?"""
+SQLITE_CONVERSATIONS_QUERY = """SELECT ID, conv_id, chat_name, message_count, created_at, updated_at FROM conversation_store
+                                WHERE user_id = ? ORDER BY updated_at DESC, ID DESC LIMIT ?"""
+SQLITE_CONVERSATIONS_PAGE_QUERY = """SELECT ID, conv_id, chat_name, message_count, created_at, updated_at FROM conversation_store
+                                     WHERE user_id = ? AND (updated_at < ? OR (updated_at = ? AND ID < ?))
+                                     ORDER BY updated_at DESC, ID DESC LIMIT ?"""
+SQLITE_SUMMARY_QUERY = "SELECT summary, summarized_count FROM conversation_summary WHERE conv_id = ?"
+SQLITE_TURN_QUERY = """SELECT request.conv_id, conversation.user_id, request.message, reply.message
+                       FROM message_store request
+                       JOIN message_store reply ON reply.conv_id = request.conv_id AND reply.message_no = request.message_no + 1
+                       JOIN conversation_store conversation ON conversation.conv_id = request.conv_id
+                       WHERE request.message_id = ? AND request.role = 'user' LIMIT 1"""
+SQLITE_SUMMARY_UPSERT = """INSERT INTO conversation_summary (conv_id, summary, summarized_count, updated_at) VALUES (?, ?, ?, ?)
+                           ON CONFLICT(conv_id) DO UPDATE SET summary = excluded.summary,
+                                                              summarized_count = excluded.summarized_count,
+                                                              updated_at = excluded.updated_at"""
+
+
+class SQLiteStore(ConversationStore):
+    """Single-node engine on one SQLite file in WAL mode.
+
+    Each thread gets its own connection (readers never block the writer);
+    writes are serialized by a lock and run as one IMMEDIATE transaction.
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path=STORAGE_SQLITE_PATH):
+        if path == ":memory:":
+            raise ValueError("SQLiteStore needs a file path; use MemoryStore for an in-memory database")
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        db = self._connection()
+        db.executescript(SQLITE_SCHEMA)
+        for index_name, upgrade in SQLITE_UPGRADES:
+            if not db.execute("SELECT 1 FROM sqlite_master WHERE type = 'index' AND name = ?", (index_name,)).fetchone():
+                db.executescript(f"BEGIN IMMEDIATE; {upgrade} COMMIT;")
+        if db.execute("PRAGMA user_version").fetchone()[0] < 1:
+            db.executescript(f"BEGIN IMMEDIATE; {SQLITE_MESSAGE_COUNT_BACKFILL} COMMIT;")
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, isolation_level=None, timeout=30, cached_statements=64)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def _fetch_all(self, query, params, attributes=None):
+        with db_span(query, {"db.system": "sqlite", **(attributes or {})}) as query_span:
+            rows = self._connection().execute(query, params).fetchall()
+            query_span.set_attribute("db.rows", len(rows))
+        return rows
+
+    def _write(self, statements):
+        db = self._connection()
+        with self._write_lock:
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                for query, rows in statements:
+                    with db_span(query, {"db.system": "sqlite"}) as statement_span:
+                        statement_span.set_attribute("db.rows", db.executemany(query, rows).rowcount)
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                raise
+
+    def append_turns(self, turns):
+        messages, conversations, touched = [], [], []
+        for turn in turns:
+            conversation_id, user_id, message_count, user_message_id, user_message, assistant_message_id, assistant_message, elapsed_ms, now = turn_fields(*turn)
+            now = now.isoformat(" ")
+            messages.append(("user", conversation_id, message_count, user_message_id, user_message, 0, "Success", now, now))
+            messages.append(("assistant", conversation_id, message_count + 1, assistant_message_id, assistant_message, elapsed_ms, "Success", now, now))
+            if message_count == 0:
+                conversations.append(("NEW CHAT", conversation_id, user_id, 2, now, now))
+            else:
+                touched.append((now, conversation_id))
+        try:
+            self._write([(SQLITE_MESSAGE_INSERT, messages), (SQLITE_CONVERSATION_INSERT, conversations), (SQLITE_CONVERSATION_TOUCH, touched)])
+        except sqlite3.IntegrityError as e:
+            conflict = conflict_error(e, turns)
+            if conflict is None:
+                raise
+            raise conflict from e
+
+    def get_history(self, conv_id):
+        return self._fetch_all(SQLITE_HISTORY_QUERY, (conv_id,), {"chat.conv_id": conv_id})
+
+    def get_history_page(self, conv_id, after_id, limit):
+        return self._fetch_all(SQLITE_HISTORY_PAGE_QUERY, (conv_id, after_id, limit), {"chat.conv_id": conv_id})
+
+    def list_conversations(self, user_id, limit=CONVERSATION_LIST_LIMIT, before=None):
+        if before is None:
+            return self._fetch_all(SQLITE_CONVERSATIONS_QUERY, (user_id, limit), {"chat.user_id": user_id})
+        updated_at, row_id = before
+        updated_at = updated_at.isoformat(" ")  # stored as text in this format, which sorts like the timestamps
+        return self._fetch_all(SQLITE_CONVERSATIONS_PAGE_QUERY, (user_id, updated_at, updated_at, row_id, limit), {"chat.user_id": user_id})
+
+    def get_summary(self, conv_id):
+        rows = self._fetch_all(SQLITE_SUMMARY_QUERY, (conv_id,), {"chat.conv_id": conv_id})
+        return (rows[0][0], rows[0][1]) if rows else (None, 0)
+
+    def get_turn(self, message_id):
+        rows = self._fetch_all(SQLITE_TURN_QUERY, (message_id,), {"chat.message_id": message_id})
+        return rows[0] if rows else None
+
+    def save_summary(self, conv_id, summary, summarized_count):
+        self._write([(SQLITE_SUMMARY_UPSERT, [(conv_id, summary, summarized_count, datetime.now().isoformat(" "))])])
+
+    def stats(self):
+        return {"backend": self.name, "path": self.path, "journal_mode": self._connection().execute("PRAGMA journal_mode").fetchone()[0]}
+
+
+class MemoryStore(ConversationStore):
+    """Process-local engine for tests, benchmarks and throwaway single-node runs; nothing is persisted."""
+
+    name = "memory"
+    blocking = False
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._messages = {}       # conv_id -> [(ID, role, message_no, message, message_id), ...]
+        self._message_ids = {}    # conv_id -> [ID, ...] (for keyset pages)
+        self._conversations = {}  # conv_id -> [ID, conv_id, chat_name, user_id, message_count, created_at, updated_at]
+        self._by_user = {}        # user_id -> {conv_id, ...}
+        self._summaries = {}      # conv_id -> (summary, summarized_count)
+        self._message_nos = {}    # conv_id -> {message_no, ...} (unique, like the SQL engines)
+        self._by_message_id = {}  # message_id -> (conv_id, index in _messages[conv_id]) (unique, like the SQL engines)
+
+    def append_turns(self, turns):
+        with self._lock:
+            # All-or-nothing like a transaction: check every message_id and position before writing any
+            claimed, claimed_ids = set(), set()
+            for turn in turns:
+                conversation_id, message_count = turn[0], turn[2]
+                for message_id in (turn[3], turn[5]):
+                    if message_id is not None and (message_id in self._by_message_id or message_id in claimed_ids):
+                        raise DuplicateMessageError(f"Message {message_id} is already stored")
+                    claimed_ids.add(message_id)
+                taken = self._message_nos.get(conversation_id, ())
+                for position in ((conversation_id, message_count), (conversation_id, message_count + 1)):
+                    if position[1] in taken or position in claimed:
+                        raise ConversationConflictError(f"Conversation {conversation_id} was extended concurrently; reload its history and retry")
+                    claimed.add(position)
+
+            for turn in turns:
+                conversation_id, user_id, message_count, user_message_id, user_message, assistant_message_id, assistant_message, elapsed_ms, now = turn_fields(*turn)
+                messages = self._messages.setdefault(conversation_id, [])
+                ids = self._message_ids.setdefault(conversation_id, [])
+                for role, message_no, message_id, message in (("user", message_count, user_message_id, user_message),
+                                                              ("assistant", message_count + 1, assistant_message_id, assistant_message)):
+                    row_id = next(self._ids)
+                    if message_id is not None:
+                        self._by_message_id[message_id] = (conversation_id, len(messages))
+                    messages.append((row_id, role, message_no, message, message_id))
+                    ids.append(row_id)
+                    self._message_nos.setdefault(conversation_id, set()).add(message_no)
+                if message_count == 0:
+                    self._conversations[conversation_id] = [next(self._ids), conversation_id, "NEW CHAT", user_id, 2, now, now]
+                    self._by_user.setdefault(user_id, set()).add(conversation_id)
+                elif conversation_id in self._conversations:
+                    self._conversations[conversation_id][4] += 2
+                    self._conversations[conversation_id][6] = now
+
+    def get_history(self, conv_id):
+        with self._lock:
+            return [(role, message, message_id) for _, role, _, message, message_id in self._messages.get(conv_id, ())]
+
+    def get_history_page(self, conv_id, after_id, limit):
+        with self._lock:
+            start = bisect.bisect_right(self._message_ids.get(conv_id, ()), after_id)
+            return self._messages.get(conv_id, [])[start:start + limit]
+
+    def list_conversations(self, user_id, limit=CONVERSATION_LIST_LIMIT, before=None):
+        with self._lock:
+            records = [tuple(self._conversations[conv_id]) for conv_id in self._by_user.get(user_id, ())]
+        if before is not None:
+            records = [record for record in records if (record[6], record[0]) < tuple(before)]
+        records.sort(key=lambda record: (record[6], record[0]), reverse=True)
+        return [(record[0], record[1], record[2], record[4], record[5], record[6]) for record in records[:limit]]
+
+    def get_summary(self, conv_id):
+        with self._lock:
+            return self._summaries.get(conv_id, (None, 0))
+
+    def get_turn(self, message_id):
+        with self._lock:
+            location = self._by_message_id.get(message_id)
+            if location is None:
+                return None
+            conversation_id, index = location
+            messages = self._messages[conversation_id]
+            request = messages[index]
+            reply = next((row for row in messages[index + 1:] if row[2] == request[2] + 1), None)
+            conversation = self._conversations.get(conversation_id)
+            if request[1] != "user" or reply is None or conversation is None:
+                return None
+            return conversation_id, conversation[3], request[3], reply[3]
+
+    def save_summary(self, conv_id, summary, summarized_count):
+        with self._lock:
+            self._summaries[conv_id] = (summary, summarized_count)
+
+    def stats(self):
+        with self._lock:
+            return {"backend": self.name, "conversations": len(self._conversations), "messages": sum(len(rows) for rows in self._messages.values())}
+
+
+STORES = {"mysql": MySQLStore, "sqlite": SQLiteStore, "memory": MemoryStore}
+
+
+def create_store(backend=STORAGE_BACKEND):
+    if backend not in STORES:
+        raise ValueError(f"Unknown STORAGE_BACKEND {backend!r}; expected one of {', '.join(STORES)}")
+    return STORES[backend]()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+# Process-wide conversation store (STORAGE_BACKEND)
+def get_store():
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = create_store()
+    return _store
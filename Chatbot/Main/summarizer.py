@@ -0,0 +1,110 @@
+# summarizer.py
+
+import logging
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from rate_limiter import llm_governor
+from storage import get_store
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Summary Settings
+SUMMARY_EVERY_TURNS = int(os.getenv("SUMMARY_EVERY_TURNS", "10"))  # refresh after this many new turns
+SUMMARY_KEEP_RECENT = int(os.getenv("SUMMARY_KEEP_RECENT", "8"))   # latest messages always sent verbatim
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "300"))
+SUMMARY_CACHE_SIZE = int(os.getenv("SUMMARY_CACHE_SIZE", "10000"))
+
+SUMMARY_PROMPT = ("Update the running summary of a conversation between a user and an assistant. "
+                  "Keep facts, names, decisions and open questions. Answer with the summary only.")
+
+
+class ConversationSummarizer:
+    """Keeps a rolling summary per conv_id in conversation_summary.
+
+    The summary covers the first ``summarized_count`` messages of a conversation;
+    the chatbot sends it together with the messages after that point. Refreshes
+    run in a background thread every SUMMARY_EVERY_TURNS turns.
+    """
+
+    def __init__(self, every_turns=SUMMARY_EVERY_TURNS, keep_recent=SUMMARY_KEEP_RECENT, max_workers=2):
+        self.every_turns = every_turns
+        self.keep_recent = keep_recent
+        self._summaries = OrderedDict()  # conv_id -> (summary, summarized_count)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="summarizer")
+
+    def _cached(self, conv_id):
+        with self._lock:
+            cached = self._summaries.get(conv_id)
+            if cached is not None:
+                self._summaries.move_to_end(conv_id)
+            return cached
+
+    def _remember(self, conv_id, summary, summarized_count):
+        with self._lock:
+            self._summaries[conv_id] = (summary, summarized_count)
+            self._summaries.move_to_end(conv_id)
+            if len(self._summaries) > SUMMARY_CACHE_SIZE:
+                self._summaries.popitem(last=False)
+
+    # Current (summary, summarized_count) for a conversation
+    def summary_for(self, conv_id):
+        cached = self._cached(conv_id)
+        if cached is not None:
+            return cached
+
+        result = get_store().get_summary(conv_id)
+        self._remember(conv_id, *result)
+        return result
+
+    async def asummary_for(self, conv_id):
+        cached = self._cached(conv_id)
+        if cached is not None:
+            return cached
+
+        result = await get_store().aget_summary(conv_id)
+        self._remember(conv_id, *result)
+        return result
+
+    # Schedule a background refresh once enough unsummarized turns have piled up
+    def maybe_schedule(self, conv_id, rows, router):
+        summary, summarized_count = self._cached(conv_id) or (None, 0)
+        if len(rows) - summarized_count < self.keep_recent + self.every_turns * 2:
+            return
+
+        with self._lock:
+            if conv_id in self._pending:
+                return
+            self._pending.add(conv_id)
+
+        self._executor.submit(self._refresh, conv_id, list(rows), summary, summarized_count, router)
+
+    def _refresh(self, conv_id, rows, summary, summarized_count, router):
+        try:
+            upto = len(rows) - self.keep_recent
+            transcript = "\n".join(f"{role}: {message}" for role, message in rows[summarized_count:upto])
+            messages = [
+                {"role": "system", "content": SUMMARY_PROMPT},
+                {"role": "user", "content": f"Current summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"}
+            ]
+            params = {"max_tokens": SUMMARY_MAX_TOKENS, "temperature": 0.2}
+            _, response = llm_governor.call(lambda: router.complete(messages, params), len(transcript) // 4 + SUMMARY_MAX_TOKENS)
+            new_summary = response.choices[0].message.content
+
+            get_store().save_summary(conv_id, new_summary, upto)
+
+            self._remember(conv_id, new_summary, upto)
+        except Exception as e:
+            logger.warning("Summary refresh failed for %s: %s", conv_id, e)
+        finally:
+            with self._lock:
+                self._pending.discard(conv_id)
+
+
+summarizer = ConversationSummarizer()
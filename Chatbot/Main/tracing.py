@@ -0,0 +1,170 @@
+# tracing.py
+
+import logging
+import os
+import re
+from dotenv import load_dotenv
+
+try:
+    from opentelemetry import trace
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+except ImportError:  # Tracing stays off without the OpenTelemetry SDK
+    trace = None
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Tracing Settings (opt-in)
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() in ("1", "true", "yes")
+TRACING_EXPORTER = os.getenv("TRACING_EXPORTER", "console")  # console | file | otlp
+TRACING_FILE = os.getenv("TRACING_FILE", "traces.jsonl")      # used by the file exporter, one JSON span per line
+TRACING_SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "chatbot-api")
+
+_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+(\w+)", re.IGNORECASE)
+
+
+class _NoopSpan:
+    """Stands in for a span when tracing is off, so call sites need no checks."""
+
+    def set_attribute(self, key, value):
+        pass
+
+    def set_attributes(self, attributes):
+        pass
+
+    def record_exception(self, exception):
+        pass
+
+    def end(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+def _exporter():
+    if TRACING_EXPORTER == "otlp":
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        return OTLPSpanExporter()
+    if TRACING_EXPORTER == "file":
+        out = open(TRACING_FILE, "a", buffering=1)
+        return ConsoleSpanExporter(out=out, formatter=lambda span: span.to_json(indent=None) + "\n")
+    return ConsoleSpanExporter()
+
+
+def _init_tracer():
+    if not TRACING_ENABLED:
+        return None
+    if trace is None:
+        logger.warning("TRACING_ENABLED is set but opentelemetry-sdk is not installed; tracing is off")
+        return None
+    provider = TracerProvider(resource=Resource.create({"service.name": TRACING_SERVICE_NAME}))
+    provider.add_span_processor(BatchSpanProcessor(_exporter()))
+    trace.set_tracer_provider(provider)
+    return trace.get_tracer("chatbot")
+
+
+tracer = _init_tracer()
+
+
+# OpenTelemetry rejects None attribute values
+def _clean(attributes):
+    return {k: v for k, v in (attributes or {}).items() if v is not None}
+
+
+# Child span of the current span, made current for the with-block
+def span(name, attributes=None):
+    if tracer is None:
+        return NOOP_SPAN
+    return tracer.start_as_current_span(name, attributes=_clean(attributes))
+
+
+# Span whose lifetime is not a with-block (streams); the caller must end() it
+def start_span(name, attributes=None):
+    if tracer is None:
+        return NOOP_SPAN
+    return tracer.start_span(name, attributes=_clean(attributes))
+
+
+# Iterate a response stream with `parent` current during each step. Starlette runs the steps of a
+# sync stream in copies of the request context (and an async one in its own task), so a span
+# attached in one context could be neither seen nor detached in the next; here every step
+# attaches and detaches it within itself.
+def in_span(parent, generator):
+    if tracer is None:
+        return generator
+    return _steps_in_span(parent, generator)
+
+
+def ain_span(parent, generator):
+    if tracer is None:
+        return generator
+    return _asteps_in_span(parent, generator)
+
+
+def _steps_in_span(parent, generator):
+    try:
+        while True:
+            with trace.use_span(parent, end_on_exit=False):
+                try:
+                    item = next(generator)
+                except StopIteration:
+                    return
+            yield item
+    finally:
+        with trace.use_span(parent, end_on_exit=False):
+            generator.close()
+
+
+async def _asteps_in_span(parent, generator):
+    try:
+        while True:
+            with trace.use_span(parent, end_on_exit=False):
+                try:
+                    item = await generator.__anext__()
+                except StopAsyncIteration:
+                    return
+            yield item
+    finally:
+        with trace.use_span(parent, end_on_exit=False):
+            await generator.aclose()
+
+
+# Add attributes to the current span
+def annotate(attributes):
+    if tracer is None:
+        return
+    trace.get_current_span().set_attributes(_clean(attributes))
+
+
+# Span for one SQL statement
+def db_span(query, attributes=None):
+    if tracer is None:
+        return NOOP_SPAN
+    operation = query.split(None, 1)[0].upper()
+    table = _TABLE.search(query)
+    return span(f"db.{operation.lower()}", {
+        "db.system": "mysql",
+        "db.operation": operation,
+        "db.sql.table": table.group(1) if table else None,
+        "db.statement": " ".join(query.split())[:300],
+        **(attributes or {}),
+    })
+
+
+def usage_attributes(usage):
+    if usage is None:
+        return {}
+    return {
+        "gen_ai.usage.input_tokens": getattr(usage, "prompt_tokens", None),
+        "gen_ai.usage.output_tokens": getattr(usage, "completion_tokens", None),
+    }
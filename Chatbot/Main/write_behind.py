@@ -0,0 +1,327 @@
+# write_behind.py
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from dotenv import load_dotenv
+from metrics import record_stage
+from storage import ConversationConflictError
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Write-Behind Settings
+WRITE_BEHIND_ENABLED = os.getenv("WRITE_BEHIND_ENABLED", "false").lower() in ("1", "true", "yes")
+WRITE_BEHIND_QUEUE_SIZE = int(os.getenv("WRITE_BEHIND_QUEUE_SIZE", "10000"))  # unflushed turns before callers fall back to direct writes
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "200"))    # turns per flush transaction
+WRITE_BEHIND_FLUSH_INTERVAL = float(os.getenv("WRITE_BEHIND_FLUSH_INTERVAL", "0.05"))  # max seconds a turn waits for batch-mates
+WRITE_BEHIND_MAX_RETRIES = int(os.getenv("WRITE_BEHIND_MAX_RETRIES", "5"))
+WRITE_BEHIND_SPOOL = os.getenv("WRITE_BEHIND_SPOOL", "")  # optional local spool file; unflushed turns are replayed on start
+WRITE_BEHIND_FSYNC = os.getenv("WRITE_BEHIND_FSYNC", "false").lower() in ("1", "true", "yes")
+WRITE_BEHIND_MAX_DEAD = int(os.getenv("WRITE_BEHIND_MAX_DEAD", "1000"))  # dropped turns kept in the spool for the next start
+WRITE_BEHIND_SPOOL_COMPACT_EVERY = 10000  # acknowledged turns between spool rewrites
+
+
+class Spool:
+    """Append-only JSON-lines log of queued turns plus ack records.
+
+    On start, turns without an ack are replayed. The file is rewritten with
+    only the outstanding turns when the queue drains or enough acks pile up.
+    """
+
+    def __init__(self, path, fsync=WRITE_BEHIND_FSYNC):
+        self.path = path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._file = None
+        self._acked_since_compact = 0
+
+    def replay(self):
+        entries = OrderedDict()
+        if os.path.exists(self.path):
+            with open(self.path) as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # torn final line after a crash
+                    if "ack" in record:
+                        for seq in record["ack"]:
+                            entries.pop(seq, None)
+                    else:
+                        entries[record["seq"]] = record["turn"]
+        self._file = open(self.path, "a")
+        return entries
+
+    def _write(self, record):
+        self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+        if self.fsync:
+            os.fsync(self._file.fileno())
+
+    def append(self, seq, turn):
+        with self._lock:
+            self._write({"seq": seq, "turn": turn})
+
+    def ack(self, seqs, outstanding):
+        with self._lock:
+            self._write({"ack": seqs})
+            self._acked_since_compact += len(seqs)
+            if not outstanding or self._acked_since_compact >= WRITE_BEHIND_SPOOL_COMPACT_EVERY:
+                self._compact(outstanding)
+
+    # Rewrite the spool with only the outstanding turns (atomic rename)
+    def _compact(self, outstanding):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for seq, turn in outstanding:
+                f.write(json.dumps({"seq": seq, "turn": turn}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self._file.close()
+        os.replace(tmp_path, self.path)
+        self._file = open(self.path, "a")
+        self._acked_since_compact = 0
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+class WriteBehindQueue:
+    """Bounded in-process queue of chat turns, flushed by a background thread in batches.
+
+    Each turn is a JSON-serializable list whose first element is the conv_id.
+    ``flush(turns)`` must persist a batch in one transaction. Until a turn is
+    flushed it stays in a per-conversation pending index so reads can merge
+    it (read-your-writes). A failed batch is retried with backoff, then turn by
+    turn; a turn that keeps failing is dropped from memory but stays in the
+    spool for the next start (up to ``max_dead`` of them). A turn whose
+    message_no another writer already took (ConversationConflictError) is
+    discarded without retries. ``on_drop(turn)`` is called for every turn that
+    is dropped or discarded, so caches that already hold it can forget it.
+    """
+
+    def __init__(self, max_size=WRITE_BEHIND_QUEUE_SIZE, batch_size=WRITE_BEHIND_BATCH_SIZE,
+                 flush_interval=WRITE_BEHIND_FLUSH_INTERVAL, max_retries=WRITE_BEHIND_MAX_RETRIES, spool_path=WRITE_BEHIND_SPOOL,
+                 max_dead=WRITE_BEHIND_MAX_DEAD):
+        self.max_size = max_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.spool = Spool(spool_path) if spool_path else None
+        self.max_dead = max_dead
+        self._flush = None
+        self._on_drop = None
+        self._queue = deque()            # (seq, turn) waiting for the worker
+        self._pending = OrderedDict()    # seq -> turn, queued or being flushed
+        self._by_conversation = {}       # conv_id -> [seq, ...]
+        self._dead = OrderedDict()       # seq -> turn that kept failing; kept in the spool only
+        self._cond = threading.Condition()
+        self._seq = 0
+        self._thread = None
+        self._stopping = False
+
+        # Stats
+        self.enqueued = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.batches = 0
+        self.failures = 0
+        self.dropped = 0
+        self.conflicts = 0
+        self.replayed = 0
+
+    @property
+    def running(self):
+        return self._thread is not None and not self._stopping
+
+    def start(self, flush, on_drop=None):
+        self._flush = flush
+        self._on_drop = on_drop
+        if self.spool is not None:
+            with self._cond:
+                for seq, turn in self.spool.replay().items():
+                    self._track(seq, turn)
+                    self._seq = max(self._seq, seq)
+                    self.replayed += 1
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    # Flush everything still queued, then stop the worker
+    def stop(self, timeout=30):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+        if self.spool is not None:
+            self.spool.close()
+
+    def _track(self, seq, turn):
+        self._queue.append((seq, turn))
+        self._pending[seq] = turn
+        self._by_conversation.setdefault(turn[0], []).append(seq)
+
+    def _untrack(self, seqs):
+        for seq in seqs:
+            turn = self._pending.pop(seq, None)
+            if turn is None:
+                continue
+            conv_seqs = self._by_conversation.get(turn[0])
+            if conv_seqs is not None:
+                conv_seqs.remove(seq)
+                if not conv_seqs:
+                    del self._by_conversation[turn[0]]
+
+    # Queue a turn; returns False when full so the caller can write it directly
+    def submit(self, turn):
+        turn = list(turn)
+        with self._cond:
+            if not self.running or len(self._pending) >= self.max_size:
+                self.rejected += 1
+                return False
+            self._seq += 1
+            seq = self._seq
+            # Spool before the turn becomes visible to the worker, so an ack can never precede its record
+            if self.spool is not None:
+                self.spool.append(seq, turn)
+            self._track(seq, turn)
+            self.enqueued += 1
+            self._cond.notify()
+        return True
+
+    # Unflushed turns of a conversation, oldest first
+    def pending_turns(self, conv_id):
+        with self._cond:
+            if not self._by_conversation:
+                return []
+            return [self._pending[seq] for seq in self._by_conversation.get(conv_id, ())]
+
+    # (message_id, role, message) rows of a conversation's unflushed turns.
+    # Turn layout: [conv_id, user_id, message_count, user_message_id, user_message, assistant_message_id, assistant_message, ...]
+    def pending_messages(self, conv_id):
+        rows = []
+        for turn in self.pending_turns(conv_id):
+            rows.append((turn[3], "user", turn[4]))
+            rows.append((turn[5], "assistant", turn[6]))
+        return rows
+
+    def _next_batch(self):
+        with self._cond:
+            while not self._queue and not self._stopping:
+                self._cond.wait()
+            if not self._queue:
+                return None
+            # Give a lone turn a moment to collect batch-mates
+            deadline = time.monotonic() + self.flush_interval
+            while len(self._queue) < self.batch_size and not self._stopping:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return [self._queue.popleft() for _ in range(min(self.batch_size, len(self._queue)))]
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                return
+            try:
+                if self._flush_with_retries(batch):
+                    continue
+            except ConversationConflictError:
+                pass
+            # Isolate the bad turn(s) so one poison turn cannot block the rest
+            for entry in batch:
+                try:
+                    if not self._flush_with_retries([entry]):
+                        self._drop(entry)
+                except ConversationConflictError as e:
+                    self._reject(entry, e)
+
+    def _flush_with_retries(self, batch):
+        for attempt in range(self.max_retries + 1):
+            start = time.monotonic()
+            try:
+                self._flush([turn for _, turn in batch])
+            except ConversationConflictError:
+                # Another writer took the message_no; retrying cannot succeed
+                raise
+            except Exception as e:
+                with self._cond:
+                    self.failures += 1
+                logger.warning("Write-behind flush of %d turn(s) failed (attempt %d): %s", len(batch), attempt + 1, e)
+                if self._stopping and attempt >= 1:
+                    return False
+                time.sleep(min(0.1 * (2 ** attempt), 5.0))
+                continue
+            record_stage("db_flush", time.monotonic() - start)
+            self._acknowledge(batch)
+            return True
+        return False
+
+    def _acknowledge(self, batch, flushed=True):
+        seqs = [seq for seq, _ in batch]
+        with self._cond:
+            self._untrack(seqs)
+            if flushed:
+                self.flushed += len(seqs)
+                self.batches += 1
+            else:
+                self.conflicts += len(seqs)
+            outstanding = list(self._pending.items()) + list(self._dead.items())
+            if self.spool is not None:
+                self.spool.ack(seqs, outstanding)
+
+    def _drop(self, entry):
+        seq, turn = entry
+        logger.error("Write-behind dropped turn for conversation %s after retries%s", turn[0],
+                     "; it stays in the spool" if self.spool is not None else "")
+        with self._cond:
+            self._untrack([seq])
+            # Only the spool can bring the turn back; beyond max_dead the oldest go at the next compaction
+            if self.spool is not None:
+                self._dead[seq] = turn
+                while len(self._dead) > self.max_dead:
+                    self._dead.popitem(last=False)
+            self.dropped += 1
+        if self._on_drop is not None:
+            self._on_drop(turn)
+
+    # A conflicting turn is final: acknowledge it so the spool does not replay it
+    def _reject(self, entry, error):
+        logger.warning("Write-behind discarded turn for conversation %s: %s", entry[1][0], error)
+        self._acknowledge([entry], flushed=False)
+        if self._on_drop is not None:
+            self._on_drop(entry[1])
+
+    def stats(self):
+        with self._cond:
+            return {
+                "enabled": self.running,
+                "queued": len(self._queue),
+                "unflushed": len(self._pending),
+                "max_size": self.max_size,
+                "enqueued": self.enqueued,
+                "rejected": self.rejected,
+                "flushed": self.flushed,
+                "batches": self.batches,
+                "avg_batch_size": (self.flushed / self.batches) if self.batches else 0.0,
+                "failures": self.failures,
+                "dropped": self.dropped,
+                "dead": len(self._dead),
+                "conflicts": self.conflicts,
+                "replayed": self.replayed,
+                "spool": self.spool.path if self.spool is not None else None,
+            }
+
+
+write_behind = WriteBehindQueue()
@@ -6,22 +6,15 @@ import os
 from datetime import datetime
 from dotenv import load_dotenv
 import mysql.connector
-import string
-import random
 
 # Load environment variables
 load_dotenv()
 
 
-def generate_random_id():
-    chars = string.ascii_lowercase + string.digits
-    parts = [8, 4]
-    result = '-'.join(''.join(random.choices(chars, k=p)) for p in parts)
-    return result
-
-
 # Add the project root to path for imports
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..'))
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'Chatbot', 'Main'))
+from ids import new_id  # noqa: E402
 
 
 def db_connection():
@@ -212,7 +205,7 @@ with tab1:
         # print("type of user input: ", type(user_input))
         
         # Generate message ID
-        message_id = generate_random_id()
+        message_id = new_id()
         message_count = len([msg for msg in st.session_state.messages if msg["role"] == "user"])
         
         with st.spinner("🤖 Thinking..."):
@@ -250,11 +243,12 @@ with tab1:
                     # Import and use chatbot directly
                     from Chatbot.Main.Chatbot import main as chatbot_main
                     
-                    bot_response = chatbot_main(user_input, st.session_state.conversation_id)
+                    result = chatbot_main(user_input, st.session_state.conversation_id)
+                    bot_response = result.message if result.ok else f"Chatbot Error: {result.error}"
                     st.session_state.messages.append({"role": "assistant", "content": bot_response})
                     
-                    if not st.session_state.conversation_id:
-                        st.session_state.conversation_id = generate_random_id()
+                    if result.ok:
+                        st.session_state.conversation_id = result.conversation_id
                 
                 except Exception as e:
                     error_msg = f"Chatbot Error: {str(e)}"
@@ -293,7 +287,8 @@ with tab1:
                     try:
                         from Chatbot.Main.Chatbot import main as chatbot_main
                         
-                        direct_response = chatbot_main(user_input, st.session_state.conversation_id)
+                        result = chatbot_main(user_input, st.session_state.conversation_id)
+                        direct_response = result.message if result.ok else f"Chatbot Error: {result.error}"
                         st.success("✅ Direct Success")
                         st.write(direct_response)
                     except Exception as e:
@@ -331,7 +326,7 @@ with tab2:
         test_user_id = st.number_input("Test User ID", value=1)
     
     with col2:
-        test_message_id = st.text_input("Message ID", generate_random_id())
+        test_message_id = st.text_input("Message ID", new_id())
         test_conv_id = st.text_input("Conversation ID (optional)", "")
     
     if st.button("Test POST /chat-message"):
@@ -366,11 +361,19 @@ with tab2:
     if st.button("Test GET /get-conversation-history"):
         if history_conv_id:
             try:
-                response = requests.get(f"{api_base_url}/get-conversation-history/{history_conv_id}")
+                # The endpoint returns one page at a time; follow next_after_id to the last page
+                history_data, after_id = [], 0
+                while after_id is not None:
+                    response = requests.get(f"{api_base_url}/get-conversation-history/{history_conv_id}",
+                                            params={"after_id": after_id})
+                    if response.status_code != 200:
+                        break
+                    page = response.json()
+                    history_data.extend(page["messages"])
+                    after_id = page["next_after_id"]
                 
                 if response.status_code == 200:
-                    st.success(f"✅ Status: {response.status_code}")
-                    history_data = response
+                    st.success(f"✅ Status: {response.status_code} ({len(history_data)} messages)")
                     for msg in history_data:
                         st.text(msg)
                 else:
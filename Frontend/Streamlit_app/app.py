@@ -1,22 +1,51 @@
 import os
-import time
+import sys
 import json
-import string
-import random
 import requests
 import streamlit as st
 
-
-def generate_random_id() -> str:
-    chars = string.ascii_lowercase + string.digits
-    parts = [8, 4]
-    return '-'.join(''.join(random.choices(chars, k=p)) for p in parts)
-
-
-def stream_text(text: str):
-    for ch in text:
-        yield ch
-        time.sleep(0.008)
+# Shared time-ordered ID generator (stdlib only)
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', '..', 'Chatbot', 'Main'))
+from ids import new_id  # noqa: E402
+
+
+def stream_chat(url: str, params: dict, result: dict):
+    """Yield assistant tokens from the backend's Server-Sent Events stream.
+
+    The conversation ID from the stream's `meta` event is stored in `result`.
+    """
+    with requests.post(url, params=params, stream=True, timeout=60) as resp:
+        if resp.status_code != 200:
+            raise RuntimeError(f"API Error: {resp.status_code} - {resp.text}")
+
+        event = "message"
+        for line in resp.iter_lines(decode_unicode=True):
+            if not line:
+                event = "message"
+            elif line.startswith("event:"):
+                event = line[len("event:"):].strip()
+            elif line.startswith("data:"):
+                data = json.loads(line[len("data:"):].strip())
+                if event == "meta":
+                    result["conversation_id"] = data.get("conversation_id")
+                elif event == "error":
+                    raise RuntimeError(f"API Error: {data.get('error')}")
+                elif event == "message":
+                    yield data.get("token", "")
+
+
+def load_conversation(api_base_url: str, conversation_id: str):
+    """Replace the chat with a stored conversation (its history, page by page)."""
+    messages, after_id = [], 0
+    while after_id is not None:
+        resp = requests.get(f"{api_base_url}/get-conversation-history/{conversation_id}",
+                            params={"after_id": after_id, "limit": 1000}, timeout=30)
+        resp.raise_for_status()
+        page = resp.json()
+        messages.extend({"role": m["role"], "content": m["message"]} for m in page["messages"])
+        after_id = page["next_after_id"]
+    st.session_state.messages = messages
+    st.session_state.conversation_id = conversation_id
 
 
 # Basic page config
@@ -52,6 +81,22 @@ with st.sidebar:
     st.write("")
     st.text(f"Conversation: {st.session_state.conversation_id or '-'}")
 
+    st.subheader("Recent chats")
+    if st.button("New chat", use_container_width=True):
+        st.session_state.messages = []
+        st.session_state.conversation_id = None
+    base_url = st.session_state.api_base_url.rstrip("/")
+    try:
+        # One indexed query on the backend: the user's most recently active conversations
+        resp = requests.get(f"{base_url}/users/{st.session_state.user_id}/conversations", params={"limit": 10}, timeout=10)
+        resp.raise_for_status()
+        for conversation in resp.json()["conversations"]:
+            label = f"{conversation['chat_name']} · {conversation['message_count']} messages · {(conversation['updated_at'] or '')[:16]}"
+            if st.button(label, key=conversation["conversation_id"], use_container_width=True):
+                load_conversation(base_url, conversation["conversation_id"])
+    except Exception as e:
+        st.caption(f"Recent chats unavailable: {e}")
+
 
 # Render history
 for message in st.session_state.messages:
@@ -70,7 +115,7 @@ if user_input:
 
     # Prepare backend call
     api_base_url = st.session_state.api_base_url.rstrip("/")
-    message_id = generate_random_id()
+    message_id = new_id()
     message_count = len([m for m in st.session_state.messages if m["role"] == "user"])  # aligns with backend expectation
     conversation_id = st.session_state.conversation_id or ""
 
@@ -78,33 +123,23 @@ if user_input:
     with st.chat_message("assistant"):
         placeholder = st.empty()
         try:
-            resp = requests.post(
-                f"{api_base_url}/chat-message",
-                params={
+            result = {}
+            bot_message = placeholder.write_stream(stream_chat(
+                f"{api_base_url}/chat-message/stream",
+                {
                     "message": user_input,
                     "user_id": st.session_state.user_id,
                     "message_id": message_id,
                     "message_count": message_count,
                     "conversation_id": conversation_id,
                 },
-                timeout=60,
-            )
-
-            if resp.status_code != 200:
-                error_text = f"API Error: {resp.status_code} - {resp.text}"
-                placeholder.error(error_text)
-                st.session_state.messages.append({"role": "assistant", "content": error_text})
-            else:
-                data = resp.json()
-                bot_message = data.get("message", "")
-                st.session_state.conversation_id = data.get("conversation_id") or st.session_state.conversation_id
-
-                # Stream the response for a real-time feel
-                placeholder.write_stream(stream_text(bot_message))
-                st.session_state.messages.append({"role": "assistant", "content": bot_message})
+                result,
+            ))
+            st.session_state.conversation_id = result.get("conversation_id") or st.session_state.conversation_id
+            st.session_state.messages.append({"role": "assistant", "content": bot_message})
 
         except Exception as e:
-            error_text = f"Connection Error: {str(e)}"
+            error_text = str(e) if isinstance(e, RuntimeError) else f"Connection Error: {str(e)}"
             placeholder.error(error_text)
             st.session_state.messages.append({"role": "assistant", "content": error_text})
 